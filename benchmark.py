@@ -0,0 +1,536 @@
+import argparse
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from mcmv.animation_cache import AnimationCache
+from mcmv.armature_formatter import ArmatureFormatter, MinecraftModelCreator
+from mcmv import file_writer
+from mcmv.armature_objects import ArmatureModel, ArmatureAnimation, ArmatureFrame, ArmaturePose, Joint, Skeleton
+from mcmv.converter import Converter, RetargetPlan, IncrementalFK
+from mcmv.export_java import JavaModelExporter
+from mcmv.frame_evaluator import FrameEvaluator, PoseCache
+from mcmv.import_file import BvhFileLoader
+from mcmv.math_objects import Vector3, Quaternion, Euler
+from mcmv.quantized_animation import QuantizedFrameArray
+
+# the bundled animations, loaded the same way as in config/main.json
+BVH_FILES = [
+    ('data/dance.bvh', 0.1, Quaternion().set_from_euler(Euler('xyz', -90.0, 0.0, 0.0))),
+    ('data/dino.bvh', 1.0, Quaternion().set_from_euler(Euler('xyz', 90.0, 180.0, 0.0))),
+]
+
+
+def best_time(function, repeat: int) -> float:
+    """Return the fastest time out of repeat runs of function (seconds)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_bvh_decode(repeat: int):
+    """Time decoding every frame line of the bundled animations into ArmatureFrames."""
+    for path, scale, face_north in BVH_FILES:
+        file_loader = BvhFileLoader(path, scale=scale, face_north=face_north)
+        file_loader.get_model()
+        with file_loader.get_motion_index() as motion_index:
+            lines = motion_index[:]
+
+        def decode():
+            for line in lines:
+                file_loader.get_frame_from_line(line)
+
+        seconds = best_time(decode, repeat)
+        print('{}: {} frames x {} joints, {:.1f} ms ({:.1f} us/frame)'.format(
+            path, len(lines), len(file_loader.joint_name_list), seconds * 1000, seconds / len(lines) * 1000000))
+
+
+def get_allocated_bytes(function) -> int:
+    """Return the number of bytes still allocated by function's return value (and anything it keeps alive)."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_math(repeat: int):
+    """Time the math_objects operations used once per joint per frame, and measure how much memory
+    their results take up."""
+    count = 100000
+    v = Vector3(0.3, -1.2, 2.5)
+    w = Vector3(-0.7, 0.4, 1.1)
+    q = Quaternion().set_from_euler(Euler('xyz', 30.0, -45.0, 60.0))
+    p = Quaternion().set_from_euler(Euler('zyx', -10.0, 20.0, 95.0))
+    e = Euler('zyx', 10.0, 20.0, 30.0)
+
+    def in_place_add():
+        u = v.copy()
+        u += w
+        return u
+
+    def in_place_rotate():
+        u = v.copy()
+        u.rotate_by_quaternion(q)
+        return u
+
+    operations = [
+        ('Vector3()', lambda: Vector3(0.3, -1.2, 2.5)),
+        ('Vector3 + Vector3', lambda: v + w),
+        ('Vector3.copy() += Vector3', in_place_add),
+        ('Vector3[i]', lambda: v[1]),
+        ('Vector3.magnitude()', v.magnitude),
+        ('Vector3.rotated_by_quaternion()', lambda: v.rotated_by_quaternion(q)),
+        ('Vector3.copy().rotate_by_quaternion()', in_place_rotate),
+        ('Quaternion.parented()', lambda: q.parented(p)),
+        ('Quaternion.conjugate()', q.conjugate),
+        ('Quaternion.set_from_euler()', lambda: Quaternion().set_from_euler(e)),
+        ('Quaternion.between_vectors()', lambda: Quaternion().between_vectors(v, w)),
+        ('Euler.set_from_quaternion()', lambda: Euler('zyx').set_from_quaternion(q)),
+    ]
+
+    for name, operation in operations:
+        def run():
+            for _ in range(count):
+                operation()
+
+        seconds = best_time(run, repeat)
+        allocated = get_allocated_bytes(lambda: [operation() for _ in range(count)]) - sys.getsizeof([None] * count)
+        print('{:40} {:8.3f} us/op {:8.1f} bytes/op'.format(name, seconds / count * 1000000, allocated / count))
+
+
+def get_random_animation(joint_count: int, frame_count: int) -> tuple[ArmatureModel, ArmatureAnimation]:
+    """Return a model with a random tree of joints, and an animation with random offsets and rotations."""
+    rng = random.Random(0)
+
+    model = ArmatureModel('benchmark')
+    model.add_joint(Joint('mcmv_root_benchmark'))
+    joint_names = [model.root.name]
+    for i in range(joint_count):
+        new_joint = Joint('joint_' + str(i))
+        new_joint.initial_offset = Vector3(rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, 1))
+        model.add_joint(new_joint, rng.choice(joint_names))
+        joint_names.append(new_joint.name)
+
+    animation = ArmatureAnimation(20)
+    for _ in range(frame_count):
+        new_frame = ArmatureFrame()
+        for joint_name in joint_names[1:]:
+            rotation = Quaternion().set_from_euler(Euler('xyz', rng.uniform(-180, 180), rng.uniform(-90, 90), rng.uniform(-180, 180)))
+            new_frame.joint_channels[joint_name] = (Vector3(rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, 1)), rotation)
+        animation.frames.append(new_frame)
+
+    return model, animation
+
+
+def benchmark_fk(repeat: int):
+    """Time computing the global transformation of every joint in every frame, one frame at a time and for
+    the whole animation at once."""
+    clips = []
+    for path, scale, face_north in BVH_FILES:
+        clips.append((path, *BvhFileLoader(path, scale=scale, face_north=face_north).load()))
+    clips.append(('random (60 joints)', *get_random_animation(60, 5000)))
+
+    for name, model, animation in clips:
+        def per_frame():
+            for frame in animation.frames:
+                ArmatureFormatter.set_frame(model, frame)
+                ArmatureFormatter.get_model_global(model)
+
+        def whole_animation():
+            ArmatureFormatter.get_animation_global(model, animation)
+
+        per_frame_seconds = best_time(per_frame, repeat)
+        whole_animation_seconds = best_time(whole_animation, repeat)
+        print('{}: {} frames x {} joints, per frame {:.1f} ms, whole animation {:.1f} ms'.format(
+            name, len(animation.frames), len(model.joints), per_frame_seconds * 1000, whole_animation_seconds * 1000))
+
+
+def benchmark_retarget(repeat: int):
+    """Time retargeting every frame of the bundled animations onto models created from them, compiling the
+    retarget plan for every frame (like Converter.set_minecraft_transformation) and only once."""
+    for path, scale, face_north in BVH_FILES:
+        model, animation = BvhFileLoader(path, scale=scale, face_north=face_north).load()
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        minecraft_model = m.minecraft_model
+
+        frame_globals = []
+        for frame in animation.frames:
+            ArmatureFormatter.set_frame(model, frame)
+            frame_globals.append(ArmatureFormatter.get_model_global_lists(model))
+
+        def compiled_every_frame():
+            for frame_global in frame_globals:
+                RetargetPlan(minecraft_model, model, None).apply(*frame_global)
+
+        def compiled_once():
+            retarget_plan = RetargetPlan(minecraft_model, model, None)
+            for frame_global in frame_globals:
+                retarget_plan.apply(*frame_global)
+
+        every_frame_seconds = best_time(compiled_every_frame, repeat)
+        once_seconds = best_time(compiled_once, repeat)
+        print('{}: {} frames x {} bones, compiled every frame {:.1f} ms, compiled once {:.1f} ms'.format(
+            path, len(frame_globals), len(minecraft_model.bones), every_frame_seconds * 1000, once_seconds * 1000))
+
+
+def benchmark_evaluate(repeat: int):
+    """Time evaluating every frame of the bundled animations with a FrameEvaluator, in this process and in pools of
+    processes. Pools are never bigger than the number of CPUs, so they only help on machines with several."""
+    print('{} CPUs'.format(os.cpu_count()))
+    for path, scale, face_north in BVH_FILES:
+        model, animation = BvhFileLoader(path, scale=scale, face_north=face_north).load()
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        retarget_plan = RetargetPlan(m.minecraft_model, model, None)
+
+        times = []
+        for jobs in (1, 2, 4):
+            frame_evaluator = FrameEvaluator(retarget_plan, jobs)
+            seconds = best_time(lambda: list(frame_evaluator.evaluate_animation(animation, with_global=True)), repeat)
+            times.append('{} jobs {:.1f} ms'.format(jobs, seconds * 1000))
+        print('{}: {} frames x {} bones, {}'.format(path, len(animation), len(m.minecraft_model.bones), ', '.join(times)))
+
+
+def benchmark_pose_cache(repeat: int):
+    """Time evaluating every frame of the bundled animations without a PoseCache, when the poses are added to the
+    cache (the first export of an animation) and when they are read from it (every export after that), and the same
+    for poses baked into an AnimationCache on disk (the first run and every run after that)."""
+    for path, scale, face_north in BVH_FILES:
+        model, animation = BvhFileLoader(path, scale=scale, face_north=face_north).load()
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        retarget_plan = RetargetPlan(m.minecraft_model, model, None)
+
+        with tempfile.TemporaryDirectory() as directory:
+            pose_cache = PoseCache()
+            baked_pose_cache = PoseCache(store=AnimationCache(directory))
+            baked_pose_cache.set_store_key(animation, model, m.minecraft_model, None, 'benchmark')
+
+            def evaluate(cache: PoseCache = None):
+                for _ in FrameEvaluator(retarget_plan, pose_cache=cache).evaluate_animation(animation, with_global=True):
+                    pass
+
+            def miss(cache: PoseCache):
+                # only the poses in memory are removed, so baked poses are read from the store
+                cache.clear()
+                evaluate(cache)
+
+            uncached_seconds = best_time(evaluate, repeat)
+            miss_seconds = best_time(lambda: miss(pose_cache), repeat)
+            hit_seconds = best_time(lambda: evaluate(pose_cache), repeat)
+            # the store is still empty, so this evaluates and bakes the poses
+            bake_seconds = best_time(lambda: miss(baked_pose_cache), 1)
+            store_hit_seconds = best_time(lambda: miss(baked_pose_cache), repeat)
+            baked_size = os.path.getsize(os.path.join(directory, 'benchmark.npy'))
+
+        print('{}: {} frames x {} bones, without cache {:.1f} ms, added to cache {:.1f} ms, read from cache {:.2f} ms, {:.1f} MB cached'.format(
+            path, len(animation), len(m.minecraft_model.bones), uncached_seconds * 1000, miss_seconds * 1000, hit_seconds * 1000,
+            pose_cache.size / 1024 / 1024))
+        print('{}: baked {:.1f} ms, read from store {:.1f} ms, {:.1f} MB baked'.format(
+            path, bake_seconds * 1000, store_hit_seconds * 1000, baked_size / 1024 / 1024))
+
+
+def benchmark_incremental(repeat: int):
+    """Time evaluating every frame with and without IncrementalFK, on the bundled animations and on a random
+    animation where only the quarter of the joints furthest from the root move (like the hands of a character that
+    is standing still), and show how many evaluations were skipped and the largest error in the global translation
+    of any bone."""
+    clips = []
+    for path, scale, face_north in BVH_FILES:
+        clips.append((path, *BvhFileLoader(path, scale=scale, face_north=face_north).load()))
+    model, animation = get_random_animation(60, 2000)
+    joint_names = model.get_skeleton().names
+    for frame in animation.frames[1:]:
+        for joint_name in joint_names[1:len(joint_names) * 3 // 4]:
+            frame.joint_channels[joint_name] = animation.frames[0].joint_channels[joint_name]
+    clips.append(('random (60 joints, 3/4 static)', model, animation))
+
+    for name, model, animation in clips:
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        retarget_plan = RetargetPlan(m.minecraft_model, model, None)
+
+        def evaluate(incremental: IncrementalFK = None) -> list[list[Vector3]]:
+            frame_evaluator = FrameEvaluator(retarget_plan, incremental=incremental)
+            return [global_translations for _, (global_translations, _) in frame_evaluator.evaluate_animation(animation, with_global=True)]
+
+        full_seconds = best_time(evaluate, repeat)
+        full_translations = evaluate()
+        results = ['full {:.1f} ms'.format(full_seconds * 1000)]
+        for epsilon in (0.0, 0.001, 0.01):
+            seconds = best_time(lambda: evaluate(IncrementalFK(epsilon)), repeat)
+            incremental = IncrementalFK(epsilon)
+            error = max(max(abs(a.x - b.x), abs(a.y - b.y), abs(a.z - b.z))
+                        for frame_translations, full_frame_translations in zip(evaluate(incremental), full_translations)
+                        for a, b in zip(frame_translations, full_frame_translations))
+            results.append('epsilon {} {:.1f} ms ({:.0%} skipped, error {:.2g})'.format(
+                epsilon, seconds * 1000, incremental.skipped / (incremental.evaluated + incremental.skipped), error))
+        print('{}: {} frames x {} joints, {}'.format(name, len(animation), len(model.joints), ', '.join(results)))
+
+
+def benchmark_memory(repeat: int):
+    """Measure the memory taken up by the bundled animations with their frames kept as objects and in an
+    ArmatureFrameArray (compact), and time evaluating every frame of both."""
+    for path, scale, face_north in BVH_FILES:
+        file_loader = BvhFileLoader(path, scale=scale, face_north=face_north)
+        model, animation = file_loader.load()
+        _, compact_animation = file_loader.load(compact=True)
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        retarget_plan = RetargetPlan(m.minecraft_model, model, None)
+
+        object_bytes = get_allocated_bytes(lambda: file_loader.load()[1])
+        compact_bytes = get_allocated_bytes(lambda: file_loader.load(compact=True)[1])
+        range_bytes = get_allocated_bytes(lambda: compact_animation.get_frame_range(0, len(compact_animation) // 2))
+
+        def evaluate(evaluated_animation: ArmatureAnimation):
+            for _ in FrameEvaluator(retarget_plan).evaluate_animation(evaluated_animation, with_global=True):
+                pass
+
+        object_seconds = best_time(lambda: evaluate(animation), repeat)
+        compact_seconds = best_time(lambda: evaluate(compact_animation), repeat)
+        print('{}: {} frames x {} joints, objects {:.2f} MB, compact {:.2f} MB ({:.1f}x smaller), half as a range {} bytes'.format(
+            path, len(animation), len(model.joints), object_bytes / 1024 / 1024, compact_bytes / 1024 / 1024, object_bytes / compact_bytes, range_bytes))
+        print('{}: evaluated from objects {:.1f} ms, from compact {:.1f} ms'.format(path, object_seconds * 1000, compact_seconds * 1000))
+
+
+def benchmark_quantize(repeat: int):
+    """Measure the memory taken up by the bundled animations kept in an ArmatureFrameArray of float32 values and in
+    a QuantizedFrameArray with a few tolerances, time quantizing and decoding them, and show the largest error in the
+    stored offsets and rotations (which the tolerances are for) and in the global translation of any bone once every
+    frame has been evaluated (where the errors of every joint above it add up)."""
+    for path, scale, face_north in BVH_FILES:
+        model, animation = BvhFileLoader(path, scale=scale, face_north=face_north).load(compact=True)
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        retarget_plan = RetargetPlan(m.minecraft_model, model, None)
+
+        def evaluate(evaluated_animation: ArmatureAnimation) -> list[list[Vector3]]:
+            return [global_translations for _, (global_translations, _) in
+                    FrameEvaluator(retarget_plan).evaluate_animation(evaluated_animation, with_global=True)]
+
+        compact_translations = evaluate(animation)
+        print('{}: {} frames x {} joints, float32 {:.1f} KB'.format(path, len(animation), len(model.joints), animation.frames.values.nbytes / 1024))
+        for tolerance in (0.0001, 0.001):
+            quantized_frames = QuantizedFrameArray.from_frames(animation.frames, tolerance, tolerance)
+            quantized_animation = ArmatureAnimation(animation.fps)
+            quantized_animation.frames = quantized_frames
+
+            quantize_seconds = best_time(lambda: QuantizedFrameArray.from_frames(animation.frames, tolerance, tolerance), repeat)
+            decode_seconds = best_time(quantized_frames.get_values, repeat)
+            error = max(max(abs(a.x - b.x), abs(a.y - b.y), abs(a.z - b.z))
+                        for frame_translations, compact_frame_translations in zip(evaluate(quantized_animation), compact_translations)
+                        for a, b in zip(frame_translations, compact_frame_translations))
+            print('  tolerance {}: {:.1f} KB ({:.1f}x smaller), quantized in {:.1f} ms, decoded in {:.1f} ms, error in offsets {:.2g}, '
+                  'rotations {:.2g}, global bone translations {:.2g}'.format(tolerance, quantized_frames.nbytes / 1024, animation.frames.values.nbytes / quantized_frames.nbytes,
+                                                          quantize_seconds * 1000, decode_seconds * 1000, quantized_frames.position_error,
+                                                          quantized_frames.rotation_error, error))
+
+
+def benchmark_write(repeat: int):
+    """Time exporting the bundled animations as Java functions with the files written one at a time and by pools of
+    threads, on this drive and on a simulated slow one that waits 0.5 ms for every file opened and every write to it.
+    For comparison, the same files are also written on the slow drive with one write for each bone of each tick. The
+    poses are cached, so that only making and writing the commands is timed."""
+    latency = 0.0005
+
+    def write_slow_file(path: str, text: str, mode: str = 'w', encoding: str = None):
+        # opening the file, and writing all of it at once
+        time.sleep(2 * latency)
+        write_fast_file(path, text, mode, encoding)
+
+    write_fast_file = file_writer.write_file
+    for path, scale, face_north in BVH_FILES:
+        model, animation = BvhFileLoader(path, scale=scale, face_north=face_north).load()
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        pose_cache = PoseCache()
+
+        with tempfile.TemporaryDirectory() as directory:
+            function_directory = os.path.join(directory, 'datapacks', 'benchmark', 'data', 'benchmark', 'functions', 'animation')
+            os.makedirs(os.path.dirname(function_directory))
+
+            def export(write_threads: int):
+                j = JavaModelExporter(function_directory)
+                j.set_model_info(model, m.minecraft_model)
+                j.write_animation('benchmark', animation, pose_cache=pose_cache, write_threads=write_threads)
+
+            # add the poses to the cache
+            export(0)
+            tick_directory = os.path.join(function_directory, 'benchmark')
+            tick_lines = []
+            for tick in range(len(animation)):
+                with open(os.path.join(tick_directory, str(tick) + '.mcfunction')) as f:
+                    text = f.read()
+                # the commands of each bone start by teleporting it
+                tick_lines.append(['tp ' + bone_text for bone_text in text.split('tp ')[1:]])
+            bone_count = len(tick_lines[0])
+
+            def write_bones():
+                for tick, lines in enumerate(tick_lines):
+                    complete_path = os.path.join(tick_directory, str(tick) + '.mcfunction')
+                    time.sleep(latency)
+                    open(complete_path, 'w').close()
+                    time.sleep(latency)
+                    with open(complete_path, 'a') as g:
+                        for line in lines:
+                            time.sleep(latency)
+                            g.write(line)
+
+            times = []
+            for write_threads in (0, 1, 4, 8):
+                times.append('{} threads {:.1f} ms'.format(write_threads, best_time(lambda: export(write_threads), repeat) * 1000))
+            print('{}: {} ticks x {} bones, {}'.format(path, len(animation), bone_count, ', '.join(times)))
+
+            file_writer.write_file = write_slow_file
+            try:
+                times = []
+                for write_threads in (0, 1, 4, 8):
+                    times.append('{} threads {:.0f} ms'.format(write_threads, best_time(lambda: export(write_threads), 1) * 1000))
+            finally:
+                file_writer.write_file = write_fast_file
+            bones_seconds = best_time(write_bones, 1)
+            print('{}: slow drive, written a bone at a time {:.0f} ms, {}'.format(path, bones_seconds * 1000, ', '.join(times)))
+
+
+def benchmark_skip_unchanged(repeat: int):
+    """Count the commands in every tick of the Java functions, and time exporting them, with every bone moved on every
+    tick and with the commands left out for bones that haven't changed (exactly, and within 0.01 blocks and 1 degree),
+    on the bundled animations and on a random animation where three quarters of the joints stand still. The poses are
+    cached, so that only making and writing the commands is timed."""
+    clips = []
+    for path, scale, face_north in BVH_FILES:
+        clips.append((path, *BvhFileLoader(path, scale=scale, face_north=face_north).load()))
+    model, animation = get_random_animation(60, 500)
+    joint_names = model.get_skeleton().names
+    for frame in animation.frames[1:]:
+        for joint_name in joint_names[1:len(joint_names) * 3 // 4]:
+            frame.joint_channels[joint_name] = animation.frames[0].joint_channels[joint_name]
+    clips.append(('random (60 joints, 3/4 static)', model, animation))
+
+    for name, model, animation in clips:
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        pose_cache = PoseCache()
+
+        with tempfile.TemporaryDirectory() as directory:
+            function_directory = os.path.join(directory, 'datapacks', 'benchmark', 'data', 'benchmark', 'functions', 'animation')
+            os.makedirs(os.path.dirname(function_directory))
+
+            def export(tolerances: tuple[float, float]):
+                j = JavaModelExporter(function_directory)
+                j.set_model_info(model, m.minecraft_model)
+                j.write_animation('benchmark', animation, pose_cache=pose_cache, position_tolerance=tolerances[0], rotation_tolerance=tolerances[1])
+
+            def count_commands() -> int:
+                command_count = 0
+                for tick in range(len(animation)):
+                    with open(os.path.join(function_directory, 'benchmark', str(tick) + '.mcfunction')) as f:
+                        command_count += len(f.read().splitlines())
+                return command_count
+
+            # add the poses to the cache
+            export((None, None))
+            results = []
+            for tolerances in ((None, None), (0.0, 0.0), (0.01, 1.0)):
+                seconds = best_time(lambda: export(tolerances), repeat)
+                results.append('tolerances {} {:.1f} commands/tick in {:.1f} ms'.format(
+                    tolerances, count_commands() / len(animation), seconds * 1000))
+        print('{}: {} ticks x {} bones, {}'.format(name, len(animation), len(m.minecraft_model.bones), ', '.join(results)))
+
+
+def get_chain_animation(joint_count: int, frame_count: int) -> tuple[ArmatureModel, ArmatureAnimation]:
+    """Return a model that is a single chain of joints (like a tail or a rope), and an animation that bends it."""
+    model = ArmatureModel('chain')
+    model.add_joint(Joint('mcmv_root_chain'))
+    parent_name = model.root.name
+    for i in range(joint_count):
+        new_joint = Joint('segment_' + str(i))
+        new_joint.initial_offset = Vector3(0.0, 0.1, 0.0)
+        model.add_joint(new_joint, parent_name)
+        parent_name = new_joint.name
+
+    animation = ArmatureAnimation(20)
+    for frame_number in range(frame_count):
+        new_frame = ArmatureFrame()
+        rotation = Quaternion().set_from_euler(Euler('xyz', frame_number * 0.1, 0.0, 0.05))
+        for i in range(joint_count):
+            new_frame.joint_channels['segment_' + str(i)] = (Vector3(0.0, 0.1, 0.0), rotation)
+        animation.frames.append(new_frame)
+
+    return model, animation
+
+
+def benchmark_deep(repeat: int):
+    """Time every traversal of a model on chains of increasing length, which would be far deeper than the
+    recursion limit if they were recursive."""
+    for joint_count in (1000, 4000, 16000):
+        model, animation = get_chain_animation(joint_count, 10)
+        m = MinecraftModelCreator()
+        m.create_bones(model)
+        minecraft_model = m.minecraft_model
+        ArmatureFormatter.set_frame(model, animation.frames[-1])
+
+        def create_bones():
+            MinecraftModelCreator().create_bones(model)
+
+        def retarget():
+            RetargetPlan(minecraft_model, model, None).apply(*ArmatureFormatter.get_model_global_lists(model))
+
+        operations = [
+            ('ArmatureModel.copy', model.copy),
+            ('ArmaturePose', lambda: ArmaturePose(model)),
+            ('pickle ArmatureModel', lambda: pickle.loads(pickle.dumps(model))),
+            ('compile Skeleton', lambda: Skeleton(model.root)),
+            ('create_bones', create_bones),
+            ('get_model_global', lambda: ArmatureFormatter.get_model_global(model)),
+            ('retarget', retarget),
+            ('get_global_minecraft', lambda: Converter.get_global_minecraft(minecraft_model)),
+            ('get_animation_global (10 frames)', lambda: ArmatureFormatter.get_animation_global(model, animation)),
+        ]
+
+        print('chain of {} joints:'.format(joint_count))
+        for name, operation in operations:
+            seconds = best_time(operation, repeat)
+            print('  {:35} {:9.2f} ms {:7.2f} us/joint'.format(name, seconds * 1000, seconds / joint_count * 1000000))
+
+
+BENCHMARKS = {
+    'bvh_decode': benchmark_bvh_decode,
+    'math': benchmark_math,
+    'fk': benchmark_fk,
+    'retarget': benchmark_retarget,
+    'evaluate': benchmark_evaluate,
+    'pose_cache': benchmark_pose_cache,
+    'incremental': benchmark_incremental,
+    'memory': benchmark_memory,
+    'quantize': benchmark_quantize,
+    'write': benchmark_write,
+    'skip_unchanged': benchmark_skip_unchanged,
+    'deep': benchmark_deep,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the MCMV converter.')
+    parser.add_argument('benchmarks', help='Benchmarks to run: ' + ', '.join(BENCHMARKS) + ' (default: all)', nargs='*')
+    parser.add_argument('--repeat', help='Number of times each benchmark is run; the fastest run is reported', type=int, default=5)
+
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: ' + name)
+
+    for name in args.benchmarks or BENCHMARKS:
+        print('[' + name + ']')
+        BENCHMARKS[name](args.repeat)
@@ -1,26 +1,104 @@
 import argparse
 import json
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Union, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from mcmv import utility
+from mcmv.animation_cache import AnimationCache, BAKED_POSE_VERSION, pack_animation, unpack_animation
 from mcmv.armature_formatter import MinecraftModelCreator
-from mcmv.armature_objects import DisplayVoxel, ArmatureModel, ArmatureAnimation
+from mcmv.armature_objects import DisplayVoxel, ArmatureModel, ArmatureAnimation, ArmatureAnimationStream
+from mcmv.converter import IncrementalFK
 from mcmv.export_bedrock import BedrockModelExporter, BedrockGeoFileFormatter, BedrockAnimFileFormatter
 from mcmv.export_java import JavaModelExporter
+from mcmv.frame_evaluator import PoseCache
 from mcmv.import_file import BvhFileLoader
+from mcmv.mcmvanim import McmvAnimFileLoader, McmvAnimExporter
 from mcmv.math_objects import Vector3, Quaternion, Euler
+from mcmv.quantized_animation import QuantizedFrameArray
 
 FORMAT_VERSION = "3.0"
 
 
 class ConfigLoader:
     minecraft_models: dict[str, MinecraftModelCreator]
-    armature_model_animations: dict[str, tuple[ArmatureModel, ArmatureAnimation]]
+    armature_model_animations: dict[str, tuple[ArmatureModel, Union[ArmatureAnimation, ArmatureAnimationStream]]]
     translations: dict[str, dict[str, str]]
-
-    def __init__(self):
+    cache: Optional[AnimationCache]
+    jobs: int
+    pose_cache: Optional[PoseCache]
+    write_threads: int
+    # keys from the content of each source, for baking poses (only set if the pose cache has a store)
+    source_keys: dict[tuple[str, str], Optional[str]]
+
+    def __init__(self, cache: AnimationCache = None, jobs: int = 1, pose_cache: PoseCache = None, write_threads: int = 4):
         self.minecraft_models = {}
         self.armature_model_animations = {}
         self.translations = {}
+        self.cache = cache
+        self.jobs = jobs
+        self.pose_cache = pose_cache
+        self.write_threads = write_threads
+        self.source_keys = {}
+
+    def _set_source_key(self, kind: str, info: dict, name_field: str, source_key: str = None):
+        """Set the key of a source from its settings and either the content of its file or the key of the source it is
+        made from."""
+        if self.pose_cache is None or self.pose_cache.store is None:
+            return
+
+        parameters = {field: value for field, value in info.items() if field != name_field}
+        if 'path' in info:
+            key = AnimationCache.get_key(info['path'], **parameters)
+        elif source_key is not None:
+            key = AnimationCache.get_combined_key(source_key, **parameters)
+        else:
+            key = None
+        self.source_keys[kind, info[name_field]] = key
+
+    def _set_pose_store_key(self, animation_name: str, minecraft_model_name: str, translation_name: Optional[str]):
+        """Let the pose cache bake the poses of an armature, keyed by the content of everything they are evaluated from."""
+        if self.pose_cache is None or self.pose_cache.store is None:
+            return
+
+        keys = [self.source_keys.get(('animation', animation_name)), self.source_keys.get(('model', minecraft_model_name))]
+        if translation_name is not None:
+            keys.append(self.source_keys.get(('translation', translation_name)))
+        if None in keys:
+            return
+
+        model, animation = self.armature_model_animations[animation_name]
+        translation = None if translation_name is None else self.translations[translation_name]
+        self.pose_cache.set_store_key(animation, model, self.minecraft_models[minecraft_model_name].minecraft_model, translation,
+                                      AnimationCache.get_combined_key(*keys, version=BAKED_POSE_VERSION))
+
+    @staticmethod
+    def get_incremental(animation_info: dict) -> Optional[IncrementalFK]:
+        """Return the IncrementalFK for the epsilon in the write_animation information, or None if it has none."""
+        epsilon = animation_info.get('epsilon', None)
+        if epsilon is None:
+            return None
+        return IncrementalFK(float(epsilon))
+
+    @staticmethod
+    def print_incremental(incremental: Optional[IncrementalFK]):
+        if incremental is not None and incremental.evaluated + incremental.skipped > 0:
+            print('Skipped {}/{} joint and bone evaluations'.format(incremental.skipped, incremental.evaluated + incremental.skipped))
+
+    @staticmethod
+    def get_skip_tolerances(animation_info: dict) -> tuple[Optional[float], Optional[float]]:
+        """Return the position and rotation tolerances for leaving out the commands of bones that haven't changed,
+        or None for both if the write_animation information doesn't ask for it."""
+        skip_unchanged = animation_info.get('skip_unchanged', False)
+        if not skip_unchanged:
+            return None, None
+        elif skip_unchanged is True:
+            skip_unchanged = {}
+        return float(skip_unchanged.get('position_tolerance', 0.0)), float(skip_unchanged.get('rotation_tolerance', 0.0))
 
     @staticmethod
     def quaternion_from_list(rotation: list[str, float]):
@@ -44,6 +122,7 @@ class ConfigLoader:
             raise model_type + ' is an unsupported type of Minecraft Model!'
 
         self.minecraft_models[name] = new_minecraft_model
+        self._set_source_key('model', info, 'model_name', self.source_keys.get(('animation', info.get('animation_name'))))
 
     @staticmethod
     def _load_mcmv_json_model(info: dict) -> MinecraftModelCreator:
@@ -107,13 +186,72 @@ class ConfigLoader:
 
         if animation_type == 'bvh':
             new_animation = self._load_bvh_animation(info)
+        elif animation_type == 'mcmvanim':
+            new_animation = self._load_mcmvanim_animation(info)
         else:
             raise animation_type + ' is an unsupported type of Animation!'
 
         self.armature_model_animations[name] = new_animation
+        self._set_source_key('animation', info, 'animation_name')
+
+    def load_animations(self, infos: list[dict], jobs: int = 1):
+        """Load a list of animations, parsing up to jobs .bvh files at the same time in separate processes."""
+        if jobs <= 1:
+            self._load_animation_list(infos, {})
+            return
+
+        with ProcessPoolExecutor(jobs) as executor:
+            futures = {}
+            for info in infos:
+                if info['type'].lower() == 'bvh' and not info.get('stream', False):
+                    futures[info['animation_name']] = executor.submit(_load_bvh_animation_packed, info, self.cache)
+            try:
+                self._load_animation_list(infos, futures)
+            except BaseException:
+                # don't wait for the files that haven't started being parsed before the pool is shut down
+                for future in futures.values():
+                    future.cancel()
+                raise
+
+    def _load_animation_list(self, infos: list[dict], futures: dict[str, Future]):
+        """Load a list of animations, taking the ones in futures from the processes parsing them."""
+        tot = len(infos)
+        for i, info in enumerate(infos):
+            print('Loading animation sources... ({}/{})'.format(i + 1, tot))
+            name = info['animation_name']
+            if name in futures:
+                result = futures[name].result()
+                if isinstance(result, dict):
+                    result = unpack_animation(result)
+                self.armature_model_animations[name] = result
+                self._set_source_key('animation', info, 'animation_name')
+            else:
+                self.load_animation(info)
+            self._quantize_animation(info)
+
+    def _quantize_animation(self, info: dict):
+        """Compress the frames of the animation in memory, if its information asks for it."""
+        quantize = info.get('quantize', False)
+        if not quantize:
+            return
+        elif quantize is True:
+            quantize = {}
+
+        animation = self.armature_model_animations[info['animation_name']][1]
+        if not isinstance(animation, ArmatureAnimation):
+            raise Exception('Only animations that are loaded into memory can be quantized!')
+        animation.frames = QuantizedFrameArray.from_frames(animation.frames, quantize.get('position_tolerance', 0.0001),
+                                                           quantize.get('rotation_tolerance', 0.0001))
 
     @staticmethod
-    def _load_bvh_animation(info: dict) -> tuple[ArmatureModel, ArmatureAnimation]:
+    def _load_mcmvanim_animation(info: dict) -> tuple[ArmatureModel, Union[ArmatureAnimation, ArmatureAnimationStream]]:
+        start_frame = info.get('start_frame', 0)
+        max_frames = info.get('max_frames', -1)
+
+        with McmvAnimFileLoader(info['path']) as file_loader:
+            return file_loader.get_model(), file_loader.get_animation(start_frame=start_frame, max_frames=max_frames)
+
+    def _load_bvh_animation(self, info: dict) -> tuple[ArmatureModel, Union[ArmatureAnimation, ArmatureAnimationStream]]:
 
         path = info['path']
 
@@ -124,13 +262,38 @@ class ConfigLoader:
         fps = info.get('fps', 20)
         start_frame = info.get('start_frame', 0)
         max_frames = info.get('max_frames', -1)
+        use_numpy = info.get('use_numpy', False)
+        stream = info.get('stream', False)
+        interpolate = info.get('interpolate', False)
+        compact = info.get('compact', False)
 
         north_quaternion = ConfigLoader.quaternion_from_list(face_north)
 
         file_loader = BvhFileLoader(file_path=path, scale=scale, order=order, face_north=north_quaternion)
 
-        model = file_loader.get_model()
-        animation = file_loader.get_animation(fps=fps, start_frame=start_frame, max_frames=max_frames)
+        if stream:
+            model = file_loader.get_model()
+            return model, file_loader.get_animation_stream(fps=fps, start_frame=start_frame, max_frames=max_frames)
+
+        if self.cache is not None:
+            parameters = {'scale': scale, 'order': order, 'face_north': north_quaternion.to_tuple(),
+                          'fps': fps, 'start_frame': start_frame, 'max_frames': max_frames, 'interpolate': interpolate}
+            # the key of animations that aren't compact is kept the same as before there was the option
+            if compact:
+                parameters['compact'] = True
+            key = AnimationCache.get_key(path, **parameters)
+            cached = self.cache.load(key)
+            if cached is not None:
+                return cached
+
+        if interpolate:
+            model = file_loader.get_model()
+            animation = file_loader.get_animation(fps=fps, start_frame=start_frame, max_frames=max_frames, interpolate=True, compact=compact)
+        else:
+            model, animation = file_loader.load(fps=fps, start_frame=start_frame, max_frames=max_frames, use_numpy=use_numpy, compact=compact)
+
+        if self.cache is not None:
+            self.cache.save(key, model, animation)
 
         return model, animation
 
@@ -145,6 +308,7 @@ class ConfigLoader:
         translation = data
 
         self.translations[name] = translation
+        self._set_source_key('translation', info, 'translation_name')
 
     def perform_task(self, info: dict):
         minecraft_type = info['type'].lower()
@@ -152,9 +316,16 @@ class ConfigLoader:
             self._java_task(info)
         elif minecraft_type == 'bedrock':
             self._bedrock_task(info)
+        elif minecraft_type == 'mcmvanim':
+            self._mcmvanim_task(info)
         else:
             raise minecraft_type + ' is an unsupported type of output!'
 
+    def _mcmvanim_task(self, info: dict):
+        model, animation = self.armature_model_animations[info['animation_name']]
+
+        McmvAnimExporter.write_animation(info['path'], model, animation)
+
     def _java_task(self, info: dict):
         function_path = info['function_path']
 
@@ -192,6 +363,7 @@ class ConfigLoader:
             translation = None
 
         j.set_model_info(model, minecraft_model, translation)
+        self._set_pose_store_key(animation_name, minecraft_model_name, translation_name)
 
         animation_info = info['write_animation']
         root = animation_info.get('root', [0.0, 0.0, 0.0])
@@ -201,8 +373,13 @@ class ConfigLoader:
         offset = Vector3(*animation_info.get('offset', [0.0, 0.0, 0.0]))
         rotate = ConfigLoader.quaternion_from_list(animation_info.get('rotate', [0.0, 0.0, 0.0, 1.0]))
         allow_rotation = animation_info.get('allow_rotation', True)
+        incremental = ConfigLoader.get_incremental(animation_info)
+        position_tolerance, rotation_tolerance = ConfigLoader.get_skip_tolerances(animation_info)
 
-        j.write_animation(function_name=name, animation=animation, root=root, allow_rotation=allow_rotation, offset=offset, rotate=rotate, minecraft_model_no=minecraft_model_no)
+        j.write_animation(function_name=name, animation=animation, root=root, allow_rotation=allow_rotation, offset=offset, rotate=rotate, minecraft_model_no=minecraft_model_no,
+                          jobs=self.jobs, pose_cache=self.pose_cache, incremental=incremental, write_threads=self.write_threads,
+                          position_tolerance=position_tolerance, rotation_tolerance=rotation_tolerance)
+        ConfigLoader.print_incremental(incremental)
 
     def _bedrock_task(self, info: dict):
         b = BedrockModelExporter()
@@ -225,6 +402,7 @@ class ConfigLoader:
             translation = None
 
         b.set_model_info(model, minecraft_model, translation, model_no)
+        self._set_pose_store_key(animation_name, minecraft_model_name, translation_name)
 
         if 'write_geo_model' in info:
             model_info = info['write_geo_model']
@@ -253,25 +431,34 @@ class ConfigLoader:
             identifier = bedrock_format['identifier']
 
             baf = BedrockAnimFileFormatter(format_version=format_version, identifier=identifier)
+            incremental = ConfigLoader.get_incremental(animation_info)
 
-            b.write_animation(path=animation_path, file_name=file_name, model_header=baf, animation=animation)
+            b.write_animation(path=animation_path, file_name=file_name, model_header=baf, animation=animation, jobs=self.jobs, pose_cache=self.pose_cache,
+                              incremental=incremental)
+            ConfigLoader.print_incremental(incremental)
 
 
-def load_data(config_path: str):
+def _load_bvh_animation_packed(info: dict, cache: Optional[AnimationCache]) -> Union[dict, tuple[ArmatureModel, ArmatureAnimation]]:
+    """Load a .bvh animation in a worker process. The result is packed into arrays (if NumPy is installed) so that
+    sending it back to the main process is cheap."""
+    model, animation = ConfigLoader(cache)._load_bvh_animation(info)
+    if np is None:
+        return model, animation
+    return pack_animation(model, animation)
+
+
+def load_data(config_path: str, cache: AnimationCache = None, jobs: int = 1, pose_cache: PoseCache = None, write_threads: int = 4):
     f = open(config_path)
 
     data = json.load(f)
     f.close()
 
-    config_loader = ConfigLoader()
+    config_loader = ConfigLoader(cache, jobs, pose_cache, write_threads)
 
     if str(data['format_version']) != FORMAT_VERSION:
         raise 'Incorrect Format Version! This converter needs format version 3.0!'
 
-    tot = len(data['animation_source'])
-    for i, info in enumerate(data['animation_source']):
-        print('Loading animation sources... ({}/{})'.format(i + 1, tot))
-        config_loader.load_animation(info)
+    config_loader.load_animations(data['animation_source'], jobs)
 
     tot = len(data['model_source'])
     for i, info in enumerate(data['model_source']):
@@ -294,10 +481,21 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Python script to convert .bvh files into Minecraft.\nGithub: https://github.com/hanmindev/MCMV')
     parser.add_argument('--config', help='Load a configuration file', nargs='*', default=config_json)
+    parser.add_argument('--cache-dir', help='Directory to cache parsed animations and baked poses in (no cache if not given)')
+    parser.add_argument('--cache-size', help='Maximum size of the animation cache in megabytes', type=int, default=512)
+    parser.add_argument('--pose-cache-size', help='Maximum size in megabytes of the evaluated poses kept in memory for '
+                                                  'tasks that export the same animation on the same model (0 to disable)', type=int, default=256)
+    parser.add_argument('--jobs', help='Number of processes used to load animation files and to evaluate the frames of each animation', type=int, default=1)
+    parser.add_argument('--write-threads', help='Number of threads used to write the Java function files (0 to write them one at a time)', type=int, default=4)
 
     args = parser.parse_args()
     config_json = args.config
 
+    if args.cache_dir is None:
+        animation_cache = None
+    else:
+        animation_cache = AnimationCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
     for config in config_json:
         print('Loading ' + config + '...')
         if config[:7] != 'config/':
@@ -305,5 +503,11 @@ if __name__ == '__main__':
         if config[-5:] != '.json':
             config = config + '.json'
 
-        load_data(config)
+        # poses in memory can't be used by another config, since they are keyed by the loaded objects,
+        # but poses baked into the animation cache can
+        if args.pose_cache_size > 0 or animation_cache is not None:
+            pose_cache = PoseCache(args.pose_cache_size * 1024 * 1024, animation_cache)
+        else:
+            pose_cache = None
+        load_data(config, animation_cache, args.jobs, pose_cache, args.write_threads)
     print('Complete!')
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+from typing import Optional, Mapping, Iterator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from mcmv.armature_objects import ArmatureModel, ArmatureAnimation, ArmatureFrame, ArmatureFrameArray, Joint, MinecraftPose
+from mcmv.math_objects import Vector3, Quaternion
+
+# Baked poses are stored with these values for every bone in every frame:
+# local animation rotation (x, y, z, w), local animation position (x, y, z), global translation (x, y, z) and
+# global rotation (x, y, z, w). Changing how poses are evaluated or stored should change BAKED_POSE_VERSION.
+BAKED_POSE_VERSION = 2
+BAKED_POSE_CHANNELS = 14
+# baked poses are written one frame at a time, so the header of the .npy file is written last, into this much
+# space left for it at the start of the file
+BAKED_POSE_HEADER_SIZE = 128
+
+
+class AnimationCache:
+    """Stores parsed armature models and animations on disk as .npz files, so that a file that hasn't
+    changed doesn't need to be parsed again. It also stores baked poses (the evaluated pose of every frame of an
+    animation on a Minecraft model) as .npy files, which are memory-mapped when they are loaded.
+
+    The least recently used entries are removed once the cache grows past max_size (bytes).
+    The cache does nothing if NumPy isn't installed.
+    """
+    directory: str
+    max_size: int
+
+    def __init__(self, directory: str = '.mcmv_cache', max_size: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(file_path: str, **parameters) -> str:
+        """Return a key from the content of the file and the parameters it was loaded with."""
+        file_hash = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                file_hash.update(chunk)
+
+        key = hashlib.sha256(file_hash.digest())
+        key.update(json.dumps([file_path, parameters], sort_keys=True).encode('utf-8'))
+        return key.hexdigest()
+
+    @staticmethod
+    def get_combined_key(*keys: Optional[str], **parameters) -> str:
+        """Return a key from other keys and parameters, for something that is made from several sources."""
+        return hashlib.sha256(json.dumps([keys, parameters], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.npz')
+
+    def _get_poses_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.npy')
+
+    def load(self, key: str) -> Optional[tuple[ArmatureModel, ArmatureAnimation]]:
+        """Return the model and animation stored under key, or None if there isn't one."""
+        path = self._get_path(key)
+        if np is None or not os.path.isfile(path):
+            return None
+
+        with np.load(path, allow_pickle=False) as data:
+            model, animation = unpack_animation(data)
+
+        # mark the entry as recently used
+        os.utime(path)
+        return model, animation
+
+    def save(self, key: str, model: ArmatureModel, animation: ArmatureAnimation):
+        """Store the model and animation under key, then remove old entries if the cache is too large."""
+        if np is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._get_path(key)
+        # several processes may be saving at the same time
+        temporary_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, **pack_animation(model, animation))
+        os.replace(temporary_path, path)
+
+        self._evict()
+
+    def load_poses(self, key: str) -> Optional[np.ndarray]:
+        """Return the baked poses stored under key as a memory-mapped (frames x bones x BAKED_POSE_CHANNELS) array,
+        or None if there aren't any."""
+        path = self._get_poses_path(key)
+        if np is None or not os.path.isfile(path):
+            return None
+
+        values = np.load(path, mmap_mode='r', allow_pickle=False)
+
+        # mark the entry as recently used
+        os.utime(path)
+        return values
+
+    def open_poses(self, key: str, bone_count: int) -> Optional[BakedPoseWriter]:
+        """Return a writer that stores baked poses under key one frame at a time, or None if NumPy isn't installed."""
+        if np is None:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        return BakedPoseWriter(self, self._get_poses_path(key), bone_count)
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits in max_size."""
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if file_name[-4:] in ('.npz', '.npy'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, file_name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_name))
+        entries.sort()
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, file_name in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except OSError:
+                # removed by another process, or still memory-mapped on Windows
+                pass
+            total_size -= size
+
+
+class BakedPoseWriter:
+    """Writes the baked poses of an animation into a .npy file of an AnimationCache one frame at a time, so that the
+    poses of a long animation or stream are never all in memory. The file is only added to the cache once the writer
+    is closed, and discard leaves the cache as it was.
+
+    Instance Attributes:
+      - frame_count: The number of frames written so far.
+    """
+    frame_count: int
+
+    def __init__(self, cache: AnimationCache, path: str, bone_count: int):
+        self.frame_count = 0
+
+        self._cache = cache
+        self._path = path
+        # several processes may be saving at the same time
+        self._temporary_path = path + '.' + str(os.getpid()) + '.tmp'
+        self._bone_count = bone_count
+        self._file = open(self._temporary_path, 'wb')
+        self._file.seek(BAKED_POSE_HEADER_SIZE)
+
+    def write(self, values: list[float]):
+        """Write the values of one frame (see pack_pose)."""
+        self._file.write(np.array(values, dtype='<f8').tobytes())
+        self.frame_count += 1
+
+    def close(self):
+        """Add the file to the cache, then remove old entries if the cache is too large."""
+        shape = (self.frame_count, self._bone_count, BAKED_POSE_CHANNELS)
+        header = repr({'descr': '<f8', 'fortran_order': False, 'shape': shape}).encode('latin1')
+        # padded with spaces and ended by a newline, as in version 1.0 of the .npy format
+        header = header.ljust(BAKED_POSE_HEADER_SIZE - 11) + b'\n'
+
+        self._file.seek(0)
+        self._file.write(np.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header)
+        self._file.close()
+        os.replace(self._temporary_path, self._path)
+
+        self._cache._evict()
+
+    def discard(self):
+        """Remove what has been written, without adding anything to the cache."""
+        self._file.close()
+        try:
+            os.remove(self._temporary_path)
+        except OSError:
+            pass
+
+
+def pack_animation(model: ArmatureModel, animation: ArmatureAnimation) -> dict[str, np.ndarray]:
+    """Return the model and animation as a few arrays, which are much smaller and faster to store or
+    send to another process than the objects themselves."""
+    # parents must come before their children
+    joints = [model.root]
+    for joint in joints:
+        joints.extend(joint.children.values())
+    joint_indices = {joint.name: i for i, joint in enumerate(joints)}
+
+    if isinstance(animation.frames, ArmatureFrameArray):
+        # kept in their own dtype, so that a compact animation is still compact once it is unpacked
+        channel_names = animation.frames.channel_names
+        frames = animation.frames.values
+    else:
+        if len(animation.frames) > 0:
+            channel_names = list(animation.frames[0].joint_channels)
+        else:
+            channel_names = []
+        frames = np.array([[offset.to_tuple() + rotation.to_tuple() for offset, rotation in frame.joint_channels.values()]
+                           for frame in animation.frames], dtype=np.float64).reshape(len(animation.frames), len(channel_names), 7)
+
+    return {
+        'model_name': np.array(model.name),
+        'joint_names': np.array([joint.name for joint in joints]),
+        'joint_parents': np.array([-1 if joint.parent is None else joint_indices[joint.parent.name] for joint in joints]),
+        'joint_offsets': np.array([joint.initial_offset.to_tuple() for joint in joints], dtype=np.float64).reshape(-1, 3),
+        'channel_names': np.array(channel_names),
+        'frames': frames,
+        'fps': np.array(animation.fps)
+    }
+
+
+def unpack_animation(data: Mapping[str, np.ndarray]) -> tuple[ArmatureModel, ArmatureAnimation]:
+    """Return the model and animation from the arrays created by pack_animation."""
+    model = ArmatureModel(str(data['model_name']))
+    joint_names = data['joint_names'].tolist()
+    for name, parent, offset in zip(joint_names, data['joint_parents'].tolist(), data['joint_offsets'].tolist()):
+        new_joint = Joint(name)
+        new_joint.initial_offset = Vector3(*offset)
+        if parent == -1:
+            model.add_joint(new_joint)
+        else:
+            model.add_joint(new_joint, joint_names[parent])
+
+    animation = ArmatureAnimation(data['fps'].item())
+    channel_names = data['channel_names'].tolist()
+    frames = data['frames']
+    if frames.dtype == np.float32:
+        animation.frames = ArmatureFrameArray(channel_names, frames)
+        return model, animation
+
+    for frame_channels in frames.tolist():
+        new_frame = ArmatureFrame()
+        for joint_name, channel in zip(channel_names, frame_channels):
+            new_frame.joint_channels[joint_name] = (Vector3(*channel[0:3]), Quaternion(*channel[3:7]))
+        animation.frames.append(new_frame)
+
+    return model, animation
+
+
+def pack_pose(minecraft_pose: MinecraftPose, global_minecraft: tuple[list[Vector3], list[Quaternion]]) -> list[float]:
+    """Return the BAKED_POSE_CHANNELS values of every bone in one frame of baked poses."""
+    no_offset = Vector3()
+    values = []
+    for rotation, position, global_translation, global_rotation in zip(minecraft_pose.rotations, minecraft_pose.positions, *global_minecraft):
+        if position is None:
+            position = no_offset
+        values.extend((rotation.x, rotation.y, rotation.z, rotation.w, position.x, position.y, position.z,
+                       global_translation.x, global_translation.y, global_translation.z,
+                       global_rotation.x, global_rotation.y, global_rotation.z, global_rotation.w))
+    return values
+
+
+def unpack_poses(values: np.ndarray, rest_pose: MinecraftPose) -> Iterator[tuple[MinecraftPose, tuple[list[Vector3], list[Quaternion]]]]:
+    """Yield the pose and global transformation of every frame from baked poses. Only the frame being yielded is
+    read from values, so memory-mapped poses are never all in memory. Bones that have no position in rest_pose get
+    no position in any frame either."""
+    positional = [position is not None for position in rest_pose.positions]
+
+    for frame_values in values:
+        bone_values = frame_values.tolist()
+
+        minecraft_pose = rest_pose.copy()
+        minecraft_pose.rotations = [Quaternion(*bone[0:4]) for bone in bone_values]
+        minecraft_pose.positions = [Vector3(*bone[4:7]) if is_positional else None for bone, is_positional in zip(bone_values, positional)]
+        global_minecraft = ([Vector3(*bone[7:10]) for bone in bone_values], [Quaternion(*bone[10:14]) for bone in bone_values])
+        yield minecraft_pose, global_minecraft
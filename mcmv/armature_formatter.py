@@ -1,7 +1,13 @@
 from typing import Union
 
-from mcmv.armature_objects import ArmatureModel, ArmatureFrame, MinecraftModel, DisplayVoxel, VisibleBone, Joint, PositionalBone, Bone
-from mcmv.math_objects import Vector3, Quaternion
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from mcmv.armature_objects import ArmatureModel, ArmatureFrame, ArmatureFrameArray, ArmaturePose, ArmatureAnimation, Skeleton, MinecraftModel, DisplayVoxel, VisibleBone, Joint, PositionalBone, Bone
+from mcmv.math_objects import Vector3, Quaternion, Vector3Array, QuaternionArray
+from mcmv.quantized_animation import QuantizedFrameArray
 
 
 class MinecraftModelCreator:
@@ -65,7 +71,7 @@ class MinecraftModelCreator:
 
             return sign, largest
 
-        def dfs(joint: Joint, reached_base: bool) -> Bone:
+        def create_bone(joint: Joint, reached_base: bool) -> tuple[Bone, bool]:
             if reached_base:
                 d = find_fixed_direction(joint.initial_offset)
                 length = joint.initial_offset.magnitude()
@@ -98,15 +104,21 @@ class MinecraftModelCreator:
 
             self.minecraft_model.bones[new_bone.name] = new_bone
 
-            for child_name in joint.children:
-                child = joint.children[child_name]
-                child_bone = dfs(child, reached_base)
-                new_bone.children[child_bone.name] = child_bone
-                child_bone.parent = new_bone
+            return new_bone, reached_base
+
+        root_bone, reached_base = create_bone(model.root, base is None)
+
+        # depth-first, in the same order as the children of each joint
+        stack = [(child, reached_base, root_bone) for child in reversed(model.root.children.values())]
+        while stack:
+            joint, reached_base, parent_bone = stack.pop()
+            new_bone, reached_base = create_bone(joint, reached_base)
+            parent_bone.children[new_bone.name] = new_bone
+            new_bone.parent = parent_bone
 
-            return new_bone
+            stack.extend((child, reached_base, new_bone) for child in reversed(joint.children.values()))
 
-        self.minecraft_model.root = dfs(model.root, base is None)
+        self.minecraft_model.root = root_bone
         self.minecraft_model.bones[self.minecraft_model.root.name] = self.minecraft_model.root
 
 
@@ -114,24 +126,20 @@ class MinecraftModelFormatter:
     @staticmethod
     def get_model_global(minecraft_model: MinecraftModel,
                          offset: Vector3 = Vector3().copy(), rotate: Quaternion = Quaternion().copy()) -> dict[str, tuple[Vector3, Quaternion]]:
-        global_transformation = {minecraft_model.root.name: (offset, rotate)}
-
-        def dfs(bone: Bone):
-            parent_global_offset, parent_global_rotation = global_transformation[bone.name]
-
-            for child_name in bone.children:
-                child = bone.children[child_name]
+        skeleton = minecraft_model.get_skeleton()
+        bones = skeleton.nodes
 
-                child_global_offset = parent_global_offset + bone.size + child.offset
-                child_global_rotation = Quaternion()
+        global_offsets = [offset]
+        global_rotations = [rotate]
+        for bone, parent in zip(bones[1:], skeleton.parents[1:]):
+            # the rest offset can't be used here, since the sum has to be taken in this order
+            child_global_offset = global_offsets[parent] + bones[parent].size
+            child_global_offset += bone.offset
 
-                global_transformation[child_name] = (child_global_offset, child_global_rotation)
+            global_offsets.append(child_global_offset)
+            global_rotations.append(Quaternion())
 
-                dfs(child)
-
-        dfs(minecraft_model.root)
-
-        return global_transformation
+        return dict(zip(skeleton.names, zip(global_offsets, global_rotations)))
 
 
 class ArmatureFormatter:
@@ -146,22 +154,100 @@ class ArmatureFormatter:
 
     @staticmethod
     def get_model_global(model: ArmatureModel) -> dict[str, tuple[Vector3, Quaternion]]:
-        global_transformation = {model.root.name: (model.root.animation_offset, Quaternion())}
+        return dict(zip(model.get_skeleton().names, zip(*ArmatureFormatter.get_model_global_lists(model))))
+
+    @staticmethod
+    def get_model_global_lists(model: ArmatureModel) -> tuple[list[Vector3], list[Quaternion]]:
+        """Same as get_model_global, but the translations and rotations are returned as lists in the order of
+        model.get_skeleton().names."""
+        return ArmatureFormatter.get_pose_global_lists(ArmaturePose(model))
+
+    @staticmethod
+    def get_pose_global_lists(pose: ArmaturePose) -> tuple[list[Vector3], list[Quaternion]]:
+        """Return the global translation and rotation of every joint in the pose, as lists in the order of
+        pose.skeleton.names."""
+        skeleton = pose.skeleton
 
         # ending point, rotation
-        def dfs(joint: Joint):
-            parent_translation, parent_rotation = global_transformation[joint.name]
+        global_translations = [pose.offsets[0]]
+        global_rotations = [Quaternion()]
+        for offset, rotation, parent in zip(pose.offsets[1:], pose.rotations[1:], skeleton.parents[1:]):
+            parent_rotation = global_rotations[parent]
+
+            child_translation = offset.rotated_by_quaternion(parent_rotation)  # TODO rotate this by grandparent rotation
+            child_translation += global_translations[parent]
+
+            global_translations.append(child_translation)
+            global_rotations.append(rotation.parented(parent_rotation))
 
-            for child_name in joint.children:
-                child = joint.children[child_name]
+        return global_translations, global_rotations
+
+    @staticmethod
+    def get_animation_global(model: ArmatureModel, animation: ArmatureAnimation, pose: ArmaturePose = None) -> tuple[Vector3Array, QuaternionArray]:
+        """Return the global translation and rotation of every joint in every frame of the animation, as arrays of
+        shape (frames x joints) in the order of model.get_skeleton().names.
+
+        This gives exactly the same result as calling set_frame and get_model_global for each frame, but every frame
+        is computed at once. Like set_frame, a joint that is missing from a frame keeps its transformation from the
+        frame before it, or from pose (the model's own pose by default) for the first frame. The model itself is not
+        changed.
+        """
+        if np is None:
+            raise ImportError('NumPy is required to compute the transformations of a whole animation at once.')
+
+        if pose is None:
+            pose = ArmaturePose(model)
+        skeleton = pose.skeleton
+        joint_indices = skeleton.indices
+
+        if isinstance(animation.frames, (ArmatureFrameArray, QuantizedFrameArray)):
+            # every frame has the same joints, so the joints that aren't in them keep their pose in every frame
+            frames = animation.frames
+            values = np.empty((len(frames), len(skeleton), 7))
+            values[:] = [(offset.x, offset.y, offset.z, rotation.x, rotation.y, rotation.z, rotation.w)
+                         for offset, rotation in zip(pose.offsets, pose.rotations)]
+            columns = [(joint_indices[joint_name], i) for i, joint_name in enumerate(frames.channel_names) if joint_name in joint_indices]
+            if columns:
+                joint_columns, channel_columns = zip(*columns)
+                values[:, list(joint_columns)] = frames.get_values()[:, list(channel_columns)]
+            return ArmatureFormatter.get_global_from_channels(skeleton, values[..., 0:3], values[..., 3:7])
+
+        current_channels = list(zip(pose.offsets, pose.rotations))
+        values = []
+        for frame in animation.frames:
+            for joint_name, channels in frame.joint_channels.items():
+                i = joint_indices.get(joint_name)
+                if i is not None:
+                    current_channels[i] = channels
+            for offset, rotation in current_channels:
+                values.extend((offset.x, offset.y, offset.z, rotation.x, rotation.y, rotation.z, rotation.w))
+
+        values = np.array(values, dtype=np.float64).reshape(len(animation.frames), len(skeleton), 7)
+        return ArmatureFormatter.get_global_from_channels(skeleton, values[..., 0:3], values[..., 3:7])
 
-                child_translation = parent_translation + child.animation_offset.rotated_by_quaternion(parent_rotation)  # TODO rotate this by grandparent rotation
-                child_rotation = child.animation_rotation.parented(parent_rotation)
+    @staticmethod
+    def get_global_from_channels(skeleton: Skeleton, offsets: np.ndarray, rotations: np.ndarray) -> tuple[Vector3Array, QuaternionArray]:
+        """Return the global translation and rotation of every joint from the animation offset (frames x joints x 3)
+        and rotation (frames x joints x 4) of every joint, in the order of skeleton.names.
+
+        Each depth level of the skeleton is computed for every frame at once, following get_model_global.
+        """
+        global_translations = np.empty(offsets.shape)
+        global_rotations = np.empty(rotations.shape)
+
+        # ending point, rotation
+        global_translations[:, 0] = offsets[:, 0]
+        global_rotations[:, 0] = (0.0, 0.0, 0.0, 1.0)
 
-                global_transformation[child_name] = (child_translation, child_rotation)
+        parents = np.array(skeleton.parents, dtype=np.intp)
+        for start, end in skeleton.levels[1:]:
+            level_parents = parents[start:end]
+            parent_rotations = QuaternionArray(global_rotations[:, level_parents])
 
-                dfs(child)
+            child_translations = Vector3Array(offsets[:, start:end]).rotated_by_quaternion(parent_rotations)  # TODO rotate this by grandparent rotation
+            child_translations += Vector3Array(global_translations[:, level_parents])
 
-        dfs(model.root)
+            global_translations[:, start:end] = child_translations.values
+            global_rotations[:, start:end] = QuaternionArray(rotations[:, start:end]).parented(parent_rotations).values
 
-        return global_transformation
+        return Vector3Array(global_translations), QuaternionArray(global_rotations)
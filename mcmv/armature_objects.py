@@ -1,6 +1,11 @@
 from __future__ import annotations
 
-from typing import Union, Optional
+from typing import Union, Optional, Callable, Iterator, Iterable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from mcmv.math_objects import Vector3, Quaternion
 
@@ -46,6 +51,56 @@ class Joint:
         return new_joint
 
 
+class Skeleton:
+    """The joints of an ArmatureModel or the bones of a MinecraftModel compiled into flat lists, so that
+    transformations can be computed in one pass over the lists instead of by walking the tree.
+
+    Nodes are sorted by depth, so every parent comes before its children and each depth level is a
+    contiguous range of indices.
+
+    Instance Attributes:
+      - nodes: The joints or bones, starting with the root.
+      - names: The name of each node.
+      - parents: The index of the parent of each node (-1 for the root).
+      - depths: The number of ancestors of each node.
+      - levels: The (start, end) range of indices of each depth level.
+      - indices: The index of each node by name.
+      - rest_offsets: The offset of each node from its parent before it is animated.
+    """
+    nodes: list[Union[Joint, Bone]]
+    names: list[str]
+    parents: list[int]
+    depths: list[int]
+    levels: list[tuple[int, int]]
+    indices: dict[str, int]
+    rest_offsets: list[Vector3]
+
+    def __init__(self, root: Union[Joint, Bone]):
+        self.nodes = [root]
+        self.parents = [-1]
+        self.depths = [0]
+        for i, node in enumerate(self.nodes):
+            for child in node.children.values():
+                self.nodes.append(child)
+                self.parents.append(i)
+                self.depths.append(self.depths[i] + 1)
+
+        self.names = [node.name for node in self.nodes]
+        self.indices = {name: i for i, name in enumerate(self.names)}
+
+        self.levels = []
+        start = 0
+        for i in range(1, len(self.nodes) + 1):
+            if i == len(self.nodes) or self.depths[i] != self.depths[start]:
+                self.levels.append((start, i))
+                start = i
+
+        self.rest_offsets = [Vector3() for _ in self.nodes]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
 class ArmatureModel:
     """Contains the model of the armature representing the original bvh model."""
     name: str
@@ -57,11 +112,17 @@ class ArmatureModel:
         self.root = None
         self.joints = {}
 
+        self._skeleton = None
+
     def copy(self) -> ArmatureModel:
         """Return a (deep)copy of this Armature Model"""
         new_model = ArmatureModel(self.name)
 
-        def dfs(joint: Joint):
+        # depth-first, in the same order as the children of each joint
+        stack = [self.root]
+        while stack:
+            joint = stack.pop()
+
             new_joint = joint.copy()
             new_joint.parent = None
             new_joint.children = {}
@@ -72,13 +133,34 @@ class ArmatureModel:
             except AttributeError:
                 pass
 
-            for child_name in joint.children:
-                dfs(joint.children[child_name])
+            stack.extend(reversed(joint.children.values()))
 
-        dfs(self.root)
         new_model.root = new_model.joints[self.root.name]
         return new_model
 
+    def __getstate__(self) -> dict:
+        """Return the joints as a flat list for pickling, since pickling the linked joints directly would need
+        one level of recursion per joint."""
+        if self.root is None:
+            joints = []
+        else:
+            skeleton = Skeleton(self.root)
+            joints = [(joint.name, parent, joint.initial_offset, joint.animation_rotation, joint.animation_offset)
+                      for joint, parent in zip(skeleton.nodes, skeleton.parents)]
+        return {'name': self.name, 'joints': joints}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state['name'])
+
+        joint_names = []
+        for name, parent, initial_offset, animation_rotation, animation_offset in state['joints']:
+            new_joint = Joint(name)
+            new_joint.initial_offset = initial_offset
+            new_joint.animation_rotation = animation_rotation
+            new_joint.animation_offset = animation_offset
+            self.add_joint(new_joint, None if parent == -1 else joint_names[parent])
+            joint_names.append(name)
+
     def add_joint(self, joint: Joint, parent_name: str = None):
         """Add a joint to this armature model."""
         self.joints[joint.name] = joint
@@ -89,6 +171,17 @@ class ArmatureModel:
             joint.parent = parent
         else:
             self.root = joint
+        self._skeleton = None
+
+    def get_skeleton(self) -> Skeleton:
+        """Return the joints of this model compiled into a Skeleton, where the rest offset of each joint is
+        its initial_offset. The skeleton is compiled again if joints have been added since."""
+        skeleton = self._skeleton
+        if skeleton is None or skeleton.nodes[0] is not self.root or len(skeleton) != len(self.joints):
+            skeleton = Skeleton(self.root)
+            skeleton.rest_offsets = [joint.initial_offset for joint in skeleton.nodes]
+            self._skeleton = skeleton
+        return skeleton
 
 
 class ArmatureFrame:
@@ -99,9 +192,135 @@ class ArmatureFrame:
         self.joint_channels = {}
 
 
+class ArmatureFrameView(ArmatureFrame):
+    """A frame of an ArmatureFrameArray. The values are a view of one row of the array, so nothing is copied when the
+    frame is created, and joint_channels is only created from the values when it is read.
+
+    Instance Attributes:
+      - channel_names: The name of the joint of each row of values.
+      - values: The offset (x, y, z) and rotation (x, y, z, w) of each joint (joints x 7).
+    """
+    channel_names: list[str]
+    values: np.ndarray
+
+    def __init__(self, channel_names: list[str], values: np.ndarray):
+        self.channel_names = channel_names
+        self.values = values
+
+    @property
+    def joint_channels(self) -> dict[str, tuple[Vector3, Quaternion]]:
+        return {joint_name: (Vector3(*channel[0:3]), Quaternion(*channel[3:7]))
+                for joint_name, channel in zip(self.channel_names, self.values.tolist())}
+
+
+class ArmatureFrameArray:
+    """The frames of an ArmatureAnimation kept in one contiguous array instead of as objects, which takes up a small
+    fraction of the memory. Every frame has a channel for the same joints.
+
+    Indexing gives an ArmatureFrameView of a frame, and slicing gives another ArmatureFrameArray, both of which share
+    the values of this one instead of copying them.
+
+    Instance Attributes:
+      - channel_names: The name of the joint of each channel.
+      - values: The offset (x, y, z) and rotation (x, y, z, w) of each joint in each frame (frames x joints x 7).
+    """
+    channel_names: list[str]
+    values: np.ndarray
+
+    def __init__(self, channel_names: list[str], values: np.ndarray):
+        self.channel_names = channel_names
+        self.values = values
+
+    @staticmethod
+    def from_frames(frames: Iterable[ArmatureFrame], dtype: str = 'float32') -> ArmatureFrameArray:
+        """Return the frames as an ArmatureFrameArray with values of dtype. The channels are the joints of the first
+        frame, so every frame must have the same joints."""
+        if np is None:
+            raise ImportError('NumPy is required to keep the frames of an animation in an array.')
+
+        channel_names = None
+        frame_count = 0
+        values = []
+        for frame in frames:
+            joint_channels = frame.joint_channels
+            if channel_names is None:
+                channel_names = list(joint_channels)
+            elif len(joint_channels) != len(channel_names):
+                raise Exception('Every frame must have the same joints to be kept in an array!')
+            for joint_name in channel_names:
+                offset, rotation = joint_channels[joint_name]
+                values.extend((offset.x, offset.y, offset.z, rotation.x, rotation.y, rotation.z, rotation.w))
+            frame_count += 1
+
+        if channel_names is None:
+            channel_names = []
+        return ArmatureFrameArray(channel_names, np.array(values, dtype=dtype).reshape(frame_count, len(channel_names), 7))
+
+    def get_values(self, start: int = 0, end: int = None) -> np.ndarray:
+        """Return the values of the frames from start up to end (a view, not a copy)."""
+        return self.values[start:end]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[ArmatureFrameView, ArmatureFrameArray]:
+        if isinstance(index, slice):
+            return ArmatureFrameArray(self.channel_names, self.values[index])
+        return ArmatureFrameView(self.channel_names, self.values[index])
+
+    def __iter__(self) -> Iterator[ArmatureFrameView]:
+        channel_names = self.channel_names
+        for frame_values in self.values:
+            yield ArmatureFrameView(channel_names, frame_values)
+
+
+class ArmaturePose:
+    """The animation offset and rotation of every joint of an ArmatureModel, kept apart from the model.
+
+    The model (and its skeleton) is only read, so one model can be shared by any number of armatures that each
+    play their own animation on it. The pose starts out with the animation offset and rotation of the joints.
+
+    Instance Attributes:
+      - skeleton: The skeleton of the model.
+      - offsets: The animation offset of each joint, in the order of skeleton.names.
+      - rotations: The animation rotation of each joint, in the order of skeleton.names.
+    """
+    skeleton: Skeleton
+    offsets: list[Vector3]
+    rotations: list[Quaternion]
+
+    def __init__(self, model: ArmatureModel):
+        self.skeleton = model.get_skeleton()
+        self.offsets = [joint.animation_offset for joint in self.skeleton.nodes]
+        self.rotations = [joint.animation_rotation for joint in self.skeleton.nodes]
+
+    def copy(self) -> ArmaturePose:
+        """Return a copy of this pose. The offsets and rotations themselves are shared, since they are never changed."""
+        new_pose = ArmaturePose.__new__(ArmaturePose)
+        new_pose.skeleton = self.skeleton
+        new_pose.offsets = self.offsets.copy()
+        new_pose.rotations = self.rotations.copy()
+        return new_pose
+
+    def set_frame(self, frame: ArmatureFrame = None):
+        """Set the offset and rotation of every joint in the frame. Joints that aren't in the frame keep their
+        offset and rotation."""
+        if frame is None:
+            return
+        joint_indices = self.skeleton.indices
+        for joint_name, (offset, rotation) in frame.joint_channels.items():
+            i = joint_indices[joint_name]
+            self.offsets[i] = offset
+            self.rotations[i] = rotation
+
+
 class ArmatureAnimation:
-    """Contains the animation for the armature."""
-    frames: list[ArmatureFrame]
+    """Contains the animation for the armature.
+
+    The frames are either a list of ArmatureFrame objects, an ArmatureFrameArray (see compact) that keeps them in
+    one array, or a QuantizedFrameArray that keeps them compressed.
+    """
+    frames: Union[list[ArmatureFrame], ArmatureFrameArray]
     fps: int
 
     def __init__(self, fps: Union[float, int]):
@@ -111,6 +330,39 @@ class ArmatureAnimation:
     def __len__(self):
         return len(self.frames)
 
+    def __iter__(self) -> Iterator[ArmatureFrame]:
+        return iter(self.frames)
+
+    def compact(self, dtype: str = 'float32'):
+        """Keep the frames in an ArmatureFrameArray with values of dtype instead of as objects. With float32, the
+        offsets and rotations are rounded to about 7 significant digits."""
+        if not isinstance(self.frames, ArmatureFrameArray):
+            self.frames = ArmatureFrameArray.from_frames(self.frames, dtype)
+        elif self.frames.values.dtype != dtype:
+            self.frames = ArmatureFrameArray(self.frames.channel_names, self.frames.values.astype(dtype))
+
+    def get_frame_range(self, start: int, end: int = None) -> ArmatureAnimation:
+        """Return an animation with the frames from start up to end. The frames are shared with this animation, and
+        if they are kept in an array (quantized or not), so are their values."""
+        new_animation = ArmatureAnimation(self.fps)
+        new_animation.frames = self.frames[start:end]
+        return new_animation
+
+
+class ArmatureAnimationStream:
+    """An animation whose frames are produced one at a time while iterating instead of being stored.
+
+    frame_source is called every time the animation is iterated over, so it can be exported more than once.
+    """
+    fps: int
+
+    def __init__(self, fps: Union[float, int], frame_source: Callable[[], Iterator[ArmatureFrame]]):
+        self.fps = fps
+        self._frame_source = frame_source
+
+    def __iter__(self) -> Iterator[ArmatureFrame]:
+        return self._frame_source()
+
 
 class DisplayVoxel:
     """Contains information regarding the visible part of the bone"""
@@ -183,3 +435,83 @@ class MinecraftModel:
     def __init__(self):
         self.bones = {}
         self.root = None
+
+        self._skeleton = None
+
+    def __getstate__(self) -> dict:
+        """Return the bones as a flat list for pickling, since pickling the linked bones directly would need
+        one level of recursion per bone. Each bone is stored with its class, its own attributes, and the index
+        of its parent and of each of its children."""
+        bones = [] if self.root is None else Skeleton(self.root).nodes
+        indices = {id(bone): i for i, bone in enumerate(bones)}
+        # bones that aren't below the root are kept too
+        for bone in self.bones.values():
+            if id(bone) not in indices:
+                indices[id(bone)] = len(bones)
+                bones.append(bone)
+
+        bone_states = []
+        for bone in bones:
+            attributes = {key: value for key, value in bone.__dict__.items() if key != 'parent' and key != 'children'}
+            parent = -1 if bone.parent is None else indices[id(bone.parent)]
+            bone_states.append((type(bone), attributes, parent, [indices[id(child)] for child in bone.children.values()]))
+
+        return {'bones': bone_states,
+                'names': [(name, indices[id(bone)]) for name, bone in self.bones.items()],
+                'root': -1 if self.root is None else indices[id(self.root)]}
+
+    def __setstate__(self, state: dict):
+        self.__init__()
+
+        bones = []
+        for bone_class, attributes, _, _ in state['bones']:
+            new_bone = bone_class.__new__(bone_class)
+            new_bone.__dict__.update(attributes)
+            bones.append(new_bone)
+
+        for new_bone, (_, _, parent, children) in zip(bones, state['bones']):
+            new_bone.parent = None if parent == -1 else bones[parent]
+            new_bone.children = {bones[child].name: bones[child] for child in children}
+
+        self.bones = {name: bones[i] for name, i in state['names']}
+        self.root = None if state['root'] == -1 else bones[state['root']]
+
+    def get_skeleton(self) -> Skeleton:
+        """Return the bones of this model compiled into a Skeleton, where the rest offset of each bone is the
+        size of its parent plus its own offset. The skeleton is compiled again if the root or the number of
+        bones has changed, but not if the size or offset of a bone changes."""
+        skeleton = self._skeleton
+        if skeleton is None or skeleton.nodes[0] is not self.root or len(skeleton) != len(self.bones):
+            skeleton = Skeleton(self.root)
+            for i in range(1, len(skeleton)):
+                skeleton.rest_offsets[i] = skeleton.nodes[skeleton.parents[i]].size + skeleton.nodes[i].offset
+            self._skeleton = skeleton
+        return skeleton
+
+
+class MinecraftPose:
+    """The local animation rotation and position of every bone of a MinecraftModel, kept apart from the model
+    like ArmaturePose.
+
+    Instance Attributes:
+      - skeleton: The skeleton of the Minecraft model.
+      - rotations: The local animation rotation of each bone, in the order of skeleton.names.
+      - positions: The local animation position of each bone, or None if the bone is not a PositionalBone.
+    """
+    skeleton: Skeleton
+    rotations: list[Quaternion]
+    positions: list[Optional[Vector3]]
+
+    def __init__(self, minecraft_model: MinecraftModel):
+        self.skeleton = minecraft_model.get_skeleton()
+        self.rotations = [bone.local_animation_rotation for bone in self.skeleton.nodes]
+        self.positions = [bone.local_animation_position if isinstance(bone, PositionalBone) else None
+                          for bone in self.skeleton.nodes]
+
+    def copy(self) -> MinecraftPose:
+        """Return a copy of this pose. The rotations and positions themselves are shared, since they are never changed."""
+        new_pose = MinecraftPose.__new__(MinecraftPose)
+        new_pose.skeleton = self.skeleton
+        new_pose.rotations = self.rotations.copy()
+        new_pose.positions = self.positions.copy()
+        return new_pose
@@ -1,5 +1,12 @@
+from typing import Union, Iterator, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from mcmv.armature_formatter import ArmatureFormatter
-from mcmv.armature_objects import ArmatureModel, MinecraftModel, ArmatureFrame, Bone, PositionalBone
+from mcmv.armature_objects import ArmatureModel, MinecraftModel, ArmatureFrame, ArmaturePose, ArmatureAnimation, ArmatureAnimationStream, PositionalBone, MinecraftPose
 from mcmv.math_objects import Vector3, Quaternion, Euler
 
 
@@ -54,15 +61,34 @@ class RotationFixer:
         return rotation
 
 
-class Converter:
+class RetargetPlan:
+    """Everything Converter.set_minecraft_transformation needs that only depends on the two models and the translation,
+    so that it doesn't need to be worked out again for every frame.
 
-    @staticmethod
-    def set_animation_frame(model: ArmatureModel, frame: ArmatureFrame = None):
-        ArmatureFormatter.set_frame(model, frame)
+    Each bone is matched to its joint, and the rotation from the bone's size to the joint's initial offset is computed
+    ahead of time. Retargeting a frame then only multiplies those rotations with the animated ones.
+    The plan should be compiled again if either model or the translation changes.
 
-    @staticmethod
-    def set_minecraft_transformation(minecraft_model: MinecraftModel, model: ArmatureModel, translation: dict[str, str]):
-        global_transformation = ArmatureFormatter.get_model_global(model)
+    Instance Attributes:
+      - minecraft_model: The Minecraft model that is animated.
+      - model: The armature model that the animation is played on.
+      - translation: The name of the joint of each bone, for bones that don't have the same name as their joint.
+      - rest_pose: The pose of the Minecraft model when the plan was compiled, which evaluate starts from. Only the
+        root bone keeps its transformation from it.
+    """
+    minecraft_model: MinecraftModel
+    model: ArmatureModel
+    translation: Optional[dict[str, str]]
+    rest_pose: MinecraftPose
+
+    def __init__(self, minecraft_model: MinecraftModel, model: ArmatureModel, translation: Optional[dict[str, str]]):
+        self.minecraft_model = minecraft_model
+        self.model = model
+        self.translation = translation
+
+        joint_skeleton = model.get_skeleton()
+        joint_indices = joint_skeleton.indices
+        bone_skeleton = minecraft_model.get_skeleton()
 
         def lookup(key: str) -> str:
             if translation is None or key not in translation:
@@ -70,60 +96,328 @@ class Converter:
             else:
                 return translation[key]
 
-        def dfs(bone: Bone):
-
-            if lookup(bone.name) in model.joints and model.joints[lookup(bone.name)].parent is not None:
-                parent_rotation_name = model.joints[lookup(bone.name)].parent.name
-                parent_global_rotation = global_transformation[parent_rotation_name][1]
+        # for each bone: the index of its joint, the index of the joint's parent, and the rotation from the bone to the joint
+        bone_joints = []
+        for i, bone in enumerate(bone_skeleton.nodes):
+            joint_index = joint_indices.get(lookup(bone.name), -1)
+            if joint_index == -1:
+                if i != 0:
+                    raise Exception('Bone ' + bone.name + ' does not have a matching joint in ' + model.name + '!')
+                bone_joints.append((-1, -1, None))
+                continue
+
+            joint = joint_skeleton.nodes[joint_index]
+            parent_index = -1 if joint.parent is None else joint_indices[joint.parent.name]
+            bone_joints.append((joint_index, parent_index, Quaternion().between_vectors(bone.size, joint.initial_offset)))
+
+        self._root_joint = bone_joints[0]
+        self._bones = [(i, parent, *bone_joints[i][1:]) for i, parent in enumerate(bone_skeleton.parents) if i != 0]
+
+        # positional bones also copy the position of their joint relative to the joint of their parent bone
+        self._positional_bones = [(i, bone_joints[i][0], bone_joints[parent][0]) for i, (bone, parent) in
+                                  enumerate(zip(bone_skeleton.nodes, bone_skeleton.parents)) if i != 0 and isinstance(bone, PositionalBone)]
+
+        self.rest_pose = MinecraftPose(minecraft_model)
+
+    def __getstate__(self) -> dict:
+        """Return the plan for pickling (to send it to other processes), without the skeleton of the rest pose,
+        whose linked bones would need one level of recursion per bone. Both models are pickled as flat lists."""
+        state = self.__dict__.copy()
+        state['rest_pose'] = (self.rest_pose.rotations, self.rest_pose.positions)
+        return state
+
+    def __setstate__(self, state: dict):
+        rotations, positions = state.pop('rest_pose')
+        self.__dict__.update(state)
+
+        self.rest_pose = MinecraftPose.__new__(MinecraftPose)
+        self.rest_pose.skeleton = self.minecraft_model.get_skeleton()
+        self.rest_pose.rotations = rotations
+        self.rest_pose.positions = positions
+
+    def evaluate(self, global_translations: list[Vector3], global_rotations: list[Quaternion]) -> MinecraftPose:
+        """Return the local animation transformation of every bone in the Minecraft model from the global translation
+        and rotation of every joint, in the order of model.get_skeleton().names. Neither model is changed."""
+        return self.evaluate_changed(global_translations, global_rotations)[0]
+
+    def evaluate_changed(self, global_translations: list[Vector3], global_rotations: list[Quaternion], dirty: list[bool] = None,
+                         last: tuple[MinecraftPose, list[Quaternion]] = None) -> tuple[MinecraftPose, list[Quaternion], int]:
+        """Same as evaluate, but if dirty (whether the global transformation of each joint changed since the frame
+        before) and last are given, only the bones that depend on a joint that changed are evaluated, and the others
+        are kept from the frame before.
+
+        last is the pose and the inverted rotations returned for the frame before. The pose, the inverted rotation of
+        each bone in the armature's space and the number of bones that were evaluated are returned.
+        """
+        identity = Quaternion()
+        no_offset = Vector3()
+
+        if last is None:
+            dirty = None
+            pose = self.rest_pose.copy()
+            inverse_real_rotations = [identity] * len(pose.rotations)
+            changed = [True] * len(pose.rotations)
+        else:
+            pose = last[0].copy()
+            inverse_real_rotations = last[1].copy()
+            changed = [False] * len(pose.rotations)
+        rotations = pose.rotations
+        positions = pose.positions
+
+        # the rotation of each bone in the armature's space, inverted
+        _, root_parent, root_rest_rotation = self._root_joint
+        if dirty is None or (root_rest_rotation is not None and root_parent != -1 and dirty[root_parent]):
+            changed[0] = True
+            if root_rest_rotation is None:
+                root_real_rotation = identity
             else:
-                parent_global_rotation = Quaternion()
+                root_real_rotation = root_rest_rotation.parented(identity if root_parent == -1 else global_rotations[root_parent])
+            inverse_real_rotations[0] = root_real_rotation.conjugate()
 
-            for child_name in bone.children:
-                child = bone.children[child_name]
+        for i, parent, joint_parent, rest_rotation in self._bones:
+            if dirty is not None:
+                if not (changed[parent] or (joint_parent != -1 and dirty[joint_parent])):
+                    continue
+                changed[i] = True
 
-                child_rotation_name = model.joints[lookup(child_name)].parent.name
-                child_global_rotation = global_transformation[child_rotation_name][1]
-                try:
-                    parent_real_rotation = Quaternion().between_vectors(bone.size, model.joints[lookup(bone.name)].initial_offset).parented(parent_global_rotation)
-                except KeyError:
-                    parent_real_rotation = parent_global_rotation
+            real_rotation = rest_rotation.parented(identity if joint_parent == -1 else global_rotations[joint_parent])
+            rotations[i] = real_rotation.parented(inverse_real_rotations[parent])
+            inverse_real_rotations[i] = real_rotation.conjugate()
 
-                child_real_rotation = Quaternion().between_vectors(child.size, model.joints[lookup(child.name)].initial_offset).parented(child_global_rotation)
+        for i, joint, parent_joint in self._positional_bones:
+            if dirty is not None and not (dirty[joint] or (parent_joint != -1 and dirty[parent_joint])):
+                continue
+            positions[i] = global_translations[joint] - (no_offset if parent_joint == -1 else global_translations[parent_joint])
+            changed[i] = True
 
-                child.local_animation_rotation = child_real_rotation.parented(parent_real_rotation.conjugate())
-                if isinstance(child, PositionalBone):
-                    try:
-                        parent_global_position = global_transformation[lookup(bone.name)][0]
-                    except KeyError:
-                        parent_global_position = Vector3()
-                    child.local_animation_position = global_transformation[lookup(child_name)][0] - parent_global_position
+        return pose, inverse_real_rotations, changed.count(True)
 
-                dfs(child)
+    def apply(self, global_translations: list[Vector3], global_rotations: list[Quaternion]):
+        """Same as evaluate, but the local animation transformation is set on the bones of the Minecraft model."""
+        pose = self.evaluate(global_translations, global_rotations)
+        for bone, rotation, position in zip(pose.skeleton.nodes[1:], pose.rotations[1:], pose.positions[1:]):
+            bone.local_animation_rotation = rotation
+            if position is not None:
+                bone.local_animation_position = position
 
-        dfs(minecraft_model.root)
+
+class Converter:
 
     @staticmethod
-    def get_global_minecraft(minecraft_model: MinecraftModel) -> dict[str, tuple[Vector3, Quaternion]]:
-        global_transformation = {minecraft_model.root.name: (Vector3(), Quaternion())}
+    def set_animation_frame(model: ArmatureModel, frame: ArmatureFrame = None):
+        ArmatureFormatter.set_frame(model, frame)
+
+    @staticmethod
+    def iter_animation_global(model: ArmatureModel, animation: Union[ArmatureAnimation, ArmatureAnimationStream], pose: ArmaturePose = None) \
+            -> Iterator[tuple[ArmatureFrame, tuple[list[Vector3], list[Quaternion]]]]:
+        """Yield each frame of the animation along with the global translation and rotation of every joint in the
+        order of model.get_skeleton().names. The frames are played on a copy of pose (the model's own pose by
+        default), so neither the model nor pose is changed.
+
+        If NumPy is installed, the transformations of a whole ArmatureAnimation are computed at once, unless the
+        model is so deep compared to the length of the animation that doing one frame at a time is faster.
+        """
+        if np is None or not isinstance(animation, ArmatureAnimation) or \
+                len(animation.frames) * len(model.get_skeleton()) < 100 * len(model.get_skeleton().levels):
+            pose = ArmaturePose(model) if pose is None else pose.copy()
+            for frame in animation:
+                pose.set_frame(frame)
+                yield frame, ArmatureFormatter.get_pose_global_lists(pose)
+            return
+
+        global_translations, global_rotations = ArmatureFormatter.get_animation_global(model, animation, pose)
+        for i, frame in enumerate(animation):
+            yield frame, (global_translations[i].to_vectors(), global_rotations[i].to_quaternions())
 
-        def dfs(bone: Bone):
-            parent_translation, parent_rotation = global_transformation[bone.name]
+    @staticmethod
+    def evaluate(plan: RetargetPlan, pose: ArmaturePose) -> MinecraftPose:
+        """Return the pose of the Minecraft model for a pose of the armature, without changing either model.
+
+        The armature's pose stands in for a frame here, since a frame only has the joints that changed in it.
+        """
+        return plan.evaluate(*ArmatureFormatter.get_pose_global_lists(pose))
+
+    @staticmethod
+    def set_minecraft_transformation(minecraft_model: MinecraftModel, model: ArmatureModel, translation: dict[str, str]):
+        RetargetPlan(minecraft_model, model, translation).apply(*ArmatureFormatter.get_model_global_lists(model))
 
-            for child_name in bone.children:
-                child = bone.children[child_name]
+    @staticmethod
+    def get_global_minecraft(minecraft_model: MinecraftModel) -> dict[str, tuple[Vector3, Quaternion]]:
+        pose = MinecraftPose(minecraft_model)
+        return dict(zip(pose.skeleton.names, zip(*Converter.get_pose_global_minecraft(pose))))
 
-                if isinstance(child, PositionalBone):
-                    child_translation_offset = child.local_animation_position
-                else:
-                    child_translation_offset = Vector3()
+    @staticmethod
+    def get_pose_global_minecraft(pose: MinecraftPose) -> tuple[list[Vector3], list[Quaternion]]:
+        """Same as get_global_minecraft, but for a pose of the Minecraft model, and the translations and rotations are
+        returned as lists in the order of pose.skeleton.names."""
+        skeleton = pose.skeleton
+        no_offset = Vector3()
+
+        global_translations = [Vector3()]
+        global_rotations = [Quaternion()]
+        for rotation, position, parent, rest_offset in zip(pose.rotations[1:], pose.positions[1:], skeleton.parents[1:], skeleton.rest_offsets[1:]):
+            parent_rotation = global_rotations[parent]
+
+            if position is not None:
+                child_translation_offset = position
+            else:
+                child_translation_offset = no_offset
+
+            child_translation = rest_offset.rotated_by_quaternion(parent_rotation)
+            child_translation += global_translations[parent]
+            child_translation += child_translation_offset
+
+            global_translations.append(child_translation)
+            global_rotations.append(rotation.parented(parent_rotation))
+
+        return global_translations, global_rotations
+
+
+class IncrementalFK:
+    """Computes the global transformations of the armature and of the Minecraft model frame after frame, like
+    ArmatureFormatter.get_pose_global_lists and Converter.get_pose_global_minecraft, but only recomputes the joints
+    (or bones) whose channels changed by more than epsilon, and everything below them. The rest keep their global
+    transformation from the frame before. evaluate also only retargets the bones that depend on a joint that was
+    recomputed (see RetargetPlan.evaluate_changed).
+
+    Channels are compared with the values the joint was last computed from rather than with the frame before, so a
+    joint that moves slowly is still recomputed once it has moved by more than epsilon. With an epsilon of 0, only
+    joints whose channels are exactly the same are skipped.
+
+    Instance Attributes:
+      - epsilon: The largest change in any channel for a joint to be skipped.
+      - evaluated: The number of joint and bone evaluations that were done.
+      - skipped: The number of joint and bone evaluations that were skipped.
+    """
+    epsilon: float
+    evaluated: int
+    skipped: int
+
+    def __init__(self, epsilon: float = 0.0):
+        self.epsilon = epsilon
+        self.evaluated = 0
+        self.skipped = 0
+
+        # (skeleton, channels the globals were computed from, global translations, global rotations) of the last frame
+        self._armature = None
+        self._minecraft = None
+        # whether each joint was recomputed in the last frame (None if every joint was)
+        self._dirty = None
+        # (plan, pose, inverted bone rotations) of the last frame retargeted by evaluate
+        self._retarget = None
+
+    def reset(self):
+        """Forget the last frame, so that the next one is computed completely, as when starting a new animation."""
+        self._armature = None
+        self._minecraft = None
+        self._dirty = None
+        self._retarget = None
+
+    def evaluate(self, plan: RetargetPlan, pose: ArmaturePose) -> MinecraftPose:
+        """Same as Converter.evaluate, but only the joints that changed and the bones that depend on them are evaluated."""
+        global_translations, global_rotations = self.get_pose_global_lists(pose)
+
+        last = None
+        if self._dirty is not None and self._retarget is not None and self._retarget[0] is plan:
+            last = self._retarget[1:]
+        minecraft_pose, inverse_real_rotations, evaluated = plan.evaluate_changed(global_translations, global_rotations, self._dirty, last)
+
+        self.evaluated += evaluated
+        self.skipped += len(minecraft_pose.rotations) - evaluated
+        self._retarget = (plan, minecraft_pose, inverse_real_rotations)
+        return minecraft_pose
 
-                child_rotation = child.local_animation_rotation.parented(parent_rotation)
-                child_translation = parent_translation + (bone.size + child.offset).rotated_by_quaternion(parent_rotation) + child_translation_offset
+    @staticmethod
+    def get_frame_evaluations(plan: RetargetPlan) -> int:
+        """Return the number of joint and bone evaluations of a frame of the plan, with the global transformations of
+        the Minecraft model."""
+        return len(plan.model.get_skeleton()) + 2 * len(plan.rest_pose.rotations)
+
+    def get_pose_global_lists(self, pose: ArmaturePose) -> tuple[list[Vector3], list[Quaternion]]:
+        skeleton = pose.skeleton
+        if self._armature is None or self._armature[0] is not skeleton:
+            global_translations, global_rotations = ArmatureFormatter.get_pose_global_lists(pose)
+            self._armature = (skeleton, (pose.offsets.copy(), pose.rotations.copy()), global_translations, global_rotations)
+            self._dirty = None
+            self.evaluated += len(skeleton)
+            return global_translations, global_rotations
+
+        _, (last_offsets, last_rotations), global_translations, global_rotations = self._armature
+        # the lists that were returned for the frame before must not change
+        global_translations = global_translations.copy()
+        global_rotations = global_rotations.copy()
+        epsilon = self.epsilon
+
+        dirty = [False] * len(skeleton)
+        for i, (offset, rotation, parent) in enumerate(zip(pose.offsets, pose.rotations, skeleton.parents)):
+            if not (parent != -1 and dirty[parent]) and offset.is_close(last_offsets[i], epsilon) and rotation.is_close(last_rotations[i], epsilon):
+                continue
+
+            dirty[i] = True
+            last_offsets[i] = offset
+            last_rotations[i] = rotation
+            if parent == -1:
+                # ending point, rotation
+                global_translations[i] = offset
+                continue
+
+            parent_rotation = global_rotations[parent]
+
+            child_translation = offset.rotated_by_quaternion(parent_rotation)  # TODO rotate this by grandparent rotation
+            child_translation += global_translations[parent]
+
+            global_translations[i] = child_translation
+            global_rotations[i] = rotation.parented(parent_rotation)
+
+        evaluated = dirty.count(True)
+        self.evaluated += evaluated
+        self.skipped += len(skeleton) - evaluated
+
+        self._armature = (skeleton, (last_offsets, last_rotations), global_translations, global_rotations)
+        self._dirty = dirty
+        return global_translations, global_rotations
+
+    def get_pose_global_minecraft(self, pose: MinecraftPose) -> tuple[list[Vector3], list[Quaternion]]:
+        skeleton = pose.skeleton
+        if self._minecraft is None or self._minecraft[0] is not skeleton:
+            global_translations, global_rotations = Converter.get_pose_global_minecraft(pose)
+            self._minecraft = (skeleton, (pose.rotations.copy(), pose.positions.copy()), global_translations, global_rotations)
+            self.evaluated += len(skeleton)
+            return global_translations, global_rotations
+
+        _, (last_rotations, last_positions), global_translations, global_rotations = self._minecraft
+        global_translations = global_translations.copy()
+        global_rotations = global_rotations.copy()
+        epsilon = self.epsilon
+        no_offset = Vector3()
+
+        # the root is always at the origin
+        dirty = [False] * len(skeleton)
+        for i, (rotation, position, parent, rest_offset) in enumerate(zip(pose.rotations, pose.positions, skeleton.parents, skeleton.rest_offsets)):
+            if i == 0 or (not dirty[parent] and rotation.is_close(last_rotations[i], epsilon) and
+                          (position is None or position.is_close(last_positions[i], epsilon))):
+                continue
+
+            dirty[i] = True
+            last_rotations[i] = rotation
+            last_positions[i] = position
+            parent_rotation = global_rotations[parent]
+
+            if position is not None:
+                child_translation_offset = position
+            else:
+                child_translation_offset = no_offset
 
-                global_transformation[child_name] = (child_translation, child_rotation)
+            child_translation = rest_offset.rotated_by_quaternion(parent_rotation)
+            child_translation += global_translations[parent]
+            child_translation += child_translation_offset
 
-                dfs(child)
+            global_translations[i] = child_translation
+            global_rotations[i] = rotation.parented(parent_rotation)
 
-        dfs(minecraft_model.root)
+        evaluated = dirty.count(True)
+        self.evaluated += evaluated
+        self.skipped += len(skeleton) - evaluated
 
-        return global_transformation
+        self._minecraft = (skeleton, (last_rotations, last_positions), global_translations, global_rotations)
+        return global_translations, global_rotations
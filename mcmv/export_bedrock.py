@@ -1,12 +1,13 @@
 import json
 import math
 import os
-from typing import Optional
+from typing import Optional, Union
 
 from mcmv import utility
 from mcmv.armature_formatter import MinecraftModelFormatter
-from mcmv.armature_objects import ArmatureModel, MinecraftModel, DisplayVoxel, ArmatureAnimation, VisibleBone, PositionalBone
-from mcmv.converter import Converter, RotationFixer
+from mcmv.armature_objects import ArmatureModel, MinecraftModel, DisplayVoxel, ArmatureAnimation, ArmatureAnimationStream, VisibleBone, PositionalBone
+from mcmv.converter import RetargetPlan, RotationFixer, IncrementalFK
+from mcmv.frame_evaluator import FrameEvaluator, PoseCache
 from mcmv.math_objects import Vector3, Euler, Quaternion
 
 
@@ -177,7 +178,7 @@ class BedrockModelExporter:
         self.original_model = None
 
     def set_model_info(self, model: ArmatureModel, minecraft_model: MinecraftModel, translation: dict[str, str] = None, model_no: str = ''):
-        self.original_model = model.copy()
+        self.original_model = model
         self.minecraft_model = minecraft_model
         self.translation = translation
 
@@ -216,18 +217,22 @@ class BedrockModelExporter:
 
         g.write(json.dumps(model_header.get_json_info()))
 
-    def write_animation(self, path: str, file_name: str, model_header: BedrockAnimFileFormatter, animation: ArmatureAnimation):
+    def write_animation(self, path: str, file_name: str, model_header: BedrockAnimFileFormatter, animation: Union[ArmatureAnimation, ArmatureAnimationStream],
+                        jobs: int = 1, pose_cache: PoseCache = None, incremental: IncrementalFK = None):
+        """Write the animation to a .animation.json file. With more than one job, the frames are evaluated in that
+        many processes at the same time. If a pose cache is given, the frames are only evaluated if they aren't in it.
+        If incremental is given, only the bones that changed by more than its epsilon are evaluated (see IncrementalFK)."""
         complete_path = os.path.join(path, file_name + ".animation.json")
         open(complete_path, 'w').close()
         g = open(complete_path, "a", encoding="utf-8")
-        model_header.set_animation_length(math.ceil(len(animation.frames) / animation.fps))
         model_header.model_no = self.model_no
 
-        for i, frame in enumerate(animation.frames):
-            frame_time = i / animation.fps
+        frame_evaluator = FrameEvaluator(RetargetPlan(self.minecraft_model, self.original_model, self.translation), jobs, pose_cache=pose_cache, incremental=incremental)
+        bone_indices = self.minecraft_model.get_skeleton().indices
 
-            Converter.set_animation_frame(self.original_model, frame)
-            Converter.set_minecraft_transformation(self.minecraft_model, self.original_model, self.translation)
+        frame_count = 0
+        for i, (minecraft_pose, _) in enumerate(frame_evaluator.evaluate_animation(animation)):
+            frame_time = i / animation.fps
 
             for bone_name in self.minecraft_model.bones:
                 bone = self.minecraft_model.bones[bone_name]
@@ -235,8 +240,10 @@ class BedrockModelExporter:
                 if bone is self.minecraft_model.root:
                     continue
                 elif isinstance(bone, PositionalBone):
-                    model_header.add_keyframe(bone_name, frame_time, bone.local_animation_position, None)
+                    model_header.add_keyframe(bone_name, frame_time, minecraft_pose.positions[bone_indices[bone_name]], None)
                 elif isinstance(bone, VisibleBone):
-                    model_header.add_keyframe(bone_name, frame_time, None, bone.local_animation_rotation)
+                    model_header.add_keyframe(bone_name, frame_time, None, minecraft_pose.rotations[bone_indices[bone_name]])
+            frame_count += 1
 
+        model_header.set_animation_length(math.ceil(frame_count / animation.fps))
         g.write(json.dumps(model_header.get_json_info()))
@@ -6,21 +6,27 @@ from typing import Union, Optional
 
 from mcmv import mc_search_function
 from mcmv import utility
-from mcmv.armature_objects import ArmatureModel, MinecraftModel, ArmatureAnimation, VisibleBone
-from mcmv.converter import Converter
+from mcmv.armature_objects import ArmatureModel, MinecraftModel, ArmatureAnimation, ArmatureAnimationStream, VisibleBone
+from mcmv.converter import RetargetPlan, IncrementalFK
+from mcmv.file_writer import FileWriter
+from mcmv.frame_evaluator import FrameEvaluator, PoseCache
 from mcmv.math_objects import Vector3, Euler, Quaternion
 
 
 class JavaUtility:
     @staticmethod
     def get_relative_animation_position(position: Vector3, offset: Vector3, rotate: Quaternion) -> Vector3:
-        new_position = position.rotated_by_quaternion(rotate) + offset
-        return new_position - Vector3(0.0, 1.9, 0.0)
+        new_position = position.rotated_by_quaternion(rotate)
+        new_position += offset
+        new_position.y -= 1.9
+        return new_position
 
     @staticmethod
     def get_animation_position(position: Vector3, offset: Vector3, rotate: Quaternion) -> Vector3:
-        new_position = position.rotated_by_quaternion(rotate) + offset
-        return new_position - Vector3(0.0, 1.9, 0.0)
+        new_position = position.rotated_by_quaternion(rotate)
+        new_position += offset
+        new_position.y -= 1.9
+        return new_position
 
     @staticmethod
     def get_rotation(quaternion: Quaternion, rotate: Quaternion) -> Euler:
@@ -36,7 +42,8 @@ class JavaUtility:
 
 
 class AecStandPair:
-    def __init__(self, name: str, seed_prefix: tuple[str, str], root: Union[str, Vector3], item: str, allow_rotation: bool, minecraft_model_no: str = ''):
+    def __init__(self, name: str, seed_prefix: tuple[str, str], root: Union[str, Vector3], item: str, allow_rotation: bool, minecraft_model_no: str = '',
+                 position_tolerance: float = None, rotation_tolerance: float = None):
         self.name = name
         self._seed_prefix = utility.get_function_directory(*seed_prefix).replace(' ', '_')
 
@@ -66,6 +73,12 @@ class AecStandPair:
         self.show_names = False
         self.allow_rotation = allow_rotation
 
+        # if set, the position or rotation is only written again once it is further than this from the one last written
+        self.position_tolerance = position_tolerance
+        self.rotation_tolerance = rotation_tolerance
+        self._last_position = None
+        self._last_rotation = None
+
     def return_reset_commands(self) -> list[str]:
         """Return a list of commands to reset the AEC-Stand pair."""
 
@@ -102,15 +115,27 @@ class AecStandPair:
                     'kill ' + self.stand_uuid]
         return commands
 
+    @staticmethod
+    def _is_unchanged(last: Optional[tuple], new: tuple, tolerance: Optional[float]) -> bool:
+        return tolerance is not None and last is not None and all(abs(a - b) <= tolerance for a, b in zip(last, new))
+
     def return_transformation_command(self, position: Vector3 = Vector3(), rotation: Quaternion = Quaternion(), offset: Vector3 = Vector3(), rotate: Quaternion = Quaternion()) -> str:
+        """Return the commands that move the AEC-Stand pair for one tick. With a position or rotation tolerance, the
+        commands for a position or rotation that hasn't changed are left out, so this can be empty."""
 
         if type(self.root) is Vector3:
             position = JavaUtility.get_animation_position(position, offset, rotate)
-            commands = [
-                'tp ' + self.aec_uuid + ' {} {} {}'.format(
-                    *('{:f}'.format(i) for i in (position + self.root).to_tuple()))
-            ]
+            position = (position + self.root).to_tuple()
+            if self._is_unchanged(self._last_position, position, self.position_tolerance):
+                commands = []
+            else:
+                self._last_position = position
+                commands = [
+                    'tp ' + self.aec_uuid + ' {} {} {}'.format(
+                        *('{:f}'.format(i) for i in position))
+                ]
         else:
+            # the position is relative to the root entity, which can move, so it is always written
             position = JavaUtility.get_relative_animation_position(position, offset, rotate)
             commands = [
                 'execute at ' + self.root + ' run tp ' + self.aec_uuid + ' ^{} ^{} ^{}'.format(
@@ -122,8 +147,9 @@ class AecStandPair:
                     root + ' run tp ' + self.stand_uuid + ' ~ ~ ~ ~ ~'
                 )
 
-        commands.append('data merge entity ' + self.aec_uuid + ' {Air: ' + str(int(self._update)) + '}')
-        self._update = not self._update
+        if commands:
+            commands.append('data merge entity ' + self.aec_uuid + ' {Air: ' + str(int(self._update)) + '}')
+            self._update = not self._update
 
         if self._end_rod_fix is not None:
             end_rod_angle = Vector3(0.0, math.sin(math.radians(30)), -math.cos(math.radians(30)))
@@ -140,11 +166,12 @@ class AecStandPair:
 
             # rotation = rotation.parented(Quaternion().between_vectors(end_rod_angle, final_angle))
 
-        final_rotation = JavaUtility.get_rotation(rotation, rotate)
-
+        final_rotation = JavaUtility.get_rotation(rotation, rotate).to_tuple()
 
-        commands.append(
-            'data merge entity ' + self.stand_uuid + ' {Pose:{Head:' + utility.tuple_to_m_list(final_rotation.to_tuple(), 'f') + '}}')
+        if not self._is_unchanged(self._last_rotation, final_rotation, self.rotation_tolerance):
+            self._last_rotation = final_rotation
+            commands.append(
+                'data merge entity ' + self.stand_uuid + ' {Pose:{Head:' + utility.tuple_to_m_list(final_rotation, 'f') + '}}')
 
         return '\n'.join(commands)
 
@@ -188,12 +215,23 @@ class JavaModelExporter:
             pass
 
     def set_model_info(self, model: ArmatureModel, minecraft_model: MinecraftModel, translation: dict[str, str] = None):
-        self.original_model = model.copy()
+        self.original_model = model
         self.minecraft_model = minecraft_model
         self.translation = translation
 
-    def write_animation(self, function_name: str, animation: ArmatureAnimation, root: Union[str, Vector3] = Vector3().copy(),
-                        allow_rotation: bool = False, offset: Vector3 = Vector3().copy(), rotate: Quaternion = Quaternion().copy(), minecraft_model_no: str = ''):
+    def write_animation(self, function_name: str, animation: Union[ArmatureAnimation, ArmatureAnimationStream], root: Union[str, Vector3] = Vector3().copy(),
+                        allow_rotation: bool = False, offset: Vector3 = Vector3().copy(), rotate: Quaternion = Quaternion().copy(), minecraft_model_no: str = '',
+                        jobs: int = 1, pose_cache: PoseCache = None, incremental: IncrementalFK = None, write_threads: int = 4,
+                        position_tolerance: float = None, rotation_tolerance: float = None):
+        """Write one function per tick of the animation. With more than one job, the frames are evaluated in that
+        many processes at the same time. If a pose cache is given, the frames are only evaluated if they aren't in it.
+        If incremental is given, only the bones that changed by more than its epsilon are evaluated (see IncrementalFK).
+        The functions are written by write_threads threads in the background (see FileWriter), and have all been
+        written when this returns.
+
+        If position_tolerance (blocks) or rotation_tolerance (degrees) is given, a bone's position or rotation is only
+        written on the ticks where it is further than that from the one last written. The first tick always writes
+        every bone, so the animation is correct when it loops, but it has to be played in order from there."""
         try:
             os.mkdir(os.path.join(self.function_directory, function_name))
         except FileExistsError:
@@ -204,25 +242,30 @@ class JavaModelExporter:
         for bone_name in self.minecraft_model.bones:
             bone = self.minecraft_model.bones[bone_name]
             if isinstance(bone, VisibleBone):
-                self.aec_stand_pairs[function_name][bone_name] = AecStandPair(bone.name, (self.function_directory, function_name), root, bone.display.item, allow_rotation, minecraft_model_no)
-
-        for tick, frame in enumerate(animation.frames):
-            complete_path = os.path.join(self.function_directory, function_name, str(tick) + ".mcfunction")
-            open(complete_path, 'w').close()
-            g = open(complete_path, "a")
-
-            Converter.set_animation_frame(self.original_model, frame)
-            Converter.set_minecraft_transformation(self.minecraft_model, self.original_model, self.translation)
-            global_transformation = Converter.get_global_minecraft(self.minecraft_model)
-
-            for bone_name in self.aec_stand_pairs[function_name]:
-                aec_stand = self.aec_stand_pairs[function_name][bone_name]
-                position, rotation = global_transformation[bone_name]
-
-                commands = aec_stand.return_transformation_command(position, rotation, offset, rotate)
-
-                g.write(commands + '\n')
-        self.max_ticks = max(self.max_ticks, len(animation))
+                self.aec_stand_pairs[function_name][bone_name] = AecStandPair(bone.name, (self.function_directory, function_name), root, bone.display.item, allow_rotation, minecraft_model_no,
+                                                                            position_tolerance, rotation_tolerance)
+
+        frame_evaluator = FrameEvaluator(RetargetPlan(self.minecraft_model, self.original_model, self.translation), jobs, pose_cache=pose_cache, incremental=incremental)
+        bone_indices = self.minecraft_model.get_skeleton().indices
+
+        ticks = 0
+        with FileWriter(write_threads) as writer:
+            for tick, (_, (global_translations, global_rotations)) in enumerate(frame_evaluator.evaluate_animation(animation, with_global=True)):
+                complete_path = os.path.join(self.function_directory, function_name, str(tick) + ".mcfunction")
+
+                tick_commands = []
+                for bone_name in self.aec_stand_pairs[function_name]:
+                    aec_stand = self.aec_stand_pairs[function_name][bone_name]
+                    position = global_translations[bone_indices[bone_name]]
+                    rotation = global_rotations[bone_indices[bone_name]]
+
+                    commands = aec_stand.return_transformation_command(position, rotation, offset, rotate)
+                    if commands:
+                        tick_commands.append(commands + '\n')
+
+                writer.write(complete_path, ''.join(tick_commands))
+                ticks += 1
+        self.max_ticks = max(self.max_ticks, ticks)
 
     def write_reset_function(self):
         """Write commands to remove and summon necessary AEC-Stand pairs.
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+def write_file(path: str, text: str, mode: str = 'w', encoding: str = None):
+    """Write the text to the file with a single call, and close it."""
+    with open(path, mode, encoding=encoding) as f:
+        f.write(text)
+
+
+class FileWriter:
+    """Writes whole files in the background on a pool of threads, so that the next file can be made while the
+    file system is still writing the last ones. With 0 threads, every file is written before write returns.
+
+    At most max_pending files are waiting to be written at once; write waits for the oldest ones after that, so
+    that the text of a large export isn't all kept in memory. An error from writing a file is raised by a later
+    write or by close. Files written to the same path are written in order only with 0 or 1 threads.
+
+    Instance Attributes:
+      - threads: The number of threads writing files.
+      - max_pending: The number of files that may be waiting to be written.
+    """
+    threads: int
+    max_pending: int
+    _executor: Optional[ThreadPoolExecutor]
+    _pending: deque
+
+    def __init__(self, threads: int = 4, max_pending: int = 256):
+        self.threads = threads
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(threads) if threads > 0 else None
+        self._pending = deque()
+
+    def write(self, path: str, text: str, mode: str = 'w', encoding: str = None):
+        """Write the text to the file at path, replacing it (or appending to it with mode 'a')."""
+        if self._executor is None:
+            write_file(path, text, mode, encoding)
+            return
+
+        self._pending.append(self._executor.submit(write_file, path, text, mode, encoding))
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft().result()
+
+    def close(self):
+        """Wait for every file to be written."""
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._pending.clear()
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self) -> FileWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+
+        # keep the error that stopped the writing, instead of one from a file written after it
+        try:
+            self.close()
+        except Exception:
+            pass
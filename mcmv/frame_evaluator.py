@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import itertools
+import multiprocessing.context
+import os
+import sys
+import weakref
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Iterator, Iterable, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from mcmv.animation_cache import AnimationCache, BakedPoseWriter, BAKED_POSE_CHANNELS, pack_pose, unpack_poses
+from mcmv.armature_objects import ArmatureModel, ArmatureAnimation, ArmatureAnimationStream, ArmatureFrame, ArmatureFrameArray, ArmaturePose, MinecraftModel, MinecraftPose
+from mcmv.converter import Converter, RetargetPlan, IncrementalFK
+from mcmv.math_objects import Vector3, Quaternion
+from mcmv.quantized_animation import QuantizedFrameArray
+
+# the plan being evaluated, sent to each worker process once when it starts
+_worker_plan = None
+
+
+def _init_worker(plan: RetargetPlan):
+    global _worker_plan
+    _worker_plan = plan
+
+
+def _evaluate(plan: RetargetPlan, animation: Union[ArmatureAnimation, ArmatureAnimationStream], pose: Optional[ArmaturePose], with_global: bool,
+              incremental: IncrementalFK = None) -> Iterator[tuple[MinecraftPose, Optional[tuple[list[Vector3], list[Quaternion]]]]]:
+    if incremental is not None:
+        incremental.reset()
+        pose = ArmaturePose(plan.model) if pose is None else pose.copy()
+        for frame in animation:
+            pose.set_frame(frame)
+            minecraft_pose = incremental.evaluate(plan, pose)
+            if with_global:
+                yield minecraft_pose, incremental.get_pose_global_minecraft(minecraft_pose)
+            else:
+                yield minecraft_pose, None
+        return
+
+    for frame, model_global in Converter.iter_animation_global(plan.model, animation, pose):
+        minecraft_pose = plan.evaluate(*model_global)
+        if with_global:
+            yield minecraft_pose, Converter.get_pose_global_minecraft(minecraft_pose)
+        else:
+            yield minecraft_pose, None
+
+
+def _evaluate_range(offsets: list[Vector3], rotations: list[Quaternion], frames: Union[list[ArmatureFrame], ArmatureFrameArray, QuantizedFrameArray], fps: Union[float, int], with_global: bool,
+                    epsilon: Optional[float]) -> tuple[list[tuple[list[Quaternion], list[Optional[Vector3]], Optional[tuple[list[Vector3], list[Quaternion]]]]], int, int]:
+    """Evaluate a range of frames in a worker process, starting from the armature pose with the given offsets and
+    rotations. Only lists (or arrays) are sent between the processes, since the skeletons are already in the worker's plan.
+    The number of evaluations that were done and skipped by IncrementalFK (if epsilon isn't None) are returned too."""
+    pose = ArmaturePose(_worker_plan.model)
+    pose.offsets = offsets
+    pose.rotations = rotations
+
+    animation = ArmatureAnimation(fps)
+    animation.frames = frames
+
+    incremental = None if epsilon is None else IncrementalFK(epsilon)
+    results = [(minecraft_pose.rotations, minecraft_pose.positions, global_minecraft)
+               for minecraft_pose, global_minecraft in _evaluate(_worker_plan, animation, pose, with_global, incremental)]
+    if incremental is None:
+        return results, 0, 0
+    return results, incremental.evaluated, incremental.skipped
+
+
+class PoseCache:
+    """Keeps the evaluated pose of every frame of an animation in memory, so that exporting the same animation on the
+    same Minecraft model again (for example to both Java and Bedrock) reads the poses instead of evaluating them.
+
+    Entries are keyed by the animation, the armature model, the Minecraft model and the translation themselves (not
+    their content), and by the epsilon of IncrementalFK (None if it isn't used), and keep them alive while they are
+    in the cache. The poses are shared by everything that reads
+    them, so they must not be changed.
+
+    The least recently used entries are removed once the estimated size of the cache grows past max_size (bytes).
+    An animation whose poses alone are bigger than max_size is not cached, and neither is an ArmatureAnimationStream,
+    which is read one frame at a time so that it never has to be in memory.
+
+    If the cache has a store, the poses are also baked into it under a key set with set_store_key, which should
+    depend on the content of everything the poses are evaluated from. Later runs (and later exports of a stream) then
+    read them from the store one frame at a time instead of evaluating them again. The keys don't keep the animation
+    or the models alive.
+
+    Instance Attributes:
+      - max_size: The maximum estimated size of the cache in bytes.
+      - size: The estimated size of the cache in bytes.
+      - store: The cache on disk that poses are baked into.
+      - hits: The number of animations that were read from memory.
+      - store_hits: The number of animations that were read from the store.
+      - misses: The number of animations that had to be evaluated.
+    """
+    max_size: int
+    size: int
+    store: Optional[AnimationCache]
+    hits: int
+    store_hits: int
+    misses: int
+
+    def __init__(self, max_size: int = 256 * 1024 * 1024, store: AnimationCache = None):
+        self.max_size = max_size
+        self.size = 0
+        self.store = store
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+        # key: (the objects in the key, poses, size), from least to most recently used
+        self._entries = OrderedDict()
+        # animation: [(weak references to the models, translation, key in the store)], forgotten with the animation
+        self._store_keys = weakref.WeakKeyDictionary()
+
+    def set_store_key(self, animation: Union[ArmatureAnimation, ArmatureAnimationStream], model: ArmatureModel,
+                      minecraft_model: MinecraftModel, translation: Optional[dict[str, str]], store_key: str):
+        """Set the key that the poses of the animation on the models are baked into the store under."""
+        store_keys = [entry for entry in self._store_keys.get(animation, [])
+                      if entry[0]() is not None and entry[1]() is not None and
+                      not (entry[0]() is model and entry[1]() is minecraft_model and entry[2] is translation)]
+        store_keys.append((weakref.ref(model), weakref.ref(minecraft_model), translation, store_key))
+        self._store_keys[animation] = store_keys
+
+    def get_store_key(self, plan: RetargetPlan, animation: Union[ArmatureAnimation, ArmatureAnimationStream], epsilon: float = None) -> Optional[str]:
+        """Return the key that the poses are baked into the store under, or None if they aren't baked."""
+        if self.store is None or np is None:
+            return None
+        for model, minecraft_model, translation, store_key in self._store_keys.get(animation, []):
+            if model() is plan.model and minecraft_model() is plan.minecraft_model and translation is plan.translation:
+                if epsilon is None:
+                    return store_key
+                return AnimationCache.get_combined_key(store_key, epsilon=epsilon)
+        return None
+
+    @staticmethod
+    def get_key(plan: RetargetPlan, animation: Union[ArmatureAnimation, ArmatureAnimationStream], epsilon: float = None) \
+            -> tuple[int, int, int, int, Optional[float]]:
+        return id(animation), id(plan.model), id(plan.minecraft_model), id(plan.translation), epsilon
+
+    @staticmethod
+    def get_frame_size(minecraft_pose: MinecraftPose, global_minecraft: tuple[list[Vector3], list[Quaternion]]) -> int:
+        """Return the estimated size of one frame in the cache (bytes)."""
+        values = minecraft_pose.rotations + [position for position in minecraft_pose.positions if position is not None] + \
+            global_minecraft[0] + global_minecraft[1]
+        lists = (minecraft_pose.rotations, minecraft_pose.positions, global_minecraft[0], global_minecraft[1])
+        return sum(sys.getsizeof(value) for value in values) + sum(sys.getsizeof(values) for values in lists) + \
+            sys.getsizeof(minecraft_pose)
+
+    def get(self, plan: RetargetPlan, animation: Union[ArmatureAnimation, ArmatureAnimationStream], epsilon: float = None) \
+            -> Optional[Iterable[tuple[MinecraftPose, tuple[list[Vector3], list[Quaternion]]]]]:
+        """Return the pose and global transformation of every frame, or None if they aren't in the cache. Poses read
+        from the store are made one frame at a time as they are iterated over, and aren't added to memory."""
+        key = PoseCache.get_key(plan, animation, epsilon)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][1]
+
+        store_key = self.get_store_key(plan, animation, epsilon)
+        if store_key is not None:
+            values = self.store.load_poses(store_key)
+            if values is not None and values.shape[1:] == (len(plan.rest_pose.skeleton), BAKED_POSE_CHANNELS):
+                self.store_hits += 1
+                return unpack_poses(values, plan.rest_pose)
+
+        self.misses += 1
+        return None
+
+    def put(self, plan: RetargetPlan, animation: Union[ArmatureAnimation, ArmatureAnimationStream],
+            poses: list[tuple[MinecraftPose, tuple[list[Vector3], list[Quaternion]]]], size: int, epsilon: float = None):
+        """Add the pose and global transformation of every frame, which take up about size bytes."""
+        if size > self.max_size:
+            return
+
+        key = PoseCache.get_key(plan, animation, epsilon)
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[2]
+
+        self._entries[key] = ((animation, plan.model, plan.minecraft_model, plan.translation), poses, size)
+        self.size += size
+        while self.size > self.max_size:
+            self.size -= self._entries.popitem(last=False)[1][2]
+
+    def open_store(self, plan: RetargetPlan, animation: Union[ArmatureAnimation, ArmatureAnimationStream], epsilon: float = None) \
+            -> Optional[BakedPoseWriter]:
+        """Return a writer that bakes the poses into the store one frame at a time (see pack_pose), or None if they
+        aren't baked."""
+        store_key = self.get_store_key(plan, animation, epsilon)
+        if store_key is None:
+            return None
+        return self.store.open_poses(store_key, len(plan.rest_pose.skeleton))
+
+    def clear(self):
+        """Remove every entry from memory. Baked poses stay in the store."""
+        self._entries.clear()
+        self.size = 0
+
+
+class FrameEvaluator:
+    """Evaluates the pose of the Minecraft model in every frame of an animation with a RetargetPlan, without changing
+    either model.
+
+    With more than one job, the animation is split into ranges of frames that are evaluated at the same time in a
+    pool of processes. The poses are still given back in the order of the frames, so exporters can write them as if
+    they had been evaluated one after another.
+
+    Instance Attributes:
+      - plan: The retarget plan of the armature.
+      - jobs: The number of processes to evaluate frames in (at most the number of CPUs). With 1, frames are
+        evaluated in this process.
+      - range_size: The number of frames in each range that is sent to a process.
+      - pose_cache: The cache to read the poses from, or to add them to once every frame has been evaluated.
+      - incremental: If given, only the joints and bones that changed by more than its epsilon since the frame
+        before are evaluated, and the evaluations that were done and skipped (in every process) are counted in it.
+      - mp_context: The multiprocessing context the processes are started with (the platform's default if None).
+        With 'spawn' (the default on Windows and macOS), the plan is pickled into every process.
+    """
+    plan: RetargetPlan
+    jobs: int
+    range_size: int
+    pose_cache: Optional[PoseCache]
+    incremental: Optional[IncrementalFK]
+    mp_context: Optional[multiprocessing.context.BaseContext]
+
+    def __init__(self, plan: RetargetPlan, jobs: int = 1, range_size: int = 64, pose_cache: PoseCache = None,
+                 incremental: IncrementalFK = None, mp_context: multiprocessing.context.BaseContext = None):
+        self.plan = plan
+        self.jobs = jobs
+        self.range_size = range_size
+        self.pose_cache = pose_cache
+        self.incremental = incremental
+        self.mp_context = mp_context
+
+    def evaluate_animation(self, animation: Union[ArmatureAnimation, ArmatureAnimationStream], with_global: bool = False) \
+            -> Iterator[tuple[MinecraftPose, Optional[tuple[list[Vector3], list[Quaternion]]]]]:
+        """Yield the pose of the Minecraft model in each frame of the animation. If with_global is True, the global
+        translation and rotation of every bone (see Converter.get_pose_global_minecraft) are yielded along with it,
+        otherwise None is (unless there is a pose cache, which always has them)."""
+        if self.pose_cache is None:
+            yield from self._evaluate_animation(animation, with_global)
+            return
+
+        epsilon = None if self.incremental is None else self.incremental.epsilon
+        poses = self.pose_cache.get(self.plan, animation, epsilon)
+        if poses is not None:
+            if self.incremental is None:
+                yield from poses
+                return
+            # nothing is evaluated for the poses from the cache, so every evaluation of their frames was skipped
+            frame_evaluations = IncrementalFK.get_frame_evaluations(self.plan)
+            for minecraft_pose, global_minecraft in poses:
+                self.incremental.skipped += frame_evaluations
+                yield minecraft_pose, global_minecraft
+            return
+
+        # the global transformation is always cached, so that any exporter can use the poses
+        # (a stream is never kept in memory, so that memory use stays the same however long it is)
+        poses = [] if isinstance(animation, ArmatureAnimation) else None
+        frame_size = 0
+        # the poses are written to the store as they are evaluated, so they are never all in memory for it
+        writer = self.pose_cache.open_store(self.plan, animation, epsilon)
+        try:
+            for minecraft_pose, global_minecraft in self._evaluate_animation(animation, True):
+                if poses is not None:
+                    if not poses:
+                        frame_size = PoseCache.get_frame_size(minecraft_pose, global_minecraft)
+                    poses.append((minecraft_pose, global_minecraft))
+                    # stop keeping the poses once they can't fit in the cache
+                    if len(poses) * frame_size > self.pose_cache.max_size:
+                        poses = None
+                if writer is not None:
+                    writer.write(pack_pose(minecraft_pose, global_minecraft))
+                yield minecraft_pose, global_minecraft
+        except BaseException:
+            # including when the poses stop being read before the last frame
+            if writer is not None:
+                writer.discard()
+            raise
+
+        if poses is not None:
+            self.pose_cache.put(self.plan, animation, poses, len(poses) * frame_size, epsilon)
+        if writer is not None:
+            writer.close()
+
+    def _evaluate_animation(self, animation: Union[ArmatureAnimation, ArmatureAnimationStream], with_global: bool) \
+            -> Iterator[tuple[MinecraftPose, Optional[tuple[list[Vector3], list[Quaternion]]]]]:
+        # starting processes only pays off if they can run at the same time, and there is more than one range
+        jobs = min(self.jobs, os.cpu_count() or 1)
+        if jobs <= 1 or (isinstance(animation, ArmatureAnimation) and len(animation) <= self.range_size):
+            yield from _evaluate(self.plan, animation, None, with_global, self.incremental)
+            return
+
+        # the pose at the start of each range is found here, since a frame only has the joints that changed in it
+        pose = ArmaturePose(self.plan.model)
+        epsilon = None if self.incremental is None else self.incremental.epsilon
+        if isinstance(animation, ArmatureAnimation):
+            # slices of an ArmatureFrameArray (or QuantizedFrameArray) are sent as arrays instead of one object per frame
+            frame_ranges = (animation.frames[start:start + self.range_size] for start in range(0, len(animation), self.range_size))
+        else:
+            frames = iter(animation)
+            frame_ranges = iter(lambda: list(itertools.islice(frames, self.range_size)), [])
+        pending = deque()
+        with ProcessPoolExecutor(jobs, mp_context=self.mp_context, initializer=_init_worker, initargs=(self.plan,)) as executor:
+            while True:
+                frame_range = next(frame_ranges, None)
+                if frame_range is not None:
+                    pending.append(executor.submit(_evaluate_range, pose.offsets.copy(), pose.rotations.copy(), frame_range, animation.fps, with_global, epsilon))
+                    if isinstance(frame_range, (ArmatureFrameArray, QuantizedFrameArray)):
+                        # every frame has the same joints, so the last one has the pose at the end of the range
+                        pose.set_frame(frame_range[-1])
+                    else:
+                        for frame in frame_range:
+                            pose.set_frame(frame)
+
+                # keep every process busy, without reading far ahead of the frames that have been yielded
+                while pending and (frame_range is None or len(pending) > 2 * jobs):
+                    results, evaluated, skipped = pending.popleft().result()
+                    if self.incremental is not None:
+                        self.incremental.evaluated += evaluated
+                        self.incremental.skipped += skipped
+                    for rotations, positions, global_minecraft in results:
+                        minecraft_pose = self.plan.rest_pose.copy()
+                        minecraft_pose.rotations = rotations
+                        minecraft_pose.positions = positions
+                        yield minecraft_pose, global_minecraft
+
+                if frame_range is None:
+                    return
@@ -1,8 +1,27 @@
+from __future__ import annotations
+
+import bz2
+import gzip
+import io
+import lzma
 import math
-from typing import Union
+import mmap
+import re
+import shutil
+import tempfile
+from array import array
+from typing import Union, Iterator, Optional, BinaryIO, TextIO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from mcmv.math_objects import Quaternion, Vector3, Euler, QuaternionArray, Vector3Array, EulerArray
+from mcmv.armature_objects import ArmatureModel, ArmatureAnimation, ArmatureAnimationStream, ArmatureFrame, ArmatureFrameArray, Joint
 
-from mcmv.math_objects import Quaternion, Vector3, Euler
-from mcmv.armature_objects import ArmatureModel, ArmatureAnimation, ArmatureFrame, Joint
+# bytes of the file read at a time when decompressing or looking for line breaks in it
+MOTION_INDEX_CHUNK_SIZE = 16 * 1024 * 1024
 
 
 class BvhFileLoader:
@@ -16,6 +35,7 @@ class BvhFileLoader:
 
         self.start_animation_line = -1
         self.joint_name_list = []
+        self._decode_plan = None
 
         face_north_euler = Euler('xyz').set_from_quaternion(face_north)
 
@@ -23,148 +43,595 @@ class BvhFileLoader:
         angle_y = math.radians(face_north_euler.y)
         angle_z = math.radians(face_north_euler.z)
 
+        cos_x, sin_x = math.cos(angle_x), math.sin(angle_x)
+        cos_y, sin_y = math.cos(angle_y), math.sin(angle_y)
+        cos_z, sin_z = math.cos(angle_z), math.sin(angle_z)
+        self._face_north_trig = (cos_x, sin_x, cos_y, sin_y, cos_z, sin_z)
+
         def rot_matrix_x(y: float, z: float) -> tuple[float, float]:
-            return y * math.cos(angle_x) - z * math.sin(angle_x), z * math.cos(angle_x) + y * math.sin(angle_x)
+            return y * cos_x - z * sin_x, z * cos_x + y * sin_x
 
         def rot_matrix_y(x: float, z: float) -> tuple[float, float]:
-            return x * math.cos(angle_y) + z * math.sin(angle_y), z * math.cos(angle_y) - x * math.sin(angle_y)
+            return x * cos_y + z * sin_y, z * cos_y - x * sin_y
 
         def rot_matrix_z(x: float, y: float) -> tuple[float, float]:
-            return x * math.cos(angle_z) - y * math.sin(angle_z), y * math.cos(angle_z) + x * math.sin(angle_z)
+            return x * cos_z - y * sin_z, y * cos_z + x * sin_z
 
         # is this cursed?
         self.rot_matrix_x = rot_matrix_x
         self.rot_matrix_y = rot_matrix_y
         self.rot_matrix_z = rot_matrix_z
 
+        # rotation matrix of face_north, see Vector3.rotate_by_quaternion
+        a = face_north.w
+        b = face_north.x
+        c = face_north.y
+        d = face_north.z
+
+        self._face_north_matrix = (
+            a * a + b * b - c * c - d * d, 2 * b * c - 2 * a * d, 2 * b * d + 2 * a * c,
+            2 * b * c + 2 * a * d, a * a - b * b + c * c - d * d, 2 * c * d - 2 * a * b,
+            2 * b * d - 2 * a * c, 2 * c * d + 2 * a * b, a * a - b * b - c * c + d * d
+        )
+
     def get_model(self) -> ArmatureModel:
+        with open_bvh_file(self.file_path) as file:
+            return self._read_model(file)
+
+    def load(self, fps: Union[float, int] = 20, start_frame: int = 0, max_frames: int = None, use_numpy: bool = False,
+             compact: bool = False) -> tuple[ArmatureModel, ArmatureAnimation]:
+        """Return both the armature model and the animation, reading the file only once. Unless the file is
+        compressed, the frames before start_frame are skipped through its frame index without being read.
+
+        The parameters are the same as get_animation.
+        """
+        new_animation = ArmatureAnimation(fps)
+
+        with open_bvh_file(self.file_path) as file:
+            new_armature = self._read_model(file)
+
+            if start_frame > 0 and get_compression(self.file_path) is None:
+                # jump straight to start_frame through the frame index instead of reading every line before it
+                lines = self._read_frame_lines(fps, start_frame, max_frames)
+            else:
+                lines = self._select_frame_lines(file, fps, start_frame, max_frames)
+            if use_numpy or compact:
+                new_animation.frames = self.get_frames_from_array(self._get_motion_array_from_lines(list(lines)), compact)
+            else:
+                new_animation.frames = [self.get_frame_from_line(line) for line in lines]
+
+        return new_armature, new_animation
+
+    def _read_model(self, file: Iterator[str]) -> ArmatureModel:
+        """Read the HIERARCHY section from file, stopping right after the MOTION line."""
         new_armature = ArmatureModel(self.name)
         new_armature.add_joint(Joint('mcmv_root_' + self.name))
 
-        with open(self.file_path, encoding='utf-8') as file:
-            parent_name_stack = []
-            new_joint = None
-
-            for i, line in enumerate(file):
-                words = line.split()
-                if len(words) == 0:
-                    continue
-
-                if words[0] == 'HIERARCHY':
-                    continue
-
-                elif words[0] == 'ROOT' or words[0] == 'JOINT' or words[0] == 'End':
-                    if words[0] == 'End':
-                        joint_name = 'mcmv_End Site_' + joint_name
-                    else:
-                        joint_name = ' '.join(words[1:len(words)])
-                    new_joint = Joint(joint_name)
-                elif words[0] == '{':
-                    try:
-                        parent_name = parent_name_stack[-1]
-                    except IndexError:
-                        parent_name = 'mcmv_root_' + self.name
-                    new_armature.add_joint(new_joint, parent_name)
-                    parent_name_stack.append(joint_name)
-
-                elif words[0] == '}':
-                    parent_name_stack.pop()
-
-                elif words[0] == 'OFFSET':
-                    offset = Vector3(*map(float, words[1: 4])) * self.scale
-                    offset.rotate_by_quaternion(self.face_north)
-                    new_joint.initial_offset = offset
-
-                elif words[0] == 'CHANNELS':
-                    channels = words[2:]
-                    self.joint_name_list.append((new_joint.name, channels))
-
-                elif words[0] == 'MOTION':
-                    self.start_animation_line = i
-                    break
+        self.joint_name_list = []
+        self._decode_plan = None
+
+        parent_name_stack = []
+        new_joint = None
+
+        for i, line in enumerate(file):
+            words = line.split()
+            if len(words) == 0:
+                continue
+
+            if words[0] == 'HIERARCHY':
+                continue
+
+            elif words[0] == 'ROOT' or words[0] == 'JOINT' or words[0] == 'End':
+                if words[0] == 'End':
+                    joint_name = 'mcmv_End Site_' + joint_name
+                else:
+                    joint_name = ' '.join(words[1:len(words)])
+                new_joint = Joint(joint_name)
+            elif words[0] == '{':
+                try:
+                    parent_name = parent_name_stack[-1]
+                except IndexError:
+                    parent_name = 'mcmv_root_' + self.name
+                new_armature.add_joint(new_joint, parent_name)
+                parent_name_stack.append(joint_name)
+
+            elif words[0] == '}':
+                parent_name_stack.pop()
+
+            elif words[0] == 'OFFSET':
+                offset = Vector3(*map(float, words[1: 4])) * self.scale
+                offset.rotate_by_quaternion(self.face_north)
+                new_joint.initial_offset = offset
+
+            elif words[0] == 'CHANNELS':
+                channels = words[2:]
+                self.joint_name_list.append((new_joint.name, channels))
+
+            elif words[0] == 'MOTION':
+                self.start_animation_line = i
+                break
         return new_armature
 
-    def get_animation(self, fps: Union[float, int] = 20, start_frame: int = 0, max_frames: int = None) -> ArmatureAnimation:
+    def get_animation(self, fps: Union[float, int] = 20, start_frame: int = 0, max_frames: int = None, use_numpy: bool = False,
+                      interpolate: bool = False, compact: bool = False) -> ArmatureAnimation:
+        """Return the animation resampled to fps. If compact is True, the frames are kept in an ArmatureFrameArray
+        of float32 values (see ArmatureAnimation.compact), which is decoded with NumPy without creating any objects."""
         if self.start_animation_line == -1:
             raise Exception('Get the armature model first!')
 
+        if interpolate:
+            return self._get_animation_interpolated(fps, start_frame, max_frames, compact)
+        elif use_numpy or compact:
+            return self._get_animation_numpy(fps, start_frame, max_frames, compact)
+
         new_animation = ArmatureAnimation(fps)
+        new_animation.frames = list(self.iter_frames(fps, start_frame, max_frames))
+        return new_animation
 
-        frame = 0
-        include_frames = None
-        with open(self.file_path, encoding='utf-8') as file:
-            for i, line in enumerate(file):
-                if len(line) == 0 or i < self.start_animation_line:
-                    continue
-
-                if line[:6] == 'MOTION':
-                    continue
-                elif line[:8] == 'Frames: ':
-                    total_frames = int(line[8:])
-                elif line[:12] == 'Frame Time: ':
-                    animation_fps = 1 / float(line[12:])
-
-                    skip_frames = animation_fps / fps
-
-                    total_minecraft_frames = math.ceil(total_frames / skip_frames)
-                    include_frames = {int(i * skip_frames) for i in range(total_minecraft_frames)}
-                else:
-                    if max_frames is not None and len(new_animation.frames) >= max_frames >= 0:
+    def get_animation_stream(self, fps: Union[float, int] = 20, start_frame: int = 0, max_frames: int = None) -> ArmatureAnimationStream:
+        """Return an animation that reads its frames from the file while it is being iterated over,
+        so that the whole animation is never held in memory."""
+        if self.start_animation_line == -1:
+            raise Exception('Get the armature model first!')
+
+        return ArmatureAnimationStream(fps, lambda: self.iter_frames(fps, start_frame, max_frames))
+
+    def iter_frames(self, fps: Union[float, int] = 20, start_frame: int = 0, max_frames: int = None) -> Iterator[ArmatureFrame]:
+        """Yield the frames of the animation resampled to fps one at a time."""
+        if self.start_animation_line == -1:
+            raise Exception('Get the armature model first!')
+
+        for line in self._read_frame_lines(fps, start_frame, max_frames):
+            yield self.get_frame_from_line(line)
+
+    def _read_frame_lines(self, fps: Union[float, int], start_frame: int, max_frames: Union[int, None]) -> Iterator[str]:
+        """Yield the lines of the frames that end up in the animation."""
+        if get_compression(self.file_path) is None:
+            with self.get_motion_index() as motion_index:
+                for frame in self._get_source_frames(motion_index, fps, start_frame, max_frames):
+                    yield motion_index[frame]
+        else:
+            # compressed files can't be memory-mapped, so decompress them from the start as a stream instead
+            with open_bvh_file(self.file_path) as file:
+                for line in file:
+                    if line.split()[:1] == ['MOTION']:
                         break
-                    elif start_frame > 0:
-                        start_frame -= 1
-                        continue
-                    elif frame in include_frames:
-                        new_animation.frames.append(self.get_frame_from_line(line))
-                    frame += 1
+                yield from self._select_frame_lines(file, fps, start_frame, max_frames)
+
+    def get_motion_index(self) -> BvhMotionIndex:
+        """Return a new frame index of this file, which should be closed when it is no longer needed.
+
+        A compressed file is decompressed into a temporary file to build its index.
+        """
+        return BvhMotionIndex(self.file_path)
+
+    @classmethod
+    def _get_source_frames(cls, motion_index: BvhMotionIndex, fps: Union[float, int], start_frame: int,
+                           max_frames: Union[int, None]) -> list[int]:
+        """Return the index of every source frame of motion_index that ends up in the animation, in order."""
+        include_frames = sorted(cls._get_include_frames(motion_index.total_frames, 1 / motion_index.frame_time, fps))
+        source_frames = [start_frame + frame for frame in include_frames if start_frame + frame < len(motion_index)]
+        if max_frames is not None and max_frames >= 0:
+            source_frames = source_frames[:max_frames]
+        return source_frames
+
+    def _select_frame_lines(self, lines: Iterator[str], fps: Union[float, int], start_frame: int, max_frames: Union[int, None]) -> Iterator[str]:
+        """Yield the frame lines that end up in the animation from the lines that follow the MOTION line."""
+        for line in lines:
+            if line[:8] == 'Frames: ':
+                total_frames = int(line[8:])
+            elif line[:12] == 'Frame Time: ':
+                include_frames = self._get_include_frames(total_frames, 1 / float(line[12:]), fps)
+                break
+        else:
+            return
+
+        last_frame = max(include_frames, default=-1)
+
+        frame = 0
+        frame_count = 0
+        for line in lines:
+            if line.isspace():
+                continue
+
+            if frame > last_frame or (max_frames is not None and frame_count >= max_frames >= 0):
+                break
+            elif start_frame > 0:
+                start_frame -= 1
+                continue
+            elif frame in include_frames:
+                yield line
+                frame_count += 1
+            frame += 1
+
+    @staticmethod
+    def _get_include_frames(total_frames: int, animation_fps: float, fps: Union[float, int]) -> set[int]:
+        """Return the source frames that are kept when resampling from animation_fps to fps."""
+        skip_frames = animation_fps / fps
+
+        total_minecraft_frames = math.ceil(total_frames / skip_frames)
+        return {int(i * skip_frames) for i in range(total_minecraft_frames)}
+
+    def _get_animation_numpy(self, fps: Union[float, int], start_frame: int, max_frames: Union[int, None], compact: bool = False) -> ArmatureAnimation:
+        """Same as get_animation, but the motion block is parsed in bulk into a (frames x channels) array."""
+        new_animation = ArmatureAnimation(fps)
+
+        motion = self.get_motion_array(fps, start_frame, max_frames)
+        new_animation.frames = self.get_frames_from_array(motion, compact)
         return new_animation
 
-    def get_frame_from_line(self, line: str) -> ArmatureFrame:
-        words = line.split()
+    def _get_animation_interpolated(self, fps: Union[float, int], start_frame: int, max_frames: Union[int, None], compact: bool = False) -> ArmatureAnimation:
+        """Same as get_animation, but each frame is taken at its exact time instead of from the source frame before it.
 
-        index_start = 0
+        Positions are interpolated linearly and rotations with slerp between the two source frames around that time,
+        for every joint of every frame at once. Only those source frames are read from the file.
+        """
+        if np is None:
+            raise ImportError('NumPy is required to interpolate animations.')
 
-        new_frame = ArmatureFrame()
+        with self.get_motion_index() as motion_index:
+            last_frame = len(motion_index) - 1
 
-        for joint_name, channels in self.joint_name_list:
-            if joint_name[0:5] == 'mcmv_':
-                continue
+            skip_frames = 1 / motion_index.frame_time / fps
+            total_minecraft_frames = math.ceil(motion_index.total_frames / skip_frames)
 
-            index_end = index_start + len(channels)
-            offset = Vector3()
-            rotation_euler = Euler(self.order)
-
-            # read channels
-            for i, channel_name in enumerate(channels):
-                value = float(words[index_start + i])
-                if channel_name == 'Xposition':
-                    offset.x = value
-                elif channel_name == 'Yposition':
-                    offset.y = value
-                elif channel_name == 'Zposition':
-                    offset.z = value
-                elif channel_name == 'Xrotation':
-                    rotation_euler.x = value
-                elif channel_name == 'Yrotation':
-                    rotation_euler.y = value
-                elif channel_name == 'Zrotation':
-                    rotation_euler.z = value
-
-            offset.rotate_by_quaternion(self.face_north)
+            times = start_frame + np.arange(total_minecraft_frames) * skip_frames
+            times = times[times < last_frame + 1]
+            if max_frames is not None and max_frames >= 0:
+                times = times[:max_frames]
+
+            previous_frames = np.floor(times).astype(np.intp)
+            next_frames = np.minimum(previous_frames + 1, last_frame)
+            weights = (times - previous_frames)[:, np.newaxis, np.newaxis]
+
+            source_frames, source_indices = np.unique(np.concatenate((previous_frames, next_frames)), return_inverse=True)
+            motion = self._get_motion_array_from_lines([motion_index[frame] for frame in source_frames.tolist()])
+        offsets, rotations = self._decode_motion_array(motion)
+
+        previous_indices = source_indices[:len(times)]
+        next_indices = source_indices[len(times):]
+
+        offsets = offsets[previous_indices] * (1 - weights) + offsets[next_indices] * weights
+        rotations = _slerp(rotations[previous_indices], rotations[next_indices], weights)
+
+        new_animation = ArmatureAnimation(fps)
+        new_animation.frames = self._get_frames_from_transforms(offsets, rotations, compact)
+        return new_animation
+
+    def get_motion_array(self, fps: Union[float, int] = 20, start_frame: int = 0, max_frames: int = None) -> np.ndarray:
+        """Return the raw channel values of the resampled frames as a (frames x channels) float array."""
+        if np is None:
+            raise ImportError('NumPy is required to parse the motion block in bulk.')
+        if self.start_animation_line == -1:
+            raise Exception('Get the armature model first!')
+
+        return self._get_motion_array_from_lines(list(self._read_frame_lines(fps, start_frame, max_frames)))
+
+    def _get_motion_array_from_lines(self, lines: list[str]) -> np.ndarray:
+        """Return a (frames x channels) float array from the lines of each frame."""
+        if np is None:
+            raise ImportError('NumPy is required to parse the motion block in bulk.')
+
+        channel_count = sum(len(channels) for _, channels in self.joint_name_list)
+
+        values = np.array(' '.join(lines).split(), dtype=np.float64)
+        return values.reshape(len(lines), channel_count)
+
+    def _get_decode_plan(self) -> list[tuple[str, tuple[int, int, int], tuple[int, int, int]]]:
+        """Return the animated joints along with the index of their x, y, z position and rotation channels
+        in a frame line, so that decoding a frame doesn't need to look at channel names.
+
+        Missing channels have index -1, which points at the 0.0 added at the end of every frame.
+        """
+        if self._decode_plan is None:
+            self._decode_plan = []
+
+            index_start = 0
+            for joint_name, channels in self.joint_name_list:
+                if joint_name[0:5] != 'mcmv_':
+                    columns = {channel_name: index_start + i for i, channel_name in enumerate(channels)}
+
+                    position_columns = tuple(columns.get(axis + 'position', -1) for axis in 'XYZ')
+                    rotation_columns = tuple(columns.get(axis + 'rotation', -1) for axis in 'XYZ')
+                    self._decode_plan.append((joint_name, position_columns, rotation_columns))
+                index_start += len(channels)
+        return self._decode_plan
+
+    def get_frames_from_array(self, motion: np.ndarray, compact: bool = False) -> Union[list[ArmatureFrame], ArmatureFrameArray]:
+        """Return a list of frames (or an ArmatureFrameArray if compact is True) from a (frames x channels) array.
+
+        This performs the same operations as get_frame_from_line, but on every joint of every frame at once.
+        """
+        return self._get_frames_from_transforms(*self._decode_motion_array(motion), compact)
+
+    def _decode_motion_array(self, motion: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return the offsets (frames x joints x 3) and rotations (frames x joints x 4) from a (frames x channels) array."""
+        decode_plan = self._get_decode_plan()
+        position_columns = np.array([columns for _, columns, _ in decode_plan], dtype=np.intp).reshape(-1, 3)
+        rotation_columns = np.array([columns for _, _, columns in decode_plan], dtype=np.intp).reshape(-1, 3)
+
+        motion = np.concatenate((motion, np.zeros((motion.shape[0], 1))), axis=1)
+
+        offsets = Vector3Array(motion[:, position_columns]).rotated_by_quaternion(self.face_north).values * self.scale
+        rotations = QuaternionArray().set_from_euler(EulerArray(self.order, motion[:, rotation_columns])).values
+
+        qx, qy, qz, qw = rotations[..., 0], rotations[..., 1], rotations[..., 2], rotations[..., 3]
+        qx, qy = self.rot_matrix_z(qx, qy)
+        qx, qz = self.rot_matrix_y(qx, qz)
+        qy, qz = self.rot_matrix_x(qy, qz)
+        rotations = np.stack((qx, qy, qz, qw), axis=-1)
+
+        return offsets, rotations
+
+    def _get_frames_from_transforms(self, offsets: np.ndarray, rotations: np.ndarray, compact: bool = False) -> Union[list[ArmatureFrame], ArmatureFrameArray]:
+        """Return a list of frames (or an ArmatureFrameArray of float32 values if compact is True) from the offsets
+        (frames x joints x 3) and rotations (frames x joints x 4) of each joint."""
+        joint_names = [joint_name for joint_name, _, _ in self._get_decode_plan()]
+        if compact:
+            return ArmatureFrameArray(joint_names, np.concatenate((offsets, rotations), axis=-1).astype(np.float32))
+
+        frames = []
+        for frame_offsets, frame_rotations in zip(offsets.tolist(), rotations.tolist()):
+            new_frame = ArmatureFrame()
+            for joint_name, offset, rotation in zip(joint_names, frame_offsets, frame_rotations):
+                new_frame.joint_channels[joint_name] = (Vector3(*offset), Quaternion(*rotation))
+            frames.append(new_frame)
+        return frames
+
+    def get_frame_from_line(self, line: str) -> ArmatureFrame:
+        values = [float(word) for word in line.split()]
+        values.append(0.0)
+
+        order = self.order
+        scale = self.scale
+        r11, r12, r13, r21, r22, r23, r31, r32, r33 = self._face_north_matrix
+        cos_x, sin_x, cos_y, sin_y, cos_z, sin_z = self._face_north_trig
+
+        new_frame = ArmatureFrame()
+        joint_channels = new_frame.joint_channels
+
+        for joint_name, (x, y, z), (rotation_x, rotation_y, rotation_z) in self._get_decode_plan():
+            # rotate the offset to face north, same as Vector3.rotate_by_quaternion
+            i = values[x]
+            j = values[y]
+            k = values[z]
+
+            length = math.sqrt(i ** 2 + j ** 2 + k ** 2)
+            if length == 0.0:
+                offset = Vector3(0.0 * scale, 0.0 * scale, 0.0 * scale)
+            else:
+                i /= length
+                j /= length
+                k /= length
+                offset = Vector3((i * r11 + j * r12 + k * r13) * length * scale,
+                                 (i * r21 + j * r22 + k * r23) * length * scale,
+                                 (i * r31 + j * r32 + k * r33) * length * scale)
 
             # set rotation
-            rotation = Quaternion().set_from_euler(rotation_euler)
+            rotation = Quaternion().set_from_euler(Euler(order, values[rotation_x], values[rotation_y], values[rotation_z]))
 
-            rotation.x, rotation.y = self.rot_matrix_z(rotation.x, rotation.y)
-            rotation.x, rotation.z = self.rot_matrix_y(rotation.x, rotation.z)
-            rotation.y, rotation.z = self.rot_matrix_x(rotation.y, rotation.z)
+            qx, qy = rotation.x * cos_z - rotation.y * sin_z, rotation.y * cos_z + rotation.x * sin_z
+            qx, qz = qx * cos_y + rotation.z * sin_y, rotation.z * cos_y - qx * sin_y
+            qy, qz = qy * cos_x - qz * sin_x, qz * cos_x + qy * sin_x
+            rotation.x, rotation.y, rotation.z = qx, qy, qz
 
             # set new frame
-            new_frame.joint_channels[joint_name] = (offset * self.scale, rotation)
-
-            index_start = index_end
+            joint_channels[joint_name] = (offset, rotation)
 
         return new_frame
 
     def get_single_animation(self, frame_number: int = -1) -> ArmatureFrame:
+        """Return a single frame of the source animation without reading the frames before it.
+            frame_number: Index of the frame in the source file. Negative values count from the end.
+        """
+        if self.start_animation_line == -1:
+            raise Exception('Get the armature model first!')
+
+        with self.get_motion_index() as motion_index:
+            return self.get_frame_from_line(motion_index[frame_number])
+
+
+class BvhMotionIndex:
+    """Byte offset of every frame in the MOTION section of a .bvh file.
+
+    The file is memory-mapped, so a frame or a range of frames can be read without reading the
+    frames before it. Compressed files can't be memory-mapped, so they are decompressed into a temporary
+    file first, which is memory-mapped instead. Close the index (or use it in a with statement) when done.
+
+    Instance Attributes:
+      - total_frames: The number of frames given in the MOTION header.
+      - frame_time: The time between frames given in the MOTION header (seconds).
+    """
+    total_frames: int
+    frame_time: float
+
+    def __init__(self, file_path: str):
+        self._file = None
+        compression = get_compression(file_path)
+        if compression is None:
+            with open(file_path, 'rb') as file:
+                self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._file = tempfile.TemporaryFile()
+            try:
+                with _open_compressed(file_path, compression) as file:
+                    shutil.copyfileobj(file, self._file, MOTION_INDEX_CHUNK_SIZE)
+                self._file.flush()
+                self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except BaseException:
+                self._file.close()
+                raise
+
+        try:
+            self._read_offsets(file_path)
+        except BaseException:
+            self.close()
+            raise
+
+    def _read_offsets(self, file_path: str):
+        """Read the MOTION header and find the start of every frame line after it."""
+        data = self._data
+        size = len(data)
+
+        motion = re.compile(rb'^[ \t]*MOTION\b', re.MULTILINE).search(data)
+        if motion is None:
+            raise Exception('No MOTION section found in ' + file_path + '!')
+        position = self._next_line(motion.end())
+
+        self.total_frames = 0
+        self.frame_time = 0.0
+        for _ in range(2):
+            end = self._next_line(position)
+            line = data[position:end].decode('utf-8').strip()
+            if line[:7] == 'Frames:':
+                self.total_frames = int(line[7:])
+            elif line[:11] == 'Frame Time:':
+                self.frame_time = float(line[11:])
+            position = end
+
+        if np is not None:
+            self._offsets = self._get_offsets_numpy(position)
+            return
+
+        self._offsets = array('q')
+        while position < size:
+            end = self._next_line(position)
+            # only look at the whole line if it starts with whitespace, in case it is blank
+            if data[position] not in b' \t\r\n' or not data[position:end].isspace():
+                self._offsets.append(position)
+            position = end
+
+    def _get_offsets_numpy(self, position: int) -> np.ndarray:
+        """Return the start of every line that isn't blank from position on, finding the line breaks with NumPy
+        a chunk of the file at a time."""
+        data = self._data
+        size = len(data)
+        if position >= size:
+            return np.empty(0, dtype=np.int64)
+
+        values = np.frombuffer(data, dtype=np.uint8)
+        starts = [np.array([position], dtype=np.int64)]
+        for chunk_start in range(position, size, MOTION_INDEX_CHUNK_SIZE):
+            chunk = values[chunk_start:chunk_start + MOTION_INDEX_CHUNK_SIZE]
+            starts.append(np.flatnonzero(chunk == 10).astype(np.int64) + (chunk_start + 1))
+        del values, chunk
+
+        starts = np.concatenate(starts)
+        starts = starts[starts < size]
+        ends = np.append(starts[1:], size)
+
+        # only look at the whole line if it starts with whitespace, in case it is blank
+        first_bytes = np.frombuffer(data, dtype=np.uint8)[starts]
+        keep = ~np.isin(first_bytes, np.frombuffer(b' \t\r\n', dtype=np.uint8))
+        for i in np.flatnonzero(~keep).tolist():
+            keep[i] = not data[starts[i]:ends[i]].isspace()
+        return starts[keep]
+
+    def _next_line(self, position: int) -> int:
+        """Return the offset of the line after the one containing position."""
+        end = self._data.find(b'\n', position)
+        if end == -1:
+            return len(self._data)
+        return end + 1
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[str, list[str]]:
+        """Return the line of a frame, or the lines of a range of frames."""
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if start >= stop:
+                return []
+            end = int(self._offsets[stop]) if stop < len(self) else len(self._data)
+            lines = self._data[int(self._offsets[start]):end].decode('utf-8').splitlines()
+            return [line for line in lines if line and not line.isspace()]
+
+        start = int(self._offsets[item])
+        return self._data[start:self._next_line(start)].decode('utf-8').rstrip('\r\n')
+
+    def close(self):
+        """Close the memory-mapped file, and remove the decompressed copy of a compressed file."""
+        self._data.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> BvhMotionIndex:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# magic bytes at the start of each supported compressed file format
+COMPRESSION_MAGIC_BYTES = {
+    'gzip': b'\x1f\x8b',
+    'xz': b'\xfd7zXZ\x00',
+    'bz2': b'BZh',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+
+def get_compression(file_path: str) -> Optional[str]:
+    """Return the compression format of the file from its first few bytes, or None if it isn't compressed."""
+    with open(file_path, 'rb') as file:
+        header = file.read(6)
+
+    for compression, magic_bytes in COMPRESSION_MAGIC_BYTES.items():
+        if header[:len(magic_bytes)] == magic_bytes:
+            return compression
+    return None
+
+
+def _open_compressed(file_path: str, compression: str) -> BinaryIO:
+    """Return a binary stream that decompresses the file while it is being read."""
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rb')
+    elif compression == 'xz':
+        return lzma.open(file_path, 'rb')
+    elif compression == 'bz2':
+        return bz2.open(file_path, 'rb')
+
+    try:
+        from compression import zstd
+        return zstd.open(file_path, 'rb')
+    except ImportError:
         pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('The zstandard package (or Python 3.14+) is required to read .zst files.')
+    return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+
+
+def open_bvh_file(file_path: str) -> TextIO:
+    """Open a .bvh file for reading text, decompressing it on the fly if it is compressed
+    (gzip, xz, bz2 or zstd; detected from the content of the file, not the extension)."""
+    compression = get_compression(file_path)
+    if compression is None:
+        return open(file_path, encoding='utf-8')
+    return io.TextIOWrapper(_open_compressed(file_path, compression), encoding='utf-8')
+
+
+def _slerp(start: np.ndarray, end: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Return the spherical linear interpolation between two arrays of quaternions (..., 4) by weights (..., 1)."""
+    dot = np.sum(start * end, axis=-1, keepdims=True)
+
+    # take the shorter path
+    end = np.where(dot < 0.0, -end, end)
+    angle = np.arccos(np.minimum(np.abs(dot), 1.0))
+    sin_angle = np.sin(angle)
+
+    # fall back to a linear interpolation when the quaternions are almost the same
+    close = sin_angle < 1e-6
+    with np.errstate(divide='ignore', invalid='ignore'):
+        start_weights = np.where(close, 1 - weights, np.sin((1 - weights) * angle) / sin_angle)
+        end_weights = np.where(close, weights, np.sin(weights * angle) / sin_angle)
+
+    result = start_weights * start + end_weights * end
+    result /= np.sqrt(np.sum(result * result, axis=-1, keepdims=True))
+
+    return np.where(weights == 0.0, start, result)
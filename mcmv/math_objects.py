@@ -1,6 +1,13 @@
 from __future__ import annotations
 
+import itertools
 import math
+from typing import Iterator, Iterable, Union, Callable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class Euler:
@@ -12,6 +19,7 @@ class Euler:
       - y: Rotation along the local y-axis (degrees)
       - z: Rotation along the local z-axis (degrees)
     """
+    __slots__ = ('order', 'x', 'y', 'z')
 
     def __init__(self, order: str, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> None:
         """Create a new Euler object.
@@ -33,6 +41,10 @@ class Euler:
         """Return a copy of the Euler object"""
         return Euler(self.order, self.x, self.y, self.z)
 
+    def __reduce__(self) -> tuple:
+        """Pickle the Euler object by its components, which is much faster than pickling its slots."""
+        return Euler, (self.order, self.x, self.y, self.z)
+
     def set_from_quaternion(self, quaternion: Quaternion) -> Euler:
         """Set the rotation of the Euler object from a Quaternion object.
             quaternion: A Quaternion object.
@@ -182,6 +194,7 @@ class Quaternion:
       - z: The k component of the quaternion.
       - w: The real component of the quaternion.
     """
+    __slots__ = ('x', 'y', 'z', 'w')
 
     def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0, w: float = 1.0) -> None:
         """Create a new Quaternion object. Note that the real part goes at the end unlike
@@ -208,6 +221,10 @@ class Quaternion:
         """Return a copy of the Quaternion object."""
         return Quaternion(self.x, self.y, self.z, self.w)
 
+    def __reduce__(self) -> tuple:
+        """Pickle the Quaternion object by its components, which is much faster than pickling its slots."""
+        return Quaternion, (self.x, self.y, self.z, self.w)
+
     def extract_vector(self) -> Vector3:
         sin = math.sin(math.acos(self.w))
         try:
@@ -290,19 +307,14 @@ class Quaternion:
 
             parent: A Quaternion object to parent.
         """
-        child = self.copy()
+        child = self
 
         x = parent.w * child.x + parent.x * child.w + parent.y * child.z - parent.z * child.y
         y = parent.w * child.y - parent.x * child.z + parent.y * child.w + parent.z * child.x
         z = parent.w * child.z + parent.x * child.y - parent.y * child.x + parent.z * child.w
         w = parent.w * child.w - parent.x * child.x - parent.y * child.y - parent.z * child.z
 
-        child.x = x
-        child.y = y
-        child.z = z
-        child.w = w
-
-        return child
+        return Quaternion(x, y, z, w)
 
     def normalize(self) -> None:
         """Normalize self such that the magnitude is 1.
@@ -325,7 +337,7 @@ class Quaternion:
 
     def conjugate(self) -> Quaternion:
         """Return the conjugate quaternion"""
-        return Quaternion(-1 * self.x, -1 * self.y, -1 * self.z, self.w)
+        return Quaternion(-self.x, -self.y, -self.z, self.w)
 
     def between_vectors(self, v_1: Vector3, v_2: Vector3) -> Quaternion:
         """Set the quaternion as the shortest rotation from v_1 to v_2.
@@ -370,6 +382,15 @@ class Quaternion:
         """
         return self.x, self.y, self.z, self.w
 
+    def is_close(self, other: Quaternion, epsilon: float = 0.0) -> bool:
+        """Return whether every component of self is within epsilon of the same component of other.
+        Note that q and -q are not close, even though they are the same rotation.
+            other: Quaternion to compare with.
+            epsilon: The largest difference allowed in each component.
+        """
+        return self is other or (abs(self.x - other.x) <= epsilon and abs(self.y - other.y) <= epsilon and
+                                 abs(self.z - other.z) <= epsilon and abs(self.w - other.w) <= epsilon)
+
 
 class Vector3:
     """A class representing a 3-dimensional Vector.
@@ -379,6 +400,8 @@ class Vector3:
       - j: The i component of the vector.
       - k: The i component of the vector.
     """
+    __slots__ = ('x', 'y', 'z')
+
     x: float
     y: float
     z: float
@@ -394,10 +417,14 @@ class Vector3:
         self.y = y
         self.z = z
 
+    def __reduce__(self) -> tuple:
+        """Pickle the Vector3 object by its components, which is much faster than pickling its slots."""
+        return Vector3, (self.x, self.y, self.z)
+
     def __neg__(self) -> Vector3:
         """Return a Vector3 object with opposite direction.
         """
-        return Vector3(*(-1 * self[i] for i in range(3)))
+        return Vector3(-self.x, -self.y, -self.z)
 
     def __sub__(self, other: Vector3) -> Vector3:
         """Return the difference between self and other.
@@ -423,12 +450,37 @@ class Vector3:
         """
         return self.__mul__(other)
 
-    def __iter__(self) -> float:
+    def __isub__(self, other: Vector3) -> Vector3:
+        """Subtract other from self in place.
+            other: Vector3 to subtract from self.
+        """
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def __iadd__(self, other: Vector3) -> Vector3:
+        """Add other to self in place.
+            other: Vector3 to add to self.
+        """
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def __imul__(self, other: float) -> Vector3:
+        """Multiply self by a constant in place.
+            other: A constant to multiply to self.
+        """
+        self.x *= other
+        self.y *= other
+        self.z *= other
+        return self
+
+    def __iter__(self) -> Iterator[float]:
         """Iterate between each component of the vector in ijk order.
         """
-        yield self.x
-        yield self.y
-        yield self.z
+        return iter((self.x, self.y, self.z))
 
     def __getitem__(self, item: int) -> float:
         """Return the component of the vector after indexing.
@@ -440,6 +492,7 @@ class Vector3:
             return self.y
         if item == 2:
             return self.z
+        raise IndexError('Vector3 index out of range')
 
     def __setitem__(self, item: int, value: float):
         """Set the component of the vector after indexing.
@@ -447,10 +500,12 @@ class Vector3:
         """
         if item == 0:
             self.x = value
-        if item == 1:
+        elif item == 1:
             self.y = value
-        if item == 2:
+        elif item == 2:
             self.z = value
+        else:
+            raise IndexError('Vector3 index out of range')
 
     def __repr__(self) -> str:
         """Return a string representation of the object for debugging"""
@@ -458,7 +513,7 @@ class Vector3:
 
     def magnitude(self) -> float:
         """Return the magnitude of the vector"""
-        return math.sqrt(sum(self[i] ** 2 for i in range(3)))
+        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
 
     def copy(self) -> Vector3:
         """Return a copy of the vector"""
@@ -468,6 +523,14 @@ class Vector3:
         """Return a tuple representation of the vector"""
         return self.x, self.y, self.z
 
+    def is_close(self, other: Vector3, epsilon: float = 0.0) -> bool:
+        """Return whether every component of self is within epsilon of the same component of other.
+            other: Vector3 to compare with.
+            epsilon: The largest difference allowed in each component.
+        """
+        return self is other or (abs(self.x - other.x) <= epsilon and abs(self.y - other.y) <= epsilon and
+                                 abs(self.z - other.z) <= epsilon)
+
     def normalize(self) -> None:
         """Normalize the vector"""
         length = self.magnitude()
@@ -512,7 +575,7 @@ class Vector3:
         """Return the dot product of self and other.
             other: The other Vector
         """
-        return sum(self[i] * other[i] for i in range(3))
+        return self.x * other.x + self.y * other.y + self.z * other.z
 
     def cross_prod(self, other: Vector3) -> Vector3:
         """Return the cross product of self and other.
@@ -569,7 +632,6 @@ class Vector3:
         length = self.magnitude()
         if length == 0.0:
             return Vector3(0.0, 0.0, 0.0)
-        self_copy = self.normalized()
 
         a = quaternion.w
         b = quaternion.x
@@ -586,19 +648,13 @@ class Vector3:
         r23 = 2 * c * d - 2 * a * b
         r33 = a * a - b * b - c * c + d * d
 
-        i = self_copy.x
-        j = self_copy.y
-        k = self_copy.z
-
-        self_copy.x = i * r11 + j * r12 + k * r13
-        self_copy.y = i * r21 + j * r22 + k * r23
-        self_copy.z = i * r31 + j * r32 + k * r33
-
-        self_copy.x *= length
-        self_copy.y *= length
-        self_copy.z *= length
+        i = self.x / length
+        j = self.y / length
+        k = self.z / length
 
-        return self_copy
+        return Vector3((i * r11 + j * r12 + k * r13) * length,
+                       (i * r21 + j * r22 + k * r23) * length,
+                       (i * r31 + j * r32 + k * r33) * length)
 
     def scale_pixels_to_meter(self) -> None:
         """Scale self from pixels to meters.
@@ -611,3 +667,551 @@ class Vector3:
         """Return a scaled version of self from pixels to meters.
         """
         return Vector3(self.x / 16.0, self.y / 16.0, self.z / 16.0)
+
+
+class EulerArray:
+    """An array of Euler rotations that share the same order, backed by a NumPy array of shape (..., 3).
+
+    Every operation gives exactly the same result as the matching Euler method on each element.
+
+    Instance Attributes:
+      - order: Euler rotation order.
+      - values: Rotations along the local x, y and z axes (degrees)
+    """
+    __slots__ = ('order', 'values')
+
+    order: str
+    values: np.ndarray
+
+    def __init__(self, order: str, values: np.ndarray = None) -> None:
+        """Create a new EulerArray object.
+            order: Euler rotation order.
+            values: An array of shape (..., 3) with the x, y and z rotations (degrees)
+        """
+        _check_numpy()
+        self.order = order
+        self.values = _as_array(values, 3)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the EulerArray object for debugging purposes."""
+        return 'EulerArray({}, {})'.format(self.order, self.values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, item) -> Union[Euler, EulerArray]:
+        values = self.values[item]
+        if values.ndim == 1:
+            return Euler(self.order, *values.tolist())
+        return EulerArray(self.order, values)
+
+    @staticmethod
+    def from_eulers(eulers: Iterable[Euler]) -> EulerArray:
+        """Return an EulerArray from Euler objects, which must all have the same order."""
+        eulers = list(eulers)
+        orders = {euler.order for euler in eulers}
+        if len(orders) > 1:
+            raise Exception('All Euler rotations in an EulerArray must have the same order!')
+        return EulerArray(orders.pop() if orders else 'xyz', [euler.to_tuple() for euler in eulers])
+
+    def to_eulers(self) -> list[Euler]:
+        """Return the rotations as a flat list of Euler objects."""
+        return [Euler(self.order, *euler) for euler in self.values.reshape(-1, 3).tolist()]
+
+    def copy(self) -> EulerArray:
+        """Return a copy of the EulerArray object"""
+        return EulerArray(self.order, self.values.copy())
+
+    def set_from_quaternion(self, quaternion: QuaternionArray) -> EulerArray:
+        """Set the rotations of the EulerArray object from a QuaternionArray object.
+            quaternion: A QuaternionArray object.
+        """
+        qx = quaternion.x
+        qy = quaternion.y
+        qz = quaternion.z
+        qw = quaternion.w
+
+        x2 = qx + qx
+        y2 = qy + qy
+        z2 = qz + qz
+        xx = qx * x2
+        xy = qx * y2
+        xz = qx * z2
+        yy = qy * y2
+        yz = qy * z2
+        zz = qz * z2
+        wx = qw * x2
+        wy = qw * y2
+        wz = qw * z2
+
+        m11 = (1 - (yy + zz))
+        m21 = (xy + wz)
+        m31 = (xz - wy)
+
+        m12 = (xy - wz)
+        m22 = (1 - (xx + zz))
+        m32 = (yz + wx)
+
+        m13 = (xz + wy)
+        m23 = (yz - wx)
+        m33 = (1 - (xx + yy))
+
+        if self.order == 'xyz':
+            y = _apply(math.asin, np.clip(m13, -1, 1))
+            not_locked = np.abs(m13) < 0.9999999
+            x = _apply_where(not_locked, math.atan2, (-m23, m33), (m32, m22))
+            z = _apply_where(not_locked, math.atan2, (-m12, m11), None)
+        elif self.order == 'yxz':
+            x = _apply(math.asin, -np.clip(m23, -1, 1))
+            not_locked = np.abs(m23) < 0.9999999
+            y = _apply_where(not_locked, math.atan2, (m13, m33), (-m31, m11))
+            z = _apply_where(not_locked, math.atan2, (m21, m22), None)
+        elif self.order == 'zxy':
+            x = _apply(math.asin, np.clip(m32, -1, 1))
+            not_locked = np.abs(m32) < 0.9999999
+            y = _apply_where(not_locked, math.atan2, (-m31, m33), None)
+            z = _apply_where(not_locked, math.atan2, (-m12, m22), (m21, m11))
+        elif self.order == 'zyx':
+            y = _apply(math.asin, -np.clip(m31, -1, 1))
+            not_locked = np.abs(m31) < 0.9999999
+            x = _apply_where(not_locked, math.atan2, (m32, m33), None)
+            z = _apply_where(not_locked, math.atan2, (m21, m11), (-m12, m22))
+        elif self.order == 'yzx':
+            z = _apply(math.asin, np.clip(m21, -1, 1))
+            not_locked = np.abs(m21) < 0.9999999
+            x = _apply_where(not_locked, math.atan2, (-m23, m22), None)
+            y = _apply_where(not_locked, math.atan2, (-m31, m11), (m13, m33))
+        elif self.order == 'xzy':
+            z = _apply(math.asin, -np.clip(m12, -1, 1))
+            not_locked = np.abs(m12) < 0.9999999
+            x = _apply_where(not_locked, math.atan2, (m32, m22), (-m23, m33))
+            y = _apply_where(not_locked, math.atan2, (m13, m11), None)
+        else:
+            raise Exception(self.order + ' is not a valid Euler order!')
+
+        self.values = np.degrees(np.stack((x, y, z), axis=-1))
+        return self
+
+
+class QuaternionArray:
+    """An array of quaternions, backed by a NumPy array of shape (..., 4) in x, y, z, w order.
+
+    Every operation gives exactly the same result as the matching Quaternion method on each element.
+    Anywhere another quaternion is expected, either a single Quaternion or a QuaternionArray with a
+    shape that broadcasts against this one can be used.
+
+    Instance Attributes:
+      - values: The i, j, k and real components of each quaternion.
+    """
+    __slots__ = ('values',)
+
+    values: np.ndarray
+
+    def __init__(self, values: np.ndarray = None) -> None:
+        """Create a new QuaternionArray object.
+            values: An array of shape (..., 4) with the x, y, z and w components.
+        """
+        _check_numpy()
+        self.values = _as_array(values, 4)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the QuaternionArray object for debugging purposes."""
+        return 'QuaternionArray({})'.format(self.values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, item) -> Union[Quaternion, QuaternionArray]:
+        values = self.values[item]
+        if values.ndim == 1:
+            return Quaternion(*values.tolist())
+        return QuaternionArray(values)
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.values[..., 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.values[..., 1]
+
+    @property
+    def z(self) -> np.ndarray:
+        return self.values[..., 2]
+
+    @property
+    def w(self) -> np.ndarray:
+        return self.values[..., 3]
+
+    @staticmethod
+    def identity(shape: Union[int, tuple[int, ...]]) -> QuaternionArray:
+        """Return an array of identity quaternions."""
+        _check_numpy()
+        values = np.zeros(np.atleast_1d(shape).tolist() + [4])
+        values[..., 3] = 1.0
+        return QuaternionArray(values)
+
+    @staticmethod
+    def from_quaternions(quaternions: Iterable[Quaternion]) -> QuaternionArray:
+        """Return a QuaternionArray from Quaternion objects."""
+        return QuaternionArray([quaternion.to_tuple() for quaternion in quaternions])
+
+    def to_quaternions(self) -> list[Quaternion]:
+        """Return the quaternions as a flat list of Quaternion objects."""
+        return [Quaternion(*quaternion) for quaternion in self.values.reshape(-1, 4).tolist()]
+
+    def copy(self) -> QuaternionArray:
+        """Return a copy of the QuaternionArray object."""
+        return QuaternionArray(self.values.copy())
+
+    def set_from_euler(self, euler: EulerArray) -> QuaternionArray:
+        """Set the quaternions from an EulerArray object.
+            euler: An EulerArray object.
+        """
+        x = np.radians(euler.values[..., 0])
+        y = np.radians(euler.values[..., 1])
+        z = np.radians(euler.values[..., 2])
+        order = euler.order
+
+        c1 = np.cos(x / 2)
+        c2 = np.cos(y / 2)
+        c3 = np.cos(z / 2)
+
+        s1 = np.sin(x / 2)
+        s2 = np.sin(y / 2)
+        s3 = np.sin(z / 2)
+
+        if order == 'xyz':
+            q = (s1 * c2 * c3 + c1 * s2 * s3, c1 * s2 * c3 - s1 * c2 * s3, c1 * c2 * s3 + s1 * s2 * c3, c1 * c2 * c3 - s1 * s2 * s3)
+        elif order == 'yxz':
+            q = (s1 * c2 * c3 + c1 * s2 * s3, c1 * s2 * c3 - s1 * c2 * s3, c1 * c2 * s3 - s1 * s2 * c3, c1 * c2 * c3 + s1 * s2 * s3)
+        elif order == 'zxy':
+            q = (s1 * c2 * c3 - c1 * s2 * s3, c1 * s2 * c3 + s1 * c2 * s3, c1 * c2 * s3 + s1 * s2 * c3, c1 * c2 * c3 - s1 * s2 * s3)
+        elif order == 'zyx':
+            q = (s1 * c2 * c3 - c1 * s2 * s3, c1 * s2 * c3 + s1 * c2 * s3, c1 * c2 * s3 - s1 * s2 * c3, c1 * c2 * c3 + s1 * s2 * s3)
+        elif order == 'yzx':
+            q = (s1 * c2 * c3 + c1 * s2 * s3, c1 * s2 * c3 + s1 * c2 * s3, c1 * c2 * s3 - s1 * s2 * c3, c1 * c2 * c3 - s1 * s2 * s3)
+        elif order == 'xzy':
+            q = (s1 * c2 * c3 - c1 * s2 * s3, c1 * s2 * c3 - s1 * c2 * s3, c1 * c2 * s3 + s1 * s2 * c3, c1 * c2 * c3 + s1 * s2 * s3)
+        else:
+            # like Quaternion().set_from_euler, an unknown order leaves the quaternions unrotated
+            q = (np.zeros_like(x), np.zeros_like(x), np.zeros_like(x), np.ones_like(x))
+        self.values = np.stack(q, axis=-1)
+        return self
+
+    def parent(self, parent: Union[Quaternion, QuaternionArray]) -> None:
+        """Rotate self by the parent quaternions.
+
+            parent: A Quaternion or QuaternionArray object to parent.
+        """
+        self.values = self.parented(parent).values
+
+    def parented(self, parent: Union[Quaternion, QuaternionArray]) -> QuaternionArray:
+        """Return quaternions that are self rotated by the parent quaternions.
+
+            parent: A Quaternion or QuaternionArray object to parent.
+        """
+        child = self
+
+        x = parent.w * child.x + parent.x * child.w + parent.y * child.z - parent.z * child.y
+        y = parent.w * child.y - parent.x * child.z + parent.y * child.w + parent.z * child.x
+        z = parent.w * child.z + parent.x * child.y - parent.y * child.x + parent.z * child.w
+        w = parent.w * child.w - parent.x * child.x - parent.y * child.y - parent.z * child.z
+
+        return QuaternionArray(np.stack(np.broadcast_arrays(x, y, z, w), axis=-1))
+
+    def normalize(self) -> None:
+        """Normalize self such that the magnitude of every quaternion is 1.
+        """
+        self.values = self.normalized().values
+
+    def normalized(self) -> QuaternionArray:
+        """Return normalized quaternions from self.
+        """
+        squares = _square(self.values)
+        length = np.sqrt(squares[..., 0] + squares[..., 1] + squares[..., 2] + squares[..., 3])
+        return QuaternionArray(self.values / length[..., np.newaxis])
+
+    def conjugate(self) -> QuaternionArray:
+        """Return the conjugate quaternions"""
+        return QuaternionArray(self.values * np.array([-1.0, -1.0, -1.0, 1.0]))
+
+    def between_vectors(self, v_1: Union[Vector3, Vector3Array], v_2: Union[Vector3, Vector3Array]) -> QuaternionArray:
+        """Set the quaternions as the shortest rotations from v_1 to v_2.
+            v_1: A Vector3 or Vector3Array object
+            v_2: A Vector3 or Vector3Array object
+
+        Rotating v_1 by self.between_vectors(v_1,v_2) yields vectors
+        pointing in the same direction as v_2.
+        """
+        v_1 = Vector3Array.from_vector(v_1)
+        v_2 = Vector3Array.from_vector(v_2)
+        length_1 = v_1.magnitude()[..., np.newaxis]
+        length_2 = v_2.magnitude()[..., np.newaxis]
+
+        # zero vectors have no direction, so they give no rotation
+        zero = (length_1 == 0.0) | (length_2 == 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v1 = Vector3Array(np.where(zero, 0.0, v_1.values / length_1))
+            v2 = Vector3Array(np.where(zero, 0.0, v_2.values / length_2))
+        dot = np.where(zero[..., 0], 1.0, v1.dot_prod(v2))
+
+        # produce a different vector for opposite vectors
+        opposite = v1.cross_prod(Vector3Array(v1.values + 1.0))
+        between = v1.cross_prod(v2)
+
+        same_direction = (dot > 0.99999)[..., np.newaxis]
+        opposite_direction = (dot < -0.99999)[..., np.newaxis]
+
+        values = np.where(opposite_direction,
+                          np.concatenate((opposite.values, np.zeros_like(dot)[..., np.newaxis]), axis=-1),
+                          np.concatenate((between.values, (dot + 1.0)[..., np.newaxis]), axis=-1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = QuaternionArray(values).normalized().values
+        self.values = np.where(same_direction, np.array([0.0, 0.0, 0.0, 1.0]), values)
+
+        return self
+
+    def to_tuple(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return a tuple of the x, y, z and w components of the quaternions.
+        """
+        return self.x, self.y, self.z, self.w
+
+
+class Vector3Array:
+    """An array of 3-dimensional vectors, backed by a NumPy array of shape (..., 3).
+
+    Every operation gives exactly the same result as the matching Vector3 method on each element.
+    Anywhere another vector or quaternion is expected, either a single object or an array with a
+    shape that broadcasts against this one can be used.
+
+    Instance Attributes:
+      - values: The x, y and z components of each vector.
+    """
+    __slots__ = ('values',)
+
+    values: np.ndarray
+
+    def __init__(self, values: np.ndarray = None):
+        """Create a new Vector3Array object.
+
+            values: An array of shape (..., 3) with the x, y and z components.
+        """
+        _check_numpy()
+        self.values = _as_array(values, 3)
+
+    def __neg__(self) -> Vector3Array:
+        """Return vectors with opposite directions.
+        """
+        return Vector3Array(-self.values)
+
+    def __sub__(self, other: Union[Vector3, Vector3Array]) -> Vector3Array:
+        """Return the difference between self and other.
+            other: Vectors to subtract from self.
+        """
+        return Vector3Array(self.values - Vector3Array.from_vector(other).values)
+
+    def __add__(self, other: Union[Vector3, Vector3Array]) -> Vector3Array:
+        """Return the sum of self and other.
+            other: Vectors to add to self.
+        """
+        return Vector3Array(self.values + Vector3Array.from_vector(other).values)
+
+    # constants only
+    def __mul__(self, other: Union[float, np.ndarray]):
+        """Return the product of self and a constant, or an array of constants of shape (..., 1).
+            other: The constants to multiply to self.
+        """
+        return Vector3Array(self.values * other)
+
+    def __rmul__(self, other: Union[float, np.ndarray]):
+        """See __mul__.
+        """
+        return self.__mul__(other)
+
+    def __isub__(self, other: Union[Vector3, Vector3Array]) -> Vector3Array:
+        """Subtract other from self in place.
+            other: Vectors to subtract from self.
+        """
+        self.values -= Vector3Array.from_vector(other).values
+        return self
+
+    def __iadd__(self, other: Union[Vector3, Vector3Array]) -> Vector3Array:
+        """Add other to self in place.
+            other: Vectors to add to self.
+        """
+        self.values += Vector3Array.from_vector(other).values
+        return self
+
+    def __imul__(self, other: Union[float, np.ndarray]) -> Vector3Array:
+        """Multiply self by a constant in place.
+            other: The constants to multiply to self.
+        """
+        self.values *= other
+        return self
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, item) -> Union[Vector3, Vector3Array]:
+        values = self.values[item]
+        if values.ndim == 1:
+            return Vector3(*values.tolist())
+        return Vector3Array(values)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the object for debugging"""
+        return 'Vector3Array({})'.format(self.values)
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.values[..., 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.values[..., 1]
+
+    @property
+    def z(self) -> np.ndarray:
+        return self.values[..., 2]
+
+    @staticmethod
+    def from_vector(vector: Union[Vector3, Vector3Array]) -> Vector3Array:
+        """Return vector as a Vector3Array, so that single vectors can be broadcast against arrays."""
+        if isinstance(vector, Vector3Array):
+            return vector
+        return Vector3Array([vector.x, vector.y, vector.z])
+
+    @staticmethod
+    def from_vectors(vectors: Iterable[Vector3]) -> Vector3Array:
+        """Return a Vector3Array from Vector3 objects."""
+        return Vector3Array([vector.to_tuple() for vector in vectors])
+
+    def to_vectors(self) -> list[Vector3]:
+        """Return the vectors as a flat list of Vector3 objects."""
+        return [Vector3(*vector) for vector in self.values.reshape(-1, 3).tolist()]
+
+    def magnitude(self) -> np.ndarray:
+        """Return the magnitude of each vector"""
+        squares = _square(self.values)
+        return np.sqrt(squares[..., 0] + squares[..., 1] + squares[..., 2])
+
+    def copy(self) -> Vector3Array:
+        """Return a copy of the vectors"""
+        return Vector3Array(self.values.copy())
+
+    def normalize(self) -> None:
+        """Normalize the vectors. Zero vectors become NaN."""
+        self.values = self.normalized().values
+
+    def normalized(self) -> Vector3Array:
+        """Return a normalized version of these vectors. Zero vectors become NaN."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return Vector3Array(self.values / self.magnitude()[..., np.newaxis])
+
+    def dot_prod(self, other: Union[Vector3, Vector3Array]) -> np.ndarray:
+        """Return the dot product of self and other.
+            other: The other vectors
+        """
+        other = Vector3Array.from_vector(other)
+        return self.x * other.x + self.y * other.y + self.z * other.z
+
+    def cross_prod(self, other: Union[Vector3, Vector3Array]) -> Vector3Array:
+        """Return the cross product of self and other.
+            other: The second vectors
+        """
+        other = Vector3Array.from_vector(other)
+        i = self.y * other.z - self.z * other.y
+        j = self.z * other.x - self.x * other.z
+        k = self.x * other.y - self.y * other.x
+        return Vector3Array(np.stack(np.broadcast_arrays(i, j, k), axis=-1))
+
+    def rotate_by_quaternion(self, quaternion: Union[Quaternion, QuaternionArray]):
+        """Rotate self by quaternion.
+            quaternion: A Quaternion or QuaternionArray object.
+        """
+        self.values = self.rotated_by_quaternion(quaternion).values
+
+    def rotated_by_quaternion(self, quaternion: Union[Quaternion, QuaternionArray]) -> Vector3Array:
+        """Return a rotated version of self by quaternion.
+            quaternion: A Quaternion or QuaternionArray object.
+        """
+        length = self.magnitude()[..., np.newaxis]
+
+        a = quaternion.w
+        b = quaternion.x
+        c = quaternion.y
+        d = quaternion.z
+
+        r11 = a * a + b * b - c * c - d * d
+        r21 = 2 * b * c + 2 * a * d
+        r31 = 2 * b * d - 2 * a * c
+        r12 = 2 * b * c - 2 * a * d
+        r22 = a * a - b * b + c * c - d * d
+        r32 = 2 * c * d + 2 * a * b
+        r13 = 2 * b * d + 2 * a * c
+        r23 = 2 * c * d - 2 * a * b
+        r33 = a * a - b * b - c * c + d * d
+
+        if isinstance(quaternion, QuaternionArray):
+            r11, r21, r31, r12, r22, r32, r13, r23, r33 = (r[..., np.newaxis] for r in (r11, r21, r31, r12, r22, r32, r13, r23, r33))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            normalized = self.values / length
+
+        i = normalized[..., 0:1]
+        j = normalized[..., 1:2]
+        k = normalized[..., 2:3]
+
+        rotated = np.concatenate(np.broadcast_arrays(i * r11 + j * r12 + k * r13,
+                                                     i * r21 + j * r22 + k * r23,
+                                                     i * r31 + j * r32 + k * r33), axis=-1) * length
+
+        return Vector3Array(np.where(length == 0.0, 0.0, rotated))
+
+    def to_tuple(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return a tuple of the x, y and z components of the vectors"""
+        return self.x, self.y, self.z
+
+
+def _check_numpy() -> None:
+    if np is None:
+        raise ImportError('NumPy is required to use the array math objects.')
+
+
+def _as_array(values, size: int) -> np.ndarray:
+    """Return values as a float64 array of shape (..., size). None gives an empty array."""
+    if values is None:
+        return np.empty((0, size))
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 0 or values.shape[-1] != size:
+        raise Exception('Expected an array of shape (..., ' + str(size) + '), got ' + str(values.shape) + '!')
+    return values
+
+
+def _square(values: np.ndarray) -> np.ndarray:
+    """Square each value the way Python's float ** 2 does.
+
+    float ** 2 goes through libm's pow, which is not always equal to x * x in the last bit.
+    """
+    return np.fromiter(map(math.pow, values.ravel().tolist(), itertools.repeat(2.0)), dtype=np.float64, count=values.size).reshape(values.shape)
+
+
+def _apply(function: Callable[..., float], *arrays: np.ndarray) -> np.ndarray:
+    """Call a function from math on each element of the arrays.
+
+    NumPy's trigonometric functions are not always equal to math's in the last bit.
+    """
+    arrays = np.broadcast_arrays(*arrays)
+    return np.array(list(map(function, *(array.ravel().tolist() for array in arrays))), dtype=np.float64).reshape(arrays[0].shape)
+
+
+def _apply_where(condition: np.ndarray, function: Callable[..., float],
+                 if_true: tuple[np.ndarray, ...], if_false: Union[tuple[np.ndarray, ...], None]) -> np.ndarray:
+    """Return function applied to the if_true arguments where condition is true, and to the if_false arguments
+    (or 0.0 if it is None) everywhere else. The function is only called on the elements that need it."""
+    result = np.zeros(condition.shape)
+    result[condition] = _apply(function, *(argument[condition] for argument in if_true))
+    if if_false is not None:
+        result[~condition] = _apply(function, *(argument[~condition] for argument in if_false))
+    return result
@@ -71,6 +71,7 @@ def create_search_function(path: str, function_path: str, selector_objective: st
             left = cutoff_points[i]
             right = cutoff_points[i + 1] - 1
         except IndexError:
+            f.close()
             continue
 
         if left == right:
@@ -88,7 +89,8 @@ def create_search_function(path: str, function_path: str, selector_objective: st
                 f.write('\n')
                 f.close()
             else:
-                length = sum(1 for _ in open(search_path, 'r'))
+                with open(search_path, 'r') as search_file:
+                    length = sum(1 for _ in search_file)
 
                 command += 'function ' + function_path + f_name + '_run' + str(length) + '\n'
                 command = command.replace(' run execute', '')
@@ -96,10 +98,8 @@ def create_search_function(path: str, function_path: str, selector_objective: st
                 f.close()
 
                 search_path_2 = os.path.join(path, f_name + '_run' + str(length) + '.mcfunction')
-                f = open(search_path_2, 'a')
-                for command in new_command:
-                    command = command.replace(' run execute', '')
-                    f.write(command + '\n')
+                with open(search_path_2, 'a') as f:
+                    f.write(''.join(command.replace(' run execute', '') + '\n' for command in new_command))
         else:
             if i == 0:
                 pass_domain = (continue_domain[0], False)
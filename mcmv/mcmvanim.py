@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Union, Iterator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from mcmv.armature_objects import ArmatureModel, ArmatureAnimation, ArmatureAnimationStream, ArmatureFrame, ArmatureFrameArray, Joint
+from mcmv.math_objects import Vector3, Quaternion
+
+# A .mcmvanim file contains:
+#   - PREAMBLE: magic bytes, format version, size of the header, number of frames
+#   - a JSON header with the name, fps, joint hierarchy and the names of the animated joints
+#   - padding up to a multiple of ALIGNMENT
+#   - one block of little-endian float32 values per frame, with the offset (x, y, z) and rotation (x, y, z, w)
+#     of every animated joint
+MAGIC = b'MCMVANIM'
+VERSION = 1
+PREAMBLE = struct.Struct('<8sIIQ')
+ALIGNMENT = 16
+
+
+def _get_data_start(header_size: int) -> int:
+    """Return the offset of the first frame in the file."""
+    return (PREAMBLE.size + header_size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class McmvAnimExporter:
+    """Writes an armature model and animation to a .mcmvanim file, which can be loaded back without parsing."""
+
+    @staticmethod
+    def write_animation(file_path: str, model: ArmatureModel, animation: Union[ArmatureAnimation, ArmatureAnimationStream]):
+        """Write the file. The channels are the joints of the first frame, so every frame must have the same joints
+        (in any order). The file is only replaced once every frame has been written."""
+        # parents must come before their children
+        joints = [model.root]
+        for joint in joints:
+            joints.extend(joint.children.values())
+        joint_indices = {joint.name: i for i, joint in enumerate(joints)}
+
+        frames = iter(animation)
+        first_frame = next(frames, None)
+        if first_frame is None:
+            channel_names = []
+        else:
+            channel_names = list(first_frame.joint_channels)
+
+        header = json.dumps({
+            'name': model.name,
+            'fps': animation.fps,
+            'joints': [[joint.name, -1 if joint.parent is None else joint_indices[joint.parent.name], list(joint.initial_offset.to_tuple())]
+                       for joint in joints],
+            'channels': channel_names
+        }).encode('utf-8')
+
+        temporary_path = file_path + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with open(temporary_path, 'wb') as file:
+                file.write(PREAMBLE.pack(MAGIC, VERSION, len(header), 0))
+                file.write(header)
+                file.write(bytes(_get_data_start(len(header)) - PREAMBLE.size - len(header)))
+
+                frame_count = 0
+                if first_frame is not None:
+                    for frame in itertools.chain((first_frame,), frames):
+                        joint_channels = frame.joint_channels
+                        if len(joint_channels) != len(channel_names) or not all(joint_name in joint_channels for joint_name in channel_names):
+                            raise Exception('Frame ' + str(frame_count) + ' does not have the same joints as the first frame! '
+                                            'Every frame of a .mcmvanim file must have the same joints.')
+
+                        values = array('f')
+                        for joint_name in channel_names:
+                            offset, rotation = joint_channels[joint_name]
+                            values.extend((offset.x, offset.y, offset.z, rotation.x, rotation.y, rotation.z, rotation.w))
+                        if sys.byteorder == 'big':
+                            values.byteswap()
+                        file.write(values.tobytes())
+                        frame_count += 1
+
+                # the number of frames is only known once they have all been written
+                file.seek(0)
+                file.write(PREAMBLE.pack(MAGIC, VERSION, len(header), frame_count))
+            os.replace(temporary_path, file_path)
+        except BaseException:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            raise
+
+
+class McmvAnimFileLoader:
+    """Loads an armature model and animation from a .mcmvanim file.
+
+    With NumPy, the frames of the animation are an ArmatureFrameArray over a memory map of the file, so nothing is
+    parsed or copied, and they are only read from the file when they are used. The map belongs to the animation, so
+    the loader can be closed once the animation has been loaded.
+    """
+    frame_count: int
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+        with open(file_path, 'rb') as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_size, self.frame_count = PREAMBLE.unpack_from(self._data)
+        if magic != MAGIC:
+            raise Exception(file_path + ' is not a .mcmvanim file!')
+        if version != VERSION:
+            raise Exception(file_path + ' has an unsupported .mcmvanim version (' + str(version) + ')!')
+
+        self._header = json.loads(self._data[PREAMBLE.size:PREAMBLE.size + header_size].decode('utf-8'))
+        self._data_start = _get_data_start(header_size)
+        self._frame_size = len(self._header['channels']) * 7 * 4
+
+    def close(self):
+        """Close the loader's map of the file. Animations that were already loaded can still be used."""
+        self._data.close()
+
+    def __enter__(self) -> McmvAnimFileLoader:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_model(self) -> ArmatureModel:
+        new_armature = ArmatureModel(self._header['name'])
+
+        joint_names = [name for name, _, _ in self._header['joints']]
+        for name, parent, offset in self._header['joints']:
+            new_joint = Joint(name)
+            new_joint.initial_offset = Vector3(*offset)
+            if parent == -1:
+                new_armature.add_joint(new_joint)
+            else:
+                new_armature.add_joint(new_joint, joint_names[parent])
+        return new_armature
+
+    def get_frame(self, frame_number: int) -> ArmatureFrame:
+        """Return a single frame of the animation. Negative values count from the end."""
+        if frame_number < 0:
+            frame_number += self.frame_count
+        if not 0 <= frame_number < self.frame_count:
+            raise IndexError('Frame ' + str(frame_number) + ' is out of range!')
+
+        start = self._data_start + frame_number * self._frame_size
+        return self._get_frame_from_bytes(self._data[start:start + self._frame_size])
+
+    def _get_frame_from_bytes(self, data: bytes) -> ArmatureFrame:
+        values = array('f')
+        values.frombytes(data)
+        if sys.byteorder == 'big':
+            values.byteswap()
+
+        new_frame = ArmatureFrame()
+        for i, joint_name in enumerate(self._header['channels']):
+            new_frame.joint_channels[joint_name] = (Vector3(*values[i * 7:i * 7 + 3]), Quaternion(*values[i * 7 + 3:i * 7 + 7]))
+        return new_frame
+
+    def _iter_frames(self, start_frame: int, end_frame: int) -> Iterator[ArmatureFrame]:
+        # the file is opened again, so that the stream doesn't depend on the loader
+        with open(self.file_path, 'rb') as file:
+            file.seek(self._data_start + start_frame * self._frame_size)
+            for _ in range(start_frame, end_frame):
+                yield self._get_frame_from_bytes(file.read(self._frame_size))
+
+    def get_animation(self, start_frame: int = 0, max_frames: int = None) -> Union[ArmatureAnimation, ArmatureAnimationStream]:
+        """Return the animation. With NumPy, its frames are an ArmatureFrameArray over the frames in the file (see
+        get_frames_array). Without it, the animation is a stream that reads each frame from the file while it is
+        being iterated over."""
+        start_frame = min(start_frame, self.frame_count)
+        end_frame = self.frame_count
+        if max_frames is not None and max_frames >= 0:
+            end_frame = min(end_frame, start_frame + max_frames)
+
+        if np is None:
+            return ArmatureAnimationStream(self._header['fps'], lambda: self._iter_frames(start_frame, end_frame))
+
+        animation = ArmatureAnimation(self._header['fps'])
+        animation.frames = ArmatureFrameArray(self._header['channels'], self.get_frames_array()[start_frame:end_frame])
+        return animation
+
+    def get_frames_array(self) -> np.ndarray:
+        """Return every frame as a read-only (frames x joints x 7) float32 array backed directly by the file. The
+        array has its own map of the file, so it can still be used after the loader is closed."""
+        if np is None:
+            raise ImportError('NumPy is required to get the frames as an array.')
+
+        shape = (self.frame_count, len(self._header['channels']), 7)
+        if self.frame_count == 0 or not self._header['channels']:
+            # an empty range of the file can't be mapped
+            return np.empty(shape, dtype='<f4')
+        return np.memmap(self.file_path, dtype='<f4', mode='r', offset=self._data_start, shape=shape)
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import math
+from typing import Union, Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from mcmv.armature_objects import ArmatureFrame, ArmatureFrameArray, ArmatureFrameView
+
+# the three smallest components of a unit quaternion are within +-ROTATION_LIMIT, and are stored as 16-bit
+# fixed point numbers in that range (with an odd number of codes, so that 0 is one of them)
+ROTATION_LIMIT = 1 / math.sqrt(2)
+ROTATION_STEP = 2 * ROTATION_LIMIT / 65534
+
+# the most bits an offset component can be quantized to
+MAX_POSITION_BITS = 32
+
+
+def _get_other_components() -> np.ndarray:
+    """Return the indices of the three other components for each component of a quaternion."""
+    return np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]], dtype=np.intp)
+
+
+def _pack_bits(codes: np.ndarray, bits: int) -> np.ndarray:
+    """Return the codes (frames x columns) of bits bits each packed into bytes, one row of bytes per frame."""
+    code_bits = (codes.astype(np.uint64)[..., np.newaxis] >> np.arange(bits, dtype=np.uint64)) & 1
+    return np.packbits(code_bits.astype(np.uint8).reshape(codes.shape[0], codes.shape[1] * bits), axis=1, bitorder='little')
+
+
+def _unpack_bits(packed: np.ndarray, columns: int, bits: int) -> np.ndarray:
+    """Return the codes (frames x columns) of bits bits each from the bytes created by _pack_bits."""
+    code_bits = np.unpackbits(packed, axis=1, count=columns * bits, bitorder='little').reshape(len(packed), columns, bits)
+    return code_bits @ (np.uint64(1) << np.arange(bits, dtype=np.uint64))
+
+
+class QuantizedFrameArray:
+    """The frames of an ArmatureAnimation compressed in memory, for keeping many long animations loaded at once.
+    Like ArmatureFrameArray, indexing gives an ArmatureFrameView of a frame and slicing gives another
+    QuantizedFrameArray that shares the compressed values, and every frame has a channel for the same joints.
+
+    Rotations are stored with smallest-three packing: the largest component (by absolute value) is left out, and the
+    other three are stored as 16-bit fixed point numbers, along with 2 bits for the index of the one that was left
+    out. It is computed again from the other three when decoding, since the rotation has a length of 1. Rotations are
+    negated where needed to make that component positive, since q and -q are the same rotation. Joints that never
+    rotate are only stored once, and so is the index for joints where it's always the same.
+
+    Each component of the offsets is quantized to the range it covers in the animation, with the fewest bits that
+    keep it within position_tolerance, and the components with the same number of bits are packed together.
+    Components that stay within position_tolerance of one value aren't stored per frame at all.
+
+    The tolerances are for each channel as it is stored (each component of the offset and rotation of a joint
+    relative to its parent), not for the bones that are exported. The global transformation of a joint adds up the
+    errors of every joint above it, so it can be off by several times the tolerances at the end of a long limb.
+
+    Frames are decoded for blocks of block_size frames at once.
+
+    Instance Attributes:
+      - channel_names: The name of the joint of each channel.
+      - position_tolerance: The largest error allowed in each component of an offset (relative to the parent joint).
+      - rotation_tolerance: The largest error allowed in each component of a rotation (relative to the parent joint).
+      - position_error: The largest error in any component of an offset once it was quantized.
+      - rotation_error: The largest error in any component of a rotation once it was quantized (not counting the
+        sign of the rotation).
+      - block_size: The number of frames that are decoded at once while iterating.
+    """
+    channel_names: list[str]
+    position_tolerance: float
+    rotation_tolerance: float
+    position_error: float
+    rotation_error: float
+    block_size: int
+
+    def __init__(self, channel_names: list[str], position_tolerance: float, rotation_tolerance: float, block_size: int = 256):
+        self.channel_names = channel_names
+        self.position_tolerance = position_tolerance
+        self.rotation_tolerance = rotation_tolerance
+        self.position_error = 0.0
+        self.rotation_error = 0.0
+        self.block_size = block_size
+
+        self._frame_count = 0
+        # (columns, bits, packed codes (frames x bytes), minimums, steps) of the offset components with each number of bits
+        self._position_groups = []
+        # (columns, values) of the offset components that never change
+        self._position_constants = (np.empty(0, dtype=np.intp), np.empty(0))
+        # the joints that rotate, with the three smallest components (frames x joints x 3), the index of the largest one
+        # in the first frame, and the packed index in every frame (frames x bytes) of the joints where it changes
+        self._rotation_joints = np.empty(0, dtype=np.intp)
+        self._rotation_codes = np.empty((0, 0, 3), dtype=np.uint16)
+        self._rotation_first_indices = np.empty(0, dtype=np.uint8)
+        self._rotation_index_joints = np.empty(0, dtype=np.intp)
+        self._rotation_indices = np.empty((0, 0), dtype=np.uint8)
+        # (joints, codes, index of the largest component) of the joints that never rotate
+        self._rotation_constants = (np.empty(0, dtype=np.intp), np.empty((0, 3), dtype=np.uint16), np.empty(0, dtype=np.uint8))
+
+    @staticmethod
+    def from_frames(frames: Union[Iterable[ArmatureFrame], ArmatureFrameArray], position_tolerance: float = 0.0001,
+                    rotation_tolerance: float = 0.0001, block_size: int = 256) -> QuantizedFrameArray:
+        """Return the frames quantized within the tolerances, which are checked for every channel (not for the global
+        transformation of each joint). The channels are the joints of the first frame, so every frame must have the
+        same joints, and every rotation must be a unit quaternion. Raise an Exception if the channels can't be quantized
+        within the tolerances."""
+        if np is None:
+            raise ImportError('NumPy is required to quantize the frames of an animation.')
+
+        if not isinstance(frames, ArmatureFrameArray):
+            frames = ArmatureFrameArray.from_frames(frames, 'float64')
+        values = frames.values.astype(np.float64)
+        frame_count, joint_count = values.shape[0:2]
+
+        quantized_frames = QuantizedFrameArray(frames.channel_names, position_tolerance, rotation_tolerance, block_size)
+        quantized_frames._frame_count = frame_count
+
+        # offsets
+        offsets = values[..., 0:3].reshape(frame_count, joint_count * 3)
+        if frame_count > 0:
+            minimums = offsets.min(axis=0)
+            ranges = offsets.max(axis=0) - minimums
+        else:
+            minimums = ranges = np.zeros(joint_count * 3)
+
+        # the middle of the range is within half of it of every value
+        constant = ranges / 2 <= position_tolerance
+        constant_columns = np.flatnonzero(constant)
+        quantized_frames._position_constants = (constant_columns, minimums[constant_columns] + ranges[constant_columns] / 2)
+
+        # rounding to the nearest of 2 ** bits codes is off by at most half a step
+        with np.errstate(divide='ignore'):
+            column_bits = np.ceil(np.log2(ranges / (2 * position_tolerance) + 1))
+        column_bits = np.where(constant, 0, column_bits)
+        if (column_bits > MAX_POSITION_BITS).any():
+            raise Exception('The offsets can\'t be quantized within a position_tolerance of ' + str(position_tolerance) + '!')
+
+        for bits in np.unique(column_bits[~constant]).astype(int).tolist():
+            columns = np.flatnonzero(column_bits == bits)
+            steps = ranges[columns] / (2 ** bits - 1)
+            codes = np.rint((offsets[:, columns] - minimums[columns]) / steps)
+            quantized_frames._position_groups.append((columns, bits, _pack_bits(codes, bits), minimums[columns], steps))
+
+        # rotations
+        rotations = values[..., 3:7]
+        largest_index = np.argmax(np.abs(rotations), axis=-1)
+        largest = np.take_along_axis(rotations, largest_index[..., np.newaxis], axis=-1)
+        rotations = np.where(largest < 0, -rotations, rotations)
+        values[..., 3:7] = rotations
+        smallest = np.take_along_axis(rotations, _get_other_components()[largest_index], axis=-1)
+        codes = np.rint((np.clip(smallest, -ROTATION_LIMIT, ROTATION_LIMIT) + ROTATION_LIMIT) / ROTATION_STEP).astype(np.uint16)
+
+        constant = (codes == codes[:1]).all(axis=(0, 2)) & (largest_index == largest_index[:1]).all(axis=0) & (frame_count > 0)
+        constant_joints = np.flatnonzero(constant)
+        quantized_frames._rotation_constants = (constant_joints, codes[:1, constant_joints].reshape(-1, 3),
+                                                largest_index[:1, constant_joints].reshape(-1).astype(np.uint8))
+
+        rotation_joints = np.flatnonzero(~constant)
+        quantized_frames._rotation_joints = rotation_joints
+        quantized_frames._rotation_codes = codes[:, rotation_joints]
+        largest_index = largest_index[:, rotation_joints]
+        index_joints = np.flatnonzero((largest_index != largest_index[:1]).any(axis=0))
+        quantized_frames._rotation_first_indices = (largest_index[0] if frame_count > 0 else np.zeros(len(rotation_joints))).astype(np.uint8)
+        quantized_frames._rotation_index_joints = index_joints
+        quantized_frames._rotation_indices = _pack_bits(largest_index[:, index_joints], 2)
+
+        # the largest component is only as accurate as the rotation is close to a length of 1, so the errors are measured
+        for start in range(0, frame_count, block_size):
+            errors = np.abs(quantized_frames.get_values(start, start + block_size) - values[start:start + block_size])
+            quantized_frames.position_error = max(quantized_frames.position_error, float(errors[..., 0:3].max(initial=0.0)))
+            quantized_frames.rotation_error = max(quantized_frames.rotation_error, float(errors[..., 3:7].max(initial=0.0)))
+        if quantized_frames.rotation_error > rotation_tolerance:
+            raise Exception('The rotations can\'t be quantized within a rotation_tolerance of ' + str(rotation_tolerance) +
+                            ' (the error is ' + str(quantized_frames.rotation_error) + ', are they all unit quaternions?)')
+
+        return quantized_frames
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes taken up by the compressed values."""
+        return (sum(columns.nbytes + packed.nbytes + minimums.nbytes + steps.nbytes for columns, _, packed, minimums, steps in self._position_groups) +
+                sum(array.nbytes for array in self._position_constants) + sum(array.nbytes for array in self._rotation_constants) +
+                self._rotation_joints.nbytes + self._rotation_codes.nbytes + self._rotation_first_indices.nbytes +
+                self._rotation_index_joints.nbytes + self._rotation_indices.nbytes)
+
+    def get_values(self, start: int = 0, end: int = None) -> np.ndarray:
+        """Return the offset (x, y, z) and rotation (x, y, z, w) of each joint in the frames from start up to end,
+        decoded into a (frames x joints x 7) array."""
+        frame_slice = slice(start, end)
+        frame_count = len(range(*frame_slice.indices(self._frame_count)))
+        joint_count = len(self.channel_names)
+
+        offsets = np.empty((frame_count, joint_count * 3))
+        constant_columns, constants = self._position_constants
+        offsets[:, constant_columns] = constants
+        for columns, bits, packed, minimums, steps in self._position_groups:
+            offsets[:, columns] = _unpack_bits(packed[frame_slice], len(columns), bits) * steps + minimums
+
+        rotations = np.empty((frame_count, joint_count, 4))
+        constant_joints, constant_codes, constant_indices = self._rotation_constants
+        rotations[:, constant_joints] = QuantizedFrameArray._decode_rotations(constant_codes, constant_indices)
+        largest_index = np.tile(self._rotation_first_indices, (frame_count, 1))
+        largest_index[:, self._rotation_index_joints] = _unpack_bits(self._rotation_indices[frame_slice], len(self._rotation_index_joints), 2)
+        rotations[:, self._rotation_joints] = QuantizedFrameArray._decode_rotations(self._rotation_codes[frame_slice], largest_index)
+
+        return np.concatenate((offsets.reshape(frame_count, joint_count, 3), rotations), axis=-1)
+
+    @staticmethod
+    def _decode_rotations(codes: np.ndarray, largest_index: np.ndarray) -> np.ndarray:
+        """Return the rotations (... x 4) from the codes of their three smallest components (... x 3) and the index of
+        their largest one."""
+        smallest = codes * ROTATION_STEP - ROTATION_LIMIT
+        largest_index = largest_index.astype(np.intp)
+        largest = np.sqrt(np.maximum(1.0 - np.sum(smallest * smallest, axis=-1), 0.0))
+
+        rotations = np.empty(codes.shape[:-1] + (4,))
+        np.put_along_axis(rotations, _get_other_components()[largest_index], smallest, axis=-1)
+        np.put_along_axis(rotations, largest_index[..., np.newaxis], largest[..., np.newaxis], axis=-1)
+        return rotations
+
+    def __len__(self) -> int:
+        return self._frame_count
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[ArmatureFrameView, QuantizedFrameArray]:
+        if isinstance(index, slice):
+            new_frames = QuantizedFrameArray(self.channel_names, self.position_tolerance, self.rotation_tolerance, self.block_size)
+            new_frames.position_error = self.position_error
+            new_frames.rotation_error = self.rotation_error
+            new_frames._frame_count = len(range(*index.indices(self._frame_count)))
+            new_frames._position_groups = [(columns, bits, packed[index], minimums, steps) for columns, bits, packed, minimums, steps in self._position_groups]
+            new_frames._position_constants = self._position_constants
+            new_frames._rotation_joints = self._rotation_joints
+            new_frames._rotation_codes = self._rotation_codes[index]
+            new_frames._rotation_first_indices = self._rotation_first_indices
+            new_frames._rotation_index_joints = self._rotation_index_joints
+            new_frames._rotation_indices = self._rotation_indices[index]
+            new_frames._rotation_constants = self._rotation_constants
+            return new_frames
+
+        if index < 0:
+            index += self._frame_count
+        if not 0 <= index < self._frame_count:
+            raise IndexError('Frame ' + str(index) + ' is out of range!')
+        return ArmatureFrameView(self.channel_names, self.get_values(index, index + 1)[0])
+
+    def __iter__(self) -> Iterator[ArmatureFrameView]:
+        channel_names = self.channel_names
+        for start in range(0, self._frame_count, self.block_size):
+            for frame_values in self.get_values(start, start + self.block_size):
+                yield ArmatureFrameView(channel_names, frame_values)
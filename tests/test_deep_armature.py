@@ -0,0 +1,179 @@
+import math
+import multiprocessing
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from mcmv.armature_formatter import ArmatureFormatter, MinecraftModelCreator
+from mcmv.armature_objects import ArmatureModel, ArmatureFrame, Joint, Skeleton, VisibleBone, MinecraftModel
+from mcmv.converter import RetargetPlan
+from mcmv.math_objects import Vector3, Quaternion, Euler
+
+# far deeper than the default recursion limit, so any recursive traversal fails
+JOINT_COUNT = 10000
+SEGMENT_LENGTH = 0.1
+# the rotation of every segment relative to its parent, around z (degrees)
+SEGMENT_ANGLE = 0.01
+
+
+@pytest.fixture(autouse=True)
+def default_recursion_limit():
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(1000)
+    yield
+    sys.setrecursionlimit(limit)
+
+
+def get_chain_model() -> ArmatureModel:
+    """Return a model that is a single chain of JOINT_COUNT segments along y, like benchmark.get_chain_animation."""
+    model = ArmatureModel('chain')
+    model.add_joint(Joint('mcmv_root_chain'))
+    parent_name = model.root.name
+    for i in range(JOINT_COUNT):
+        new_joint = Joint('segment_' + str(i))
+        new_joint.initial_offset = Vector3(0.0, SEGMENT_LENGTH, 0.0)
+        model.add_joint(new_joint, parent_name)
+        parent_name = new_joint.name
+    return model
+
+
+def get_bent_chain_model() -> ArmatureModel:
+    """Return the chain with every segment rotated by SEGMENT_ANGLE around z, so it bends into an arc."""
+    model = get_chain_model()
+    frame = ArmatureFrame()
+    rotation = Quaternion().set_from_euler(Euler('xyz', 0.0, 0.0, SEGMENT_ANGLE))
+    for i in range(JOINT_COUNT):
+        frame.joint_channels['segment_' + str(i)] = (Vector3(0.0, SEGMENT_LENGTH, 0.0), rotation)
+    ArmatureFormatter.set_frame(model, frame)
+    return model
+
+
+def get_arc_point(i: int) -> Vector3:
+    """Return where the end of segment i of the bent chain is: each segment is rotated by the angle of every segment
+    before it (its own rotation only turns the segments after it)."""
+    angle = math.radians(SEGMENT_ANGLE)
+    x = -SEGMENT_LENGTH * sum(math.sin(k * angle) for k in range(i + 1))
+    y = SEGMENT_LENGTH * sum(math.cos(k * angle) for k in range(i + 1))
+    return Vector3(x, y, 0.0)
+
+
+def test_skeleton_order():
+    model = get_chain_model()
+    skeleton = Skeleton(model.root)
+
+    assert len(skeleton) == JOINT_COUNT + 1
+    assert skeleton.names == ['mcmv_root_chain'] + ['segment_' + str(i) for i in range(JOINT_COUNT)]
+    assert skeleton.parents == list(range(-1, JOINT_COUNT))
+    assert skeleton.depths == list(range(JOINT_COUNT + 1))
+    assert skeleton.levels == [(i, i + 1) for i in range(JOINT_COUNT + 1)]
+
+
+def test_copy():
+    model = get_chain_model()
+    new_model = model.copy()
+
+    assert list(new_model.joints) == list(model.joints)
+    assert Skeleton(new_model.root).names == Skeleton(model.root).names
+    for name, joint in model.joints.items():
+        new_joint = new_model.joints[name]
+        assert new_joint is not joint
+        assert (new_joint.parent is None) == (joint.parent is None)
+        if joint.parent is not None:
+            assert new_joint.parent is new_model.joints[joint.parent.name]
+        assert list(new_joint.children) == list(joint.children)
+
+
+def test_pickle():
+    model = get_bent_chain_model()
+    new_model = pickle.loads(pickle.dumps(model))
+
+    skeleton = Skeleton(model.root)
+    new_skeleton = Skeleton(new_model.root)
+    assert new_model.name == model.name
+    assert new_skeleton.names == skeleton.names
+    assert new_skeleton.parents == skeleton.parents
+    for joint, new_joint in zip(skeleton.nodes, new_skeleton.nodes):
+        assert new_joint.initial_offset.to_tuple() == joint.initial_offset.to_tuple()
+        assert new_joint.animation_offset.to_tuple() == joint.animation_offset.to_tuple()
+        assert new_joint.animation_rotation.to_tuple() == joint.animation_rotation.to_tuple()
+
+
+def test_create_bones():
+    model = get_chain_model()
+    m = MinecraftModelCreator()
+    m.create_bones(model)
+    minecraft_model = m.minecraft_model
+
+    assert list(minecraft_model.bones) == list(model.joints)
+    skeleton = minecraft_model.get_skeleton()
+    assert skeleton.names == Skeleton(model.root).names
+    assert skeleton.parents == list(range(-1, JOINT_COUNT))
+    for bone in skeleton.nodes[1:]:
+        assert isinstance(bone, VisibleBone)
+        assert bone.size.is_close(Vector3(0.0, SEGMENT_LENGTH, 0.0), 1e-12)
+
+
+def test_get_model_global():
+    model = get_bent_chain_model()
+    model_global = ArmatureFormatter.get_model_global(model)
+
+    assert len(model_global) == JOINT_COUNT + 1
+    angle = math.radians(SEGMENT_ANGLE)
+    for i in (0, 1, 100, JOINT_COUNT // 2, JOINT_COUNT - 1):
+        translation, rotation = model_global['segment_' + str(i)]
+        expected_rotation = Quaternion(0.0, 0.0, math.sin((i + 1) * angle / 2), math.cos((i + 1) * angle / 2))
+        assert translation.is_close(get_arc_point(i), 1e-6)
+        assert rotation.is_close(expected_rotation, 1e-9)
+
+
+def test_retarget_plan_apply():
+    model = get_bent_chain_model()
+    m = MinecraftModelCreator()
+    m.create_bones(model)
+    minecraft_model = m.minecraft_model
+
+    RetargetPlan(minecraft_model, model, None).apply(*ArmatureFormatter.get_model_global_lists(model))
+
+    # each bone is rotated by the joint it starts from, so every bone after the first turns by one segment's angle
+    segment_rotation = Quaternion().set_from_euler(Euler('xyz', 0.0, 0.0, SEGMENT_ANGLE))
+    assert minecraft_model.bones['segment_0'].local_animation_rotation.is_close(Quaternion(), 1e-9)
+    for i in range(1, JOINT_COUNT):
+        assert minecraft_model.bones['segment_' + str(i)].local_animation_rotation.is_close(segment_rotation, 1e-9)
+
+
+def get_retarget_plan(model: ArmatureModel) -> RetargetPlan:
+    m = MinecraftModelCreator()
+    m.create_bones(model)
+    return RetargetPlan(m.minecraft_model, model, None)
+
+
+def get_bone_rotations(plan: RetargetPlan) -> list[tuple[float, float, float, float]]:
+    """Return the local rotation of every bone when the plan is applied to its own model, in a spawned process."""
+    pose = plan.evaluate(*ArmatureFormatter.get_model_global_lists(plan.model))
+    return [rotation.to_tuple() for rotation in pose.rotations]
+
+
+def test_pickle_retarget_plan():
+    plan = get_retarget_plan(get_bent_chain_model())
+    new_plan = pickle.loads(pickle.dumps(plan))
+
+    new_minecraft_model = new_plan.minecraft_model
+    assert isinstance(new_minecraft_model, MinecraftModel)
+    assert list(new_minecraft_model.bones) == list(plan.minecraft_model.bones)
+    assert new_minecraft_model.get_skeleton().parents == plan.minecraft_model.get_skeleton().parents
+    assert new_plan.rest_pose.skeleton is new_minecraft_model.get_skeleton()
+    for bone, new_bone in zip(plan.minecraft_model.get_skeleton().nodes, new_minecraft_model.get_skeleton().nodes):
+        assert type(new_bone) is type(bone)
+        assert new_bone.size.to_tuple() == bone.size.to_tuple()
+        assert new_bone.offset.to_tuple() == bone.offset.to_tuple()
+    assert get_bone_rotations(new_plan) == get_bone_rotations(plan)
+
+
+def test_spawn_retarget_plan():
+    plan = get_retarget_plan(get_bent_chain_model())
+
+    # spawned processes get the plan pickled, as on Windows and macOS
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        assert executor.submit(get_bone_rotations, plan).result() == get_bone_rotations(plan)
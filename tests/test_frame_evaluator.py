@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+
+from mcmv.armature_formatter import MinecraftModelCreator
+from mcmv.armature_objects import ArmatureModel, ArmatureAnimation, ArmatureFrame, Joint
+from mcmv.converter import RetargetPlan, IncrementalFK
+from mcmv.frame_evaluator import FrameEvaluator, PoseCache
+from mcmv.math_objects import Vector3, Quaternion, Euler
+
+# deeper than the default recursion limit, so the plan can only be sent to the processes if it is pickled flat
+JOINT_COUNT = 1500
+FRAME_COUNT = 70
+SEGMENT_LENGTH = 0.1
+
+
+def get_chain_model(joint_count: int = JOINT_COUNT) -> ArmatureModel:
+    model = ArmatureModel('chain')
+    model.add_joint(Joint('mcmv_root_chain'))
+    parent_name = model.root.name
+    for i in range(joint_count):
+        new_joint = Joint('segment_' + str(i))
+        new_joint.initial_offset = Vector3(0.0, SEGMENT_LENGTH, 0.0)
+        model.add_joint(new_joint, parent_name)
+        parent_name = new_joint.name
+    return model
+
+
+def get_chain_animation() -> ArmatureAnimation:
+    """Return an animation of the chain where every segment bends a little more in each frame."""
+    animation = ArmatureAnimation(20)
+    for frame_number in range(FRAME_COUNT):
+        frame = ArmatureFrame()
+        rotation = Quaternion().set_from_euler(Euler('xyz', 0.001 * frame_number, 0.0, 0.002 * frame_number))
+        for i in range(JOINT_COUNT):
+            frame.joint_channels['segment_' + str(i)] = (Vector3(0.0, SEGMENT_LENGTH, 0.0), rotation)
+        animation.frames.append(frame)
+    return animation
+
+
+def get_retarget_plan(model: ArmatureModel) -> RetargetPlan:
+    m = MinecraftModelCreator()
+    m.create_bones(model)
+    return RetargetPlan(m.minecraft_model, model, None)
+
+
+def get_results(frame_evaluator: FrameEvaluator, animation: ArmatureAnimation) -> list:
+    return [([rotation.to_tuple() for rotation in minecraft_pose.rotations],
+             [None if position is None else position.to_tuple() for position in minecraft_pose.positions],
+             [translation.to_tuple() for translation in global_minecraft[0]],
+             [rotation.to_tuple() for rotation in global_minecraft[1]])
+            for minecraft_pose, global_minecraft in frame_evaluator.evaluate_animation(animation, with_global=True)]
+
+
+def test_spawn_jobs(monkeypatch):
+    model = get_chain_model()
+    animation = get_chain_animation()
+    plan = get_retarget_plan(model)
+    expected = get_results(FrameEvaluator(plan), animation)
+
+    # the number of jobs is limited to the number of CPUs
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    frame_evaluator = FrameEvaluator(plan, jobs=2, range_size=32, mp_context=multiprocessing.get_context('spawn'))
+    assert get_results(frame_evaluator, animation) == expected
+
+
+def get_bending_animation() -> ArmatureAnimation:
+    """Return an animation of a chain of 10 segments where only segment_5 moves, bending further in each frame."""
+    animation = ArmatureAnimation(20)
+    for frame_number in range(FRAME_COUNT):
+        frame = ArmatureFrame()
+        for i in range(10):
+            angle = 10.0 * frame_number if i == 5 else 1.0
+            frame.joint_channels['segment_' + str(i)] = (Vector3(0.0, SEGMENT_LENGTH, 0.0), Quaternion().set_from_euler(Euler('xyz', 0.0, 0.0, angle)))
+        animation.frames.append(frame)
+    return animation
+
+
+def test_incremental():
+    plan = get_retarget_plan(get_chain_model(10))
+    animation = get_bending_animation()
+    expected = get_results(FrameEvaluator(plan), animation)
+
+    incremental = IncrementalFK(0.0)
+    assert get_results(FrameEvaluator(plan, incremental=incremental), animation) == expected
+
+    # 11 joints and 11 bones, which are retargeted and then have their global transformation computed
+    frame_evaluations = IncrementalFK.get_frame_evaluations(plan)
+    assert frame_evaluations == 11 + 2 * 11
+    # after the first frame, only segment_5 and the 4 joints below it move, which moves the 4 bones that start from them
+    evaluated = frame_evaluations + (FRAME_COUNT - 1) * (5 + 4 + 4)
+    assert incremental.evaluated == evaluated
+    assert incremental.skipped == FRAME_COUNT * frame_evaluations - evaluated
+
+
+def test_incremental_pose_cache():
+    plan = get_retarget_plan(get_chain_model(10))
+    animation = get_bending_animation()
+    pose_cache = PoseCache(64 * 1024 * 1024)
+
+    incremental = IncrementalFK(0.0)
+    expected = get_results(FrameEvaluator(plan, pose_cache=pose_cache, incremental=incremental), animation)
+    assert pose_cache.misses == 1
+    assert 0 < incremental.evaluated < FRAME_COUNT * IncrementalFK.get_frame_evaluations(plan)
+
+    # nothing is evaluated for the poses from the cache
+    incremental = IncrementalFK(0.0)
+    assert get_results(FrameEvaluator(plan, pose_cache=pose_cache, incremental=incremental), animation) == expected
+    assert pose_cache.hits == 1
+    assert incremental.evaluated == 0
+    assert incremental.skipped == FRAME_COUNT * IncrementalFK.get_frame_evaluations(plan)
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from mcmv.import_file import BvhFileLoader
+from mcmv.math_objects import Quaternion, Euler
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# the bundled animations, loaded the same way as in config/main.json
+BVH_FILES = [
+    ('dance.bvh', 0.1, Quaternion().set_from_euler(Euler('xyz', -90.0, 0.0, 0.0))),
+    ('dino.bvh', 1.0, Quaternion().set_from_euler(Euler('xyz', 90.0, 180.0, 0.0))),
+]
+
+
+def get_channels(frame) -> dict[str, tuple[tuple[float, float, float], tuple[float, float, float, float]]]:
+    return {joint_name: (offset.to_tuple(), rotation.to_tuple()) for joint_name, (offset, rotation) in frame.joint_channels.items()}
+
+
+@pytest.mark.parametrize('file_name, scale, face_north', BVH_FILES)
+@pytest.mark.parametrize('fps, start_frame', [(20, 0), (30, 17)])
+def test_use_numpy(file_name, scale, face_north, fps, start_frame):
+    pytest.importorskip('numpy')
+    file_loader = BvhFileLoader(os.path.join(DATA_DIRECTORY, file_name), scale=scale, face_north=face_north)
+    file_loader.get_model()
+
+    animation = file_loader.get_animation(fps=fps, start_frame=start_frame)
+    numpy_animation = file_loader.get_animation(fps=fps, start_frame=start_frame, use_numpy=True)
+
+    assert len(numpy_animation.frames) == len(animation.frames) > 0
+    for frame, numpy_frame in zip(animation.frames, numpy_animation.frames):
+        assert get_channels(numpy_frame) == get_channels(frame)
+
+
+@pytest.mark.parametrize('file_name, scale, face_north', BVH_FILES)
+def test_load_use_numpy(file_name, scale, face_north):
+    pytest.importorskip('numpy')
+    file_loader = BvhFileLoader(os.path.join(DATA_DIRECTORY, file_name), scale=scale, face_north=face_north)
+
+    _, animation = file_loader.load(start_frame=5)
+    _, numpy_animation = file_loader.load(start_frame=5, use_numpy=True)
+
+    assert len(numpy_animation.frames) == len(animation.frames) > 0
+    for frame, numpy_frame in zip(animation.frames, numpy_animation.frames):
+        assert get_channels(numpy_frame) == get_channels(frame)
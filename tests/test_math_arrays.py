@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from mcmv.math_objects import Vector3, Quaternion, Euler, Vector3Array, QuaternionArray, EulerArray
+
+ORDERS = ('xyz', 'yxz', 'zxy', 'zyx', 'yzx', 'xzy')
+
+
+def get_random_quaternions(count: int) -> list[Quaternion]:
+    rng = random.Random(0)
+    return [Quaternion(rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, 1)).normalized()
+            for _ in range(count)]
+
+
+def get_locked_quaternions(order: str) -> list[Quaternion]:
+    """Return rotations of +-90 degrees around the middle axis of order, where the Euler rotation is gimbal locked."""
+    quaternions = []
+    for angle in (90.0, -90.0):
+        angles = {'x': 10.0, 'y': 20.0, 'z': 30.0}
+        angles[order[1]] = angle
+        quaternions.append(Quaternion().set_from_euler(Euler(order, angles['x'], angles['y'], angles['z'])))
+    return quaternions
+
+
+@pytest.mark.parametrize('order', ORDERS)
+def test_euler_set_from_quaternion(order):
+    quaternions = get_random_quaternions(1000) + get_locked_quaternions(order)
+    eulers = EulerArray(order).set_from_quaternion(QuaternionArray.from_quaternions(quaternions)).to_eulers()
+
+    for quaternion, euler in zip(quaternions, eulers):
+        expected = Euler(order).set_from_quaternion(quaternion)
+        assert euler.to_tuple() == expected.to_tuple()
+
+
+def test_quaternion_normalized():
+    rng = random.Random(1)
+    quaternions = [Quaternion(rng.uniform(-5, 5), rng.uniform(-5, 5), rng.uniform(-5, 5), rng.uniform(-5, 5)) for _ in range(1000)]
+    normalized = QuaternionArray.from_quaternions(quaternions).normalized().to_quaternions()
+
+    for quaternion, result in zip(quaternions, normalized):
+        assert result.to_tuple() == quaternion.normalized().to_tuple()
+
+
+def test_vector_magnitude():
+    rng = random.Random(2)
+    vectors = [Vector3(rng.uniform(-5, 5), rng.uniform(-5, 5), rng.uniform(-5, 5)) for _ in range(1000)]
+    magnitudes = Vector3Array.from_vectors(vectors).magnitude().tolist()
+
+    assert magnitudes == [vector.magnitude() for vector in vectors]
+    assert Vector3Array([[3.0, 4.0, 12.0]]).magnitude()[0] == 13.0
@@ -0,0 +1,81 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from mcmv.armature_objects import ArmatureFrameArray
+from mcmv.quantized_animation import QuantizedFrameArray
+
+FRAME_COUNT = 300
+JOINT_COUNT = 20
+
+
+def get_frames(frame_count: int = FRAME_COUNT) -> ArmatureFrameArray:
+    """Return random frames where the first joint never moves and the second never rotates, so that constant
+    channels are stored too."""
+    rng = np.random.default_rng(0)
+    values = np.empty((frame_count, JOINT_COUNT, 7))
+    values[..., 0:3] = rng.uniform(-2.0, 2.0, (frame_count, JOINT_COUNT, 3))
+    rotations = rng.normal(size=(frame_count, JOINT_COUNT, 4))
+    values[..., 3:7] = rotations / np.linalg.norm(rotations, axis=-1, keepdims=True)
+
+    if frame_count > 0:
+        values[:, 0] = values[0, 0]
+        values[:, 1, 3:7] = values[0, 1, 3:7]
+    return ArmatureFrameArray(['joint_' + str(i) for i in range(JOINT_COUNT)], values)
+
+
+def get_rotation_errors(values: np.ndarray, quantized_values: np.ndarray) -> np.ndarray:
+    """Return the largest error in any component of each rotation, where q and -q are the same rotation."""
+    rotations = values[..., 3:7]
+    quantized_rotations = quantized_values[..., 3:7]
+    return np.minimum(np.abs(quantized_rotations - rotations).max(axis=-1), np.abs(quantized_rotations + rotations).max(axis=-1))
+
+
+@pytest.mark.parametrize('tolerance', [0.0001, 0.001])
+def test_round_trip(tolerance):
+    frames = get_frames()
+    quantized_frames = QuantizedFrameArray.from_frames(frames, tolerance, tolerance, block_size=64)
+    quantized_values = quantized_frames.get_values()
+
+    assert len(quantized_frames) == FRAME_COUNT
+    assert quantized_frames.channel_names == frames.channel_names
+    assert quantized_frames.nbytes < frames.values.nbytes
+    # the tolerances are for each channel, as it is stored
+    assert np.abs(quantized_values[..., 0:3] - frames.values[..., 0:3]).max() <= tolerance
+    assert get_rotation_errors(frames.values, quantized_values).max() <= tolerance
+    assert quantized_frames.position_error <= tolerance
+    assert quantized_frames.rotation_error <= tolerance
+
+    # every way of reading the frames gives the same values
+    assert np.array_equal(np.stack([frame.values for frame in quantized_frames]), quantized_values)
+    assert np.array_equal(quantized_frames[-1].values, quantized_values[-1])
+    assert np.array_equal(quantized_frames[100:200].get_values(), quantized_values[100:200])
+    assert np.array_equal(quantized_frames.get_values(150, 170), quantized_values[150:170])
+
+
+def test_round_trip_no_frames():
+    quantized_frames = QuantizedFrameArray.from_frames(get_frames(0))
+
+    assert len(quantized_frames) == 0
+    assert quantized_frames.get_values().shape == (0, JOINT_COUNT, 7)
+
+
+def test_position_tolerance_too_small():
+    frames = get_frames()
+    frames.values[..., 0:3] *= 1000000.0
+
+    with pytest.raises(Exception, match='position_tolerance'):
+        QuantizedFrameArray.from_frames(frames, 0.000001, 0.0001)
+
+
+def test_rotation_tolerance_too_small():
+    with pytest.raises(Exception, match='rotation_tolerance'):
+        QuantizedFrameArray.from_frames(get_frames(), 0.0001, 0.000001)
+
+
+def test_rotation_not_unit_quaternion():
+    frames = get_frames()
+    frames.values[..., 3:7] *= 1.1
+
+    with pytest.raises(Exception, match='unit quaternions'):
+        QuantizedFrameArray.from_frames(frames, 0.0001, 0.0001)